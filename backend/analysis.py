@@ -0,0 +1,90 @@
+"""Per-image model analysis shared by the Flask app (/analyze, /analyze/batch) and worker.py.
+
+Both queue the prepared inputs on micro-batchers (local ones or the model server's)
+and apply the same cascade policy, so an image gets the same classification, mask
+and stages whichever way it comes in.
+"""
+from concurrent.futures import Future
+
+import numpy as np
+
+from inference import SEGMENTATION_INPUT_SHAPE
+
+
+def _chain(source, target):
+    if source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.timings = getattr(source, 'timings', None)
+        target.set_result(source.result())
+
+
+def add_model_timings(timer, name, future):
+    """Copy the batcher's queue-wait and predict times for one request into its timer."""
+    timings = getattr(future, 'timings', None)
+    if timings:
+        timer.timings[f'{name}_queue_wait'] = timings['queue_wait']
+        timer.timings[f'{name}_predict'] = timings['predict']
+
+
+def submit_models(prepared, segmentation_batcher, classification_batcher, cascade):
+    """Queue an image on both batchers; returns (mask_future, pred_future).
+
+    In cascade mode segmentation is only queued once the classification result is
+    in, and the mask future resolves to None when the cascade skips it.
+    """
+    pred_future = classification_batcher.submit_async(prepared.classification)
+    if not cascade.enabled:
+        return segmentation_batcher.submit_async(prepared.segmentation), pred_future
+
+    mask_future = Future()
+
+    def on_classified(future):
+        try:
+            if cascade.needs_segmentation(future.result()):
+                segmentation_batcher.submit_async(prepared.segmentation).add_done_callback(
+                    lambda f: _chain(f, mask_future)
+                )
+            else:
+                mask_future.set_result(None)
+        except Exception as e:
+            mask_future.set_exception(e)
+
+    pred_future.add_done_callback(on_classified)
+    return mask_future, pred_future
+
+
+def model_fields(mask, pred, cascade, class_names, mask_shape=SEGMENTATION_INPUT_SHAPE):
+    """(fields, mask): the classification, stages and skip flag, and the mask thresholded to uint8 0/255.
+
+    A mask of None means the cascade skipped segmentation; an empty mask of
+    ``mask_shape`` is reported instead. The cascade decision is recorded.
+    """
+    segmented = mask is not None
+    cascade.record(segmented)
+    if not segmented:
+        mask = np.zeros(mask_shape, dtype=np.float32)
+    class_idx = int(np.argmax(pred))
+    fields = {
+        'classification': {
+            'class': class_names[class_idx],
+            'confidence': float(pred[class_idx])
+        },
+        'stages': cascade.stages(segmented),
+        'segmentation_skipped': not segmented
+    }
+    return fields, (mask > 0.5).astype(np.uint8) * 255
+
+
+def collect(mask_future, pred_future, cascade, class_names, timer):
+    """``model_fields()`` once both futures from ``submit_models()`` resolve, with their timings in ``timer``."""
+    mask, pred = mask_future.result(), pred_future.result()
+    add_model_timings(timer, 'segmentation', mask_future)
+    add_model_timings(timer, 'classification', pred_future)
+    return model_fields(mask, pred, cascade, class_names)
+
+
+def analyze_prepared(prepared, segmentation_batcher, classification_batcher, cascade, class_names, timer):
+    """Run one prepared image through both models, batched with other requests in flight."""
+    mask_future, pred_future = submit_models(prepared, segmentation_batcher, classification_batcher, cascade)
+    return collect(mask_future, pred_future, cascade, class_names, timer)
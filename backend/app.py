@@ -1,22 +1,87 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Request, Response, g, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
 import os
 import numpy as np
-from tensorflow.keras.models import load_model
-from PIL import Image
-import tensorflow.keras.backend as K
-import tensorflow as tf
+from PIL import Image, UnidentifiedImageError
 import base64
 import io
+import atexit
+import shutil
+import threading
 import traceback
 import time
-from datetime import datetime
+import mimetypes
+from datetime import datetime, timezone
 from werkzeug.utils import secure_filename
-from openai import OpenAI
+from werkzeug.security import safe_join
 import json
+import sqlite3
 from dotenv import load_dotenv
+from batching import MicroBatcher
+from model_server import ModelClient
+from result_cache import ResultCache
+from inference import warmup_batch_sizes
+from runtime import INFERENCE_BACKENDS, load_runner
+from registry import ModelRegistry
+from autotune import DEFAULT_PROFILE_PATH, TUNING_TARGETS, load_profile
+from preprocessing import PREPROCESSING_STAGES, StageTimer, full_resolution_gray, prepare
+from uploads import SpooledUpload, chunked, iter_upload_items
+from mask_encoding import decode_png, encode_mask, negotiate_format
+from artifacts import THUMBNAIL_SIZES, ArtifactWriter, content_etag, thumbnail
+from store import RecordStore, utc_now
+from cascade import CascadePolicy
+from analysis import add_model_timings, analyze_prepared, collect, model_fields, submit_models
+from tiling import segment_tiled
+from tta import TTA_VIEW_COUNTS, predict_classification, predict_segmentation, summarize
+from volumes import VOLUME_EXTENSIONS, analyze_spooled, is_volume_name, spool_upload
+from metrics import CONTENT_TYPE, Registry, observe_stages
+from jobs import LANES, JobQueue, JobWorkers
+from chat import ChatCache, build_chat_messages, build_messages, make_client, sse_event, stream_reply
+
+# Load environment variables
+load_dotenv()
+
+# Inference runtime: 'keras' loads the .h5 models with TensorFlow, 'tflite' runs the
+# files written by export_models.py and doesn't need TensorFlow at all
+INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'keras').lower()
+TFLITE_QUANTIZATION = os.getenv('TFLITE_QUANTIZATION', 'none').lower()
+if INFERENCE_BACKEND not in INFERENCE_BACKENDS:
+    print(f"Unknown INFERENCE_BACKEND {INFERENCE_BACKEND!r}, falling back to 'keras'")
+    INFERENCE_BACKEND = 'keras'
+
+# Thread pools and batch size measured by `python autotune.py` for this machine;
+# TUNING_TARGET picks the 'latency' or 'throughput' settings and env vars still win
+TUNING_PROFILE = os.getenv('TUNING_PROFILE', DEFAULT_PROFILE_PATH)
+TUNING_TARGET = os.getenv('TUNING_TARGET', 'latency').lower()
+if TUNING_TARGET not in TUNING_TARGETS:
+    print(f"Unknown TUNING_TARGET {TUNING_TARGET!r}, falling back to 'latency'")
+    TUNING_TARGET = 'latency'
+tuning = load_profile(TUNING_PROFILE, TUNING_TARGET, backend=INFERENCE_BACKEND)
+INTRA_OP_THREADS = int(os.getenv('INTRA_OP_THREADS', tuning.get('intra_op_threads') or 0))
+INTER_OP_THREADS = int(os.getenv('INTER_OP_THREADS', tuning.get('inter_op_threads') or 0))
+
+# With MODEL_SERVER_SOCKET set, the models and micro-batchers live in one shared
+# model_server.py process and this worker only preprocesses and postprocesses
+MODEL_SERVER_SOCKET = os.getenv('MODEL_SERVER_SOCKET')
+MODEL_SERVER_WAIT_S = float(os.getenv('MODEL_SERVER_WAIT_S', '60'))
+
+# Batches (many images or an archive of slices) and volumes (NIfTI / DICOM series)
+# get their own, larger upload limits; Werkzeug spools big uploads to temporary
+# files rather than memory
+BATCH_MAX_MB = int(os.getenv('BATCH_MAX_MB', '1024'))
+VOLUME_MAX_MB = int(os.getenv('VOLUME_MAX_MB', '1024'))
+
+class UploadRequest(Request):
+    @property
+    def max_content_length(self):
+        if self.path == '/analyze/batch':
+            return BATCH_MAX_MB * 1024 * 1024
+        if self.path == '/analyze/volume':
+            return VOLUME_MAX_MB * 1024 * 1024
+        return super().max_content_length
 
 app = Flask(__name__)
+app.request_class = UploadRequest
 # Configure maximum content length to 16MB
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 
@@ -29,33 +94,6 @@ CORS(app, resources={
     }
 })
 
-# Define custom metrics and loss functions
-def dice_coefficient(y_true, y_pred, smooth=1e-6):
-    y_true_f = K.flatten(y_true)
-    y_pred_f = K.flatten(y_pred)
-    intersection = K.sum(y_true_f * y_pred_f)
-    return (2. * intersection + smooth) / (K.sum(y_true_f) + K.sum(y_pred_f) + smooth)
-
-def dice_loss(y_true, y_pred):
-    return 1 - dice_coefficient(y_true, y_pred)
-
-def bce_dice_loss(y_true, y_pred):
-    return tf.keras.losses.binary_crossentropy(y_true, y_pred) + dice_loss(y_true, y_pred)
-
-def iou_metric(y_true, y_pred, smooth=1e-6):
-    intersection = K.sum(K.abs(y_true * y_pred))
-    union = K.sum(y_true) + K.sum(y_pred) - intersection
-    return (intersection + smooth) / (union + smooth)
-
-# Register custom objects
-custom_objects = {
-    'dice_coefficient': dice_coefficient,
-    'dice_loss': dice_loss,
-    'bce_dice_loss': bce_dice_loss,
-    'iou_metric': iou_metric,
-    'binary_crossentropy': tf.keras.losses.binary_crossentropy
-}
-
 # Get the absolute path to the models directory
 current_dir = os.path.dirname(os.path.abspath(__file__))
 models_dir = os.path.join(current_dir, 'models')
@@ -71,106 +109,404 @@ print(f"Classification model path: {CLASSIFICATION_MODEL_PATH}")
 # Create models directory if it doesn't exist
 os.makedirs(models_dir, exist_ok=True)
 
-# Load models
-segmentation_model = None
-classification_model = None
+# Micro-batching: concurrent /analyze requests share one forward pass per model
+BATCH_MAX_SIZE = int(os.getenv('BATCH_MAX_SIZE', tuning.get('batch_size') or 8))
+BATCH_MAX_WAIT_MS = float(os.getenv('BATCH_MAX_WAIT_MS', '10'))
 
-try:
-    if not os.path.exists(SEGMENTATION_MODEL_PATH):
-        print(f"Error: Segmentation model not found at {SEGMENTATION_MODEL_PATH}")
-    else:
-        print("Loading segmentation model...")
-        tf.keras.utils.get_custom_objects().update(custom_objects)
-        segmentation_model = load_model(SEGMENTATION_MODEL_PATH, compile=False)
-        segmentation_model.compile(
-            optimizer='adam',
-            loss=bce_dice_loss,
-            metrics=[dice_coefficient, iou_metric]
-        )
-        print("Segmentation model loaded successfully")
-        print(f"Segmentation model input shape: {segmentation_model.input_shape}")
+# Models are loaded (TensorFlow import included) and warmed up on a background thread,
+# so the server answers /healthz straight away and /readyz once every model is warm.
+# Every batch size the batcher can produce is warmed up, so the first scan after a
+# deploy doesn't pay graph tracing. POST /models/<name>/reload hot-swaps a new file.
+MODELS_RETRY_AFTER_S = 5
+model_client = None
+if MODEL_SERVER_SOCKET:
+    print(f"Using the shared model server at {MODEL_SERVER_SOCKET}")
+    model_client = ModelClient(MODEL_SERVER_SOCKET)
 
-    if not os.path.exists(CLASSIFICATION_MODEL_PATH):
-        print(f"Error: Classification model not found at {CLASSIFICATION_MODEL_PATH}")
-    else:
-        print("Loading classification model...")
-        classification_model = load_model(CLASSIFICATION_MODEL_PATH)
-        print("Classification model loaded successfully")
-        print(f"Classification model input shape: {classification_model.input_shape}")
+def load_model_runner(name, path):
+    if model_client is not None:
+        # The model server loads its own files; wait for it to come up
+        model_client.wait_ready(MODEL_SERVER_WAIT_S)
+        return model_client.runner(name)
+    return load_runner(INFERENCE_BACKEND, name, path, TFLITE_QUANTIZATION,
+                       num_threads=INTRA_OP_THREADS or None, inter_op_threads=INTER_OP_THREADS or None)
 
-except Exception as e:
-    print(f"Error loading models: {str(e)}")
-    print(traceback.format_exc())
+model_registry = ModelRegistry(load_model_runner, warmup_sizes=warmup_batch_sizes(BATCH_MAX_SIZE))
+model_registry.register('segmentation', SEGMENTATION_MODEL_PATH)
+model_registry.register('classification', CLASSIFICATION_MODEL_PATH)
 
 # Class names for classification
 class_names = ['Glioma', 'Meningioma', 'Pituitary', 'No Tumour']
 
+if model_client is not None:
+    # Batching happens in the model server, across the requests of every worker
+    segmentation_batcher = model_client.batcher('segmentation')
+    classification_batcher = model_client.batcher('classification')
+else:
+    # The batchers call whichever model version is serving, so a hot swap needs no new batcher
+    segmentation_batcher = MicroBatcher(
+        model_registry.predictor('segmentation'),
+        max_batch_size=BATCH_MAX_SIZE,
+        max_wait_ms=BATCH_MAX_WAIT_MS,
+        name='segmentation'
+    )
+    classification_batcher = MicroBatcher(
+        model_registry.predictor('classification'),
+        max_batch_size=BATCH_MAX_SIZE,
+        max_wait_ms=BATCH_MAX_WAIT_MS,
+        name='classification'
+    )
+print(f"Micro-batching enabled: max_batch_size={BATCH_MAX_SIZE}, max_wait_ms={BATCH_MAX_WAIT_MS}")
+
+# Cascade mode: classify first and only segment tumors or uncertain 'No Tumour' calls
+CASCADE_MODE = os.getenv('CASCADE_MODE', '0') == '1'
+CASCADE_THRESHOLD = float(os.getenv('CASCADE_THRESHOLD', '0.9'))
+cascade = CascadePolicy(class_names, enabled=CASCADE_MODE, threshold=CASCADE_THRESHOLD)
+# ?resolution=full segments the original image in overlapping 128px tiles instead
+# of a 128px downscale; SEGMENTATION_RESOLUTION sets the default
+SEGMENTATION_RESOLUTIONS = ('model', 'full')
+SEGMENTATION_RESOLUTION = os.getenv('SEGMENTATION_RESOLUTION', 'model').lower()
+TILE_OVERLAP = int(os.getenv('TILE_OVERLAP', '32'))
+MAX_TILES = int(os.getenv('MAX_TILES', '64'))
+TILE_BATCH_SIZE = int(os.getenv('TILE_BATCH_SIZE', '32'))
+
+# Test-time augmentation: ?tta=4|8 runs that many flipped/shifted views in one
+# batched pass per model; TTA_VIEWS sets the default (1 = off)
+TTA_VIEWS = int(os.getenv('TTA_VIEWS', '1'))
+
+# Slices per forward pass when analyzing NIfTI volumes and DICOM series
+VOLUME_BATCH_SIZE = int(os.getenv('VOLUME_BATCH_SIZE', '16'))
+
+if CASCADE_MODE:
+    print(f"Cascade mode enabled: segmentation skipped for 'No Tumour' at confidence >= {CASCADE_THRESHOLD}")
+
 # Create data directories
-DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+DATA_DIR = os.getenv('DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data'))
 UPLOADS_DIR = os.path.join(DATA_DIR, 'uploads')
 MASKS_DIR = os.path.join(DATA_DIR, 'masks')
 PATIENTS_JSON = os.path.join(DATA_DIR, 'patients.json')
 SCANS_JSON = os.path.join(DATA_DIR, 'scans.json')
+RECORDS_DB = os.path.join(DATA_DIR, 'records.sqlite3')
 
 # Ensure directories exist
 os.makedirs(DATA_DIR, exist_ok=True)
 os.makedirs(UPLOADS_DIR, exist_ok=True)
 os.makedirs(MASKS_DIR, exist_ok=True)
-if not os.path.exists(PATIENTS_JSON):
-    with open(PATIENTS_JSON, 'w') as f:
-        json.dump([], f)
-if not os.path.exists(SCANS_JSON):
-    with open(SCANS_JSON, 'w') as f:
-        json.dump([], f)
-
-def read_json_list(path):
-    try:
-        with open(path, 'r') as f:
-            return json.load(f)
-    except Exception:
-        return []
 
-def write_json_list(path, data_list):
-    with open(path, 'w') as f:
-        json.dump(data_list, f)
+# Patients and scans live in SQLite; legacy JSON lists are imported once on startup
+record_store = RecordStore(RECORDS_DB)
+migrated = record_store.migrate_json(PATIENTS_JSON, SCANS_JSON)
+if migrated:
+    print(f"Migrated JSON records into {RECORDS_DB}: {migrated}")
+
+PAGE_SIZE_MAX = 500
+
+# Content-addressed result cache: re-uploads of the same image skip inference
+RESULT_CACHE_MAX_MB = float(os.getenv('RESULT_CACHE_MAX_MB', '64'))
+RESULT_CACHE_DISK = os.getenv('RESULT_CACHE_DISK', '0') == '1'
+CACHE_DIR = os.path.join(DATA_DIR, 'cache')
+THUMBS_DIR = os.path.join(DATA_DIR, 'thumbs')
+# Only these subtrees of DATA_DIR are served; databases and the result cache stay private
+SERVED_DATA_DIRS = ('uploads', 'masks', 'thumbs')
+
+# Artifacts are returned as /data/ URLs; INLINE_IMAGES=1 restores the base64 imageUrl
+INLINE_IMAGES = os.getenv('INLINE_IMAGES', '0') == '1'
+ARTIFACT_MAX_AGE = 365 * 24 * 3600
+
+# Prometheus metrics, served as text on /metrics
+metrics = Registry(prefix='brain_tumor_')
+stage_seconds = metrics.histogram(
+    'stage_seconds', 'Time spent in each analysis pipeline stage.', ('endpoint', 'stage')
+)
+request_seconds = metrics.histogram(
+    'request_seconds', 'Time to produce the response (first byte for streaming endpoints).', ('endpoint',)
+)
+requests_total = metrics.counter('requests_total', 'HTTP requests handled.', ('endpoint', 'method', 'status'))
+metrics.gauge('batch_queue_depth', 'Samples waiting in each micro-batcher.', lambda: {
+    name: batcher.stats()['queue_depth']
+    for name, batcher in (('segmentation', segmentation_batcher), ('classification', classification_batcher))
+    if batcher is not None
+}, labelname='model')
+metrics.gauge('artifact_queue_depth', 'Artifacts waiting to be written to disk.',
+              lambda: artifact_writer.stats()['queue_depth'])
+metrics.callback_counter('result_cache_hits_total', 'Result cache hits.', lambda: result_cache.stats()['hits'])
+metrics.callback_counter('result_cache_misses_total', 'Result cache misses.', lambda: result_cache.stats()['misses'])
+metrics.callback_counter('cascade_segmentation_skipped_total', 'Scans whose segmentation the cascade skipped.',
+                         lambda: cascade.stats()['segmentation_skipped'])
+metrics.gauge('models_ready', '1 once both models are loaded and warmed up.', lambda: int(model_registry.ready()))
+metrics.gauge('model_load_seconds', 'Time to load the serving version of each model.', lambda: {
+    name: model['load_seconds'] for name, model in model_registry.status().items() if model['load_seconds'] is not None
+}, labelname='model')
+
+# Originals and masks are written to disk after the response by a background writer
+ARTIFACT_WRITE_QUEUE = int(os.getenv('ARTIFACT_WRITE_QUEUE', '256'))
+artifact_writer = ArtifactWriter(
+    max_pending=ARTIFACT_WRITE_QUEUE,
+    on_write=lambda seconds: stage_seconds.observe(seconds, endpoint='background', stage='disk_write')
+)
+atexit.register(artifact_writer.close)
+
+# Asynchronous analysis: POST /jobs queues an upload in SQLite, workers drain it by priority lane
+JOBS_DB = os.path.join(DATA_DIR, 'jobs.sqlite3')
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+JOB_WAIT_MAX_S = float(os.getenv('JOB_WAIT_MAX_S', '30'))
+JOB_RETENTION_HOURS = float(os.getenv('JOB_RETENTION_HOURS', '24'))
+job_queue = JobQueue(JOBS_DB)
+job_wait_seconds = metrics.histogram(
+    'job_wait_seconds', 'Time analysis jobs spent queued before a worker took them.', ('lane',)
+)
+job_run_seconds = metrics.histogram(
+    'job_run_seconds', 'Time workers spent processing analysis jobs.', ('lane', 'status')
+)
+metrics.gauge('job_queue_depth', 'Analysis jobs waiting per priority lane.', job_queue.depth, labelname='lane')
+job_workers = None
+
+def model_versions():
+    """What cached results are keyed on; a hot-swapped model gets a new version."""
+    versions = {'backend': INFERENCE_BACKEND}
+    if CASCADE_MODE:
+        versions['cascade'] = CASCADE_THRESHOLD
+    for name in ('segmentation', 'classification'):
+        version = model_registry.version(name)
+        if version:
+            versions[name] = version
+    return versions
+
+result_cache = ResultCache(
+    max_bytes=RESULT_CACHE_MAX_MB * 1024 * 1024,
+    disk_dir=CACHE_DIR if RESULT_CACHE_DISK else None
+)
 
-# Load environment variables
-load_dotenv()
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
-client = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
+# Point at a compatible server, e.g. the local stub from `python chat.py --stub-server`
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL')
+CHAT_TIMEOUT = float(os.getenv('CHAT_TIMEOUT', '30'))
+CHAT_MAX_CONNECTIONS = int(os.getenv('CHAT_MAX_CONNECTIONS', '20'))
+CHAT_CACHE_TTL = float(os.getenv('CHAT_CACHE_TTL', '600'))
+CHAT_CACHE_SIZE = int(os.getenv('CHAT_CACHE_SIZE', '1024'))
+_chat_client = None
+_chat_client_lock = threading.Lock()
+chat_cache = ChatCache(ttl=CHAT_CACHE_TTL, max_entries=CHAT_CACHE_SIZE)
+chat_seconds = metrics.histogram(
+    'chat_seconds', 'Chat latency to the first token and to the full reply.', ('stage', 'cached')
+)
+metrics.callback_counter('chat_cache_hits_total', 'Chat answer cache hits.', lambda: chat_cache.stats()['hits'])
+metrics.callback_counter('chat_cache_misses_total', 'Chat answer cache misses.', lambda: chat_cache.stats()['misses'])
+
+def chat_client():
+    """One pooled client for the whole process, created on first use so startup doesn't import openai."""
+    global _chat_client
+    if _chat_client is None and OPENAI_API_KEY:
+        with _chat_client_lock:
+            if _chat_client is None:
+                _chat_client = make_client(
+                    OPENAI_API_KEY, OPENAI_BASE_URL, timeout=CHAT_TIMEOUT, max_connections=CHAT_MAX_CONNECTIONS
+                )
+    return _chat_client
 
 def get_ai_response(message, scan_details=None):
     try:
+        client = chat_client()
         if not client:
             return "AI chat functionality is not available (API key missing)"
-            
-        system_prompt = """You are a helpful medical imaging AI assistant. You help users understand their brain scan analysis 
-        results and provide general information about brain tumors. Always be professional, empathetic, and clear in your responses. 
-        Do not make definitive medical diagnoses - always remind users to consult healthcare professionals for medical advice."""
-        
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": message}
-        ]
-        
-        if scan_details:
-            messages.insert(1, {
-                "role": "system",
-                "content": f"Recent scan analysis shows: {json.dumps(scan_details)}"
-            })
 
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=messages,
-            max_tokens=150,
-            temperature=0.7
-        )
-        
-        return response.choices[0].message.content
+        messages = build_messages(message, scan_details)
+        key = ChatCache.make_key(messages)
+        answer = chat_cache.get(key)
+        if answer is None:
+            answer = ''.join(stream_reply(client, messages))
+            chat_cache.put(key, answer)
+        return answer
     except Exception as e:
         print(f"Error getting AI response: {str(e)}")
         return "I apologize, but I'm having trouble processing your request right now. Please try again later."
 
+def response_timings(timer, started):
+    timings = timer.as_dict()
+    timings['total'] = round((time.perf_counter() - started) * 1000.0, 3)
+    return timings
+
+def segment_full_resolution(prepared, pred, timer):
+    """Tiled full-resolution mask, or (None, None) when the cascade skips segmentation."""
+    if not cascade.needs_segmentation(pred):
+        return None, None
+    gray = full_resolution_gray(prepared, timer)
+    with timer.stage('tiled_segmentation'):
+        mask, tiling = segment_tiled(
+            gray, model_registry.get('segmentation'), overlap=TILE_OVERLAP, max_tiles=MAX_TILES, batch_size=TILE_BATCH_SIZE
+        )
+    return mask, tiling
+
+def build_result(prepared, fields, mask, timer):
+    """Queue the original and the 0/255 mask for storage and build the analysis response fields.
+
+    ``fields`` and ``mask`` come from ``model_fields()``. Both files are named by
+    their content hash, so re-uploads map to the same paths and URLs and nothing is
+    ever overwritten. They are written after the response by ``artifact_writer``.
+    """
+    original_jpeg = prepared.jpeg_bytes(timer)
+    with timer.stage('disk_write'):
+        original_path = artifact_writer.submit(UPLOADS_DIR, original_jpeg, 'jpg')
+
+    # Encode the mask as PNG once, for the file and the inline base64
+    with timer.stage('mask_encode'):
+        buffer = io.BytesIO()
+        Image.fromarray(mask.squeeze(), mode='L').save(buffer, format='PNG')
+        mask_base64 = base64.b64encode(buffer.getvalue()).decode()
+    with timer.stage('disk_write'):
+        mask_path = artifact_writer.submit(MASKS_DIR, buffer.getvalue(), 'png')
+
+    return dict(
+        fields,
+        segmentation_mask=mask_base64,
+        originalPath=original_path,
+        maskPath=mask_path
+    )
+
+def artifact_url(path, host_url=None):
+    # Job workers run outside any request, so they pass the host URL the job was submitted to
+    relative = os.path.relpath(path, DATA_DIR).replace(os.sep, '/')
+    return f"{host_url or request.host_url}data/{relative}"
+
+def add_artifact_urls(result, host_url=None):
+    """Point imageUrl/maskUrl at the stored artifacts instead of inlining the image bytes."""
+    if INLINE_IMAGES:
+        artifact_writer.wait_for(result['originalPath'])
+        with open(result['originalPath'], 'rb') as f:
+            result['imageUrl'] = f"data:image/jpeg;base64,{base64.b64encode(f.read()).decode()}"
+    else:
+        result['imageUrl'] = artifact_url(result['originalPath'], host_url)
+    result['maskUrl'] = artifact_url(result['maskPath'], host_url)
+    return result
+
+def apply_mask_format(result, mask_format, mask=None, timer=None):
+    """Re-encode a result's PNG segmentation_mask in the format the client asked for."""
+    if mask_format != 'png':
+        with (timer or StageTimer()).stage('mask_encode'):
+            binary = (mask > 127) if mask is not None else decode_png(result['segmentation_mask'])
+            result['segmentation_mask'] = encode_mask(binary, mask_format)
+    result['mask_format'] = mask_format
+    return result
+
+def record_scan(result, patient_id, started):
+    """Append a scan record for ``patient_id``; a single INSERT, never a file rewrite."""
+    if not patient_id:
+        return None
+    classification = result['classification']
+    scan = record_store.add_scan({
+        'patientId': patient_id,
+        'tumorType': classification['class'],
+        'confidence': classification['confidence'],
+        'hasTumor': classification['class'] != 'No Tumour',
+        'processingTime': round(time.perf_counter() - started, 4),
+        'originalPath': result['originalPath'],
+        'maskPath': result['maskPath']
+    })
+    result['scanId'] = scan['id']
+    return scan
+
+def page_args():
+    limit = min(max(int(request.args.get('limit', 50)), 1), PAGE_SIZE_MAX)
+    return limit, request.args.get('cursor')
+
+def analysis_options(args, accept=None):
+    """(mask_format, resolution, tta_views) from /analyze-style query args; raises ValueError."""
+    mask_format = negotiate_format(args.get('mask_format'), accept, 'png')
+    resolution = args.get('resolution', SEGMENTATION_RESOLUTION).lower()
+    if resolution not in SEGMENTATION_RESOLUTIONS:
+        raise ValueError(f"Unknown resolution {resolution!r}, expected one of {SEGMENTATION_RESOLUTIONS}")
+    tta_views = args.get('tta', TTA_VIEWS, type=int)
+    if tta_views not in TTA_VIEW_COUNTS:
+        raise ValueError(f"tta must be one of {TTA_VIEW_COUNTS}")
+    if tta_views > 1 and resolution == 'full':
+        raise ValueError('tta is not supported with resolution=full')
+    return mask_format, resolution, tta_views
+
+def analyze_image(image_bytes, mask_format, resolution, tta_views, patient_id, timer, started, endpoint='analyze',
+                  host_url=None):
+    """The full /analyze pipeline for one upload: cache lookup, models, artifacts and the scan record.
+
+    ``host_url`` prefixes the artifact URLs; it defaults to the current request's.
+    """
+    versions = model_versions()
+    if resolution != 'model':
+        versions['resolution'] = resolution
+    if tta_views > 1:
+        versions['tta'] = tta_views
+    with timer.stage('cache_lookup'):
+        cache_key = ResultCache.make_key(image_bytes, versions)
+        cached = result_cache.get(cache_key)
+    if cached is not None:
+        print(f"Result cache hit for {cache_key[:12]}")
+        cached['cached'] = True
+        apply_mask_format(add_artifact_urls(cached, host_url), mask_format, timer=timer)
+        cached['timings'] = response_timings(timer, started)
+        cached['processingTime'] = cached['timings']['total'] / 1000.0
+        observe_stages(stage_seconds, cached['timings'], endpoint=endpoint)
+        record_scan(cached, patient_id, started)
+        return cached
+
+    # Decode once and build both float32 model inputs from a shared intermediate
+    prepared = prepare(image_bytes, timer)
+
+    if resolution == 'full':
+        # Classify at model resolution, then segment the original in batched tiles
+        pred_future = classification_batcher.submit_async(prepared.classification)
+        pred = pred_future.result()
+        add_model_timings(timer, 'classification', pred_future)
+        full_mask, tiling = segment_full_resolution(prepared, pred, timer)
+        width, height = prepared.original_size
+        fields, mask = model_fields(full_mask, pred, cascade, class_names, mask_shape=(height, width))
+        response_data = build_result(prepared, fields, mask, timer)
+        response_data['tiling'] = tiling
+    elif tta_views > 1:
+        # All views in one forward pass per model, straight to the runners. The cascade
+        # decides on the view-averaged classification whether to segment at all.
+        with timer.stage('tta_predict'):
+            probs = predict_classification(model_registry.get('classification'), prepared.classification[None], tta_views)
+            masks = None
+            if cascade.needs_segmentation(probs.mean(axis=0)[0]):
+                masks = predict_segmentation(model_registry.get('segmentation'), prepared.segmentation[None], tta_views)
+        mean_mask, mean_probs, reports = summarize(masks, probs)
+        fields, mask = model_fields(None if mean_mask is None else mean_mask[0], mean_probs[0], cascade, class_names)
+        response_data = build_result(prepared, fields, mask, timer)
+        response_data['tta'] = reports[0]
+    else:
+        # Run the models (batched with other in-flight requests)
+        fields, mask = analyze_prepared(
+            prepared, segmentation_batcher, classification_batcher, cascade, class_names, timer
+        )
+        response_data = build_result(prepared, fields, mask, timer)
+    response_data['resolution'] = resolution
+    response_data['error'] = None
+
+    result_cache.put(cache_key, response_data)
+    response_data['cached'] = False
+    response_data['preprocessing_ms'] = timer.as_dict(PREPROCESSING_STAGES)
+    add_artifact_urls(response_data, host_url)
+    apply_mask_format(response_data, mask_format, mask, timer)
+    response_data['timings'] = response_timings(timer, started)
+    response_data['processingTime'] = response_data['timings']['total'] / 1000.0
+    observe_stages(stage_seconds, response_data['timings'], endpoint=endpoint)
+    record_scan(response_data, patient_id, started)
+    return response_data
+
+def models_unavailable():
+    """A 503 response while the models are loading or failed to load, otherwise None."""
+    if model_registry.ready():
+        return None
+    failed = model_registry.failed()
+    if failed:
+        error = 'Models failed to load: ' + '; '.join(f"{name}: {error}" for name, error in failed.items())
+    else:
+        error = 'Models are still loading, please retry shortly'
+    print(error)
+    response = jsonify({'error': error, 'models': model_registry.status()})
+    response.status_code = 503
+    if not failed:
+        response.headers['Retry-After'] = str(MODELS_RETRY_AFTER_S)
+    return response
+
 @app.route('/analyze', methods=['POST', 'OPTIONS'])
 def analyze():
     if request.method == 'OPTIONS':
@@ -182,15 +518,9 @@ def analyze():
         
     print("Received analyze request")
     
-    if not TF_AVAILABLE:
-        error_msg = "ML inference unavailable: TensorFlow failed to load. Install a compatible TensorFlow (e.g., 'pip install tensorflow-cpu') and required system dependencies."
-        print(error_msg)
-        return jsonify({'error': error_msg}), 503
-
-    if segmentation_model is None or classification_model is None:
-        error_msg = "Models not loaded. Please ensure model files are present in the models directory."
-        print(error_msg)
-        return jsonify({'error': error_msg}), 500
+    unavailable = models_unavailable()
+    if unavailable is not None:
+        return unavailable
 
     try:
         if 'file' not in request.files:
@@ -200,74 +530,245 @@ def analyze():
         if file.filename == '':
             return jsonify({'error': 'No file selected'}), 400
 
-        # Read and process the image
-        image_bytes = file.read()
-        image = Image.open(io.BytesIO(image_bytes))
-
-        # Generate filename and save
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        base_filename = f"{timestamp}_scan.jpg"
-        original_path = os.path.join(UPLOADS_DIR, base_filename)
-        image.save(original_path)
-
-        # Convert to RGB if needed
-        if image.mode not in ['RGB', 'L']:
-            image = image.convert('RGB')
-            
-        # Preprocess for segmentation
-        image_seg = image.resize((128, 128)).convert('L')  # Convert to grayscale
-        img_array_seg = np.array(image_seg) / 255.0
-        img_array_seg = np.expand_dims(img_array_seg, axis=(0, -1))  # Shape: (1, 128, 128, 1)
-        
-        # Get segmentation mask
-        mask = segmentation_model.predict(img_array_seg)[0]
-        mask = (mask > 0.5).astype(np.uint8) * 255
-        
-        # Save segmentation mask
-        mask_filename = f"mask_{base_filename}"
-        mask_path = os.path.join(MASKS_DIR, mask_filename)
-        mask_img = Image.fromarray(mask.squeeze(), mode='L')
-        mask_img.save(mask_path)
-        
-        # Convert mask to base64
-        buffer = io.BytesIO()
-        mask_img.save(buffer, format='PNG')
-        mask_base64 = base64.b64encode(buffer.getvalue()).decode()
-        
-        # Preprocess for classification
-        image_class = image.resize((200, 200)).convert('RGB')  # Ensure RGB
-        img_array_class = np.array(image_class) / 255.0
-        img_array_class = np.expand_dims(img_array_class, axis=0)  # Shape: (1, 200, 200, 3)
+        try:
+            mask_format, resolution, tta_views = analysis_options(request.args, request.headers.get('Accept'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
-        # Get classification
-        pred = classification_model.predict(img_array_class)
-        class_idx = np.argmax(pred[0])
-        confidence = float(pred[0][class_idx])
+        # Read and process the image
+        started = time.perf_counter()
+        timer = StageTimer()
+        with timer.stage('read'):
+            image_bytes = file.read()
+        patient_id = request.form.get('patientId')
 
-        # Convert original image to base64 for imageUrl
-        buffer = io.BytesIO()
-        image.save(buffer, format='JPEG')
-        image_base64 = f"data:image/jpeg;base64,{base64.b64encode(buffer.getvalue()).decode()}"
-
-        # Format response
-        response_data = {
-            'classification': {
-                'class': class_names[class_idx],
-                'confidence': confidence
-            },
-            'segmentation_mask': mask_base64,
-            'originalPath': original_path,
-            'maskPath': mask_path,
-            'imageUrl': image_base64,
-            'error': None
-        }
-        return jsonify(response_data)
+        return jsonify(analyze_image(image_bytes, mask_format, resolution, tta_views, patient_id, timer, started))
 
     except Exception as e:
         error_msg = f"Error processing image: {str(e)}\n{traceback.format_exc()}"
         print(error_msg)
         return jsonify({'error': error_msg}), 500
 
+@app.route('/analyze/batch', methods=['POST'])
+def analyze_batch():
+    """Analyze many images (or a zip/tar of images), streaming one NDJSON line per image.
+
+    Images are prepared and submitted in chunks of BATCH_MAX_SIZE. While one chunk
+    is in the models the next one is decoded, and each result line is written as
+    soon as its chunk finishes, so at most two chunks are held in memory.
+    """
+    unavailable = models_unavailable()
+    if unavailable is not None:
+        return unavailable
+
+    uploads = request.files.getlist('files') + request.files.getlist('file')
+    if not uploads:
+        return jsonify({'error': 'No files uploaded'}), 400
+
+    try:
+        mask_format = negotiate_format(request.args.get('mask_format'), request.headers.get('Accept'), 'png')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    def line(payload):
+        return json.dumps(payload) + '\n'
+
+    def finish(pending):
+        for index, name, prepared, timer, mask_future, pred_future in pending:
+            try:
+                fields, mask = collect(mask_future, pred_future, cascade, class_names, timer)
+                result = build_result(prepared, fields, mask, timer)
+                add_artifact_urls(result)
+                apply_mask_format(result, mask_format, mask, timer)
+                result.update({'index': index, 'filename': name, 'error': None,
+                               'preprocessing_ms': timer.as_dict(PREPROCESSING_STAGES), 'timings': timer.as_dict()})
+                observe_stages(stage_seconds, result['timings'], endpoint='analyze_batch')
+            except Exception as e:
+                result = {'index': index, 'filename': name, 'error': str(e)}
+            yield result
+
+    def generate():
+        try:
+            yield from analyze_items()
+        finally:
+            for upload in uploads:
+                upload.close()
+
+    def analyze_items():
+        started = time.perf_counter()
+        # A single image may be as large as a single /analyze upload
+        items = iter_upload_items(uploads, max_member_bytes=app.config['MAX_CONTENT_LENGTH'])
+        pending, submitted = [], []
+        count = errors = 0
+        try:
+            for chunk in chunked(items, BATCH_MAX_SIZE):
+                for name, data, error in chunk:
+                    index = count
+                    count += 1
+                    if error is not None:
+                        errors += 1
+                        yield line({'index': index, 'filename': name, 'error': error})
+                        continue
+                    timer = StageTimer()
+                    try:
+                        prepared = prepare(data, timer)
+                    except Exception as e:
+                        errors += 1
+                        yield line({'index': index, 'filename': name, 'error': f"Failed to decode image: {str(e)}"})
+                        continue
+                    submitted.append((index, name, prepared, timer) + submit_models(
+                        prepared, segmentation_batcher, classification_batcher, cascade
+                    ))
+                # Results of the previous chunk are ready by now (or nearly)
+                for result in finish(pending):
+                    errors += result['error'] is not None
+                    yield line(result)
+                pending, submitted = submitted, []
+        except Exception as e:
+            # The 200 has gone out already: report the failure in-band and still end with the summary line
+            print(f"Batch analyze aborted: {str(e)}")
+            print(traceback.format_exc())
+            errors += 1
+            yield line({'index': None, 'filename': None, 'error': f"Batch aborted: {str(e)}"})
+        for result in finish(pending + submitted):
+            errors += result['error'] is not None
+            yield line(result)
+        yield line({'done': True, 'count': count, 'errors': errors,
+                    'elapsed_ms': round((time.perf_counter() - started) * 1000.0, 3)})
+
+    print(f"Received batch analyze request with {len(uploads)} upload(s)")
+    # The request closes its files when this view returns, before the response is streamed
+    uploads = [SpooledUpload(upload) for upload in uploads]
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/analyze/volume', methods=['POST'])
+def analyze_volume():
+    """Analyze a NIfTI volume or DICOM series slice by slice, streaming NDJSON.
+
+    One line per slice (class, confidence, tumor pixels and the mask, RLE by
+    default), then a summary line with volume-level aggregates.
+    """
+    unavailable = models_unavailable()
+    if unavailable is not None:
+        return unavailable
+    # The whole volume runs on the versions serving now, even if a swap lands midway
+    segmentation_runner = model_registry.get('segmentation')
+    classification_runner = model_registry.get('classification')
+
+    file = request.files.get('file')
+    if file is None or file.filename == '':
+        return jsonify({'error': 'No file uploaded'}), 400
+    if not is_volume_name(file.filename):
+        return jsonify({'error': f"Expected a volume file, one of {VOLUME_EXTENSIONS}"}), 400
+
+    try:
+        mask_format = negotiate_format(request.args.get('mask_format'), request.headers.get('Accept'), 'rle')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    def generate():
+        try:
+            for item in analyze_spooled(workdir, path, segmentation_runner, classification_runner,
+                                        class_names, VOLUME_BATCH_SIZE):
+                if 'mask' in item:
+                    item['segmentation_mask'] = encode_mask(item.pop('mask'), mask_format)
+                    item['mask_format'] = mask_format
+                elif 'timings_ms' in item:
+                    observe_stages(stage_seconds, item['timings_ms'], endpoint='analyze_volume')
+                yield json.dumps(item) + '\n'
+        except Exception as e:
+            print(f"Error analyzing volume: {str(e)}")
+            print(traceback.format_exc())
+            yield json.dumps({'done': True, 'error': str(e)}) + '\n'
+
+    print(f"Received volume analyze request for {file.filename}")
+    # The request closes its files when this view returns, so the volume is spooled to
+    # a directory the response owns; analyze_spooled removes it, or call_on_close does
+    # if the client goes away before streaming starts
+    workdir, path = spool_upload(file.stream, file.filename)
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    response.call_on_close(lambda: shutil.rmtree(workdir, ignore_errors=True))
+    return response
+
+def run_job(job):
+    params = job['params']
+    return analyze_image(
+        job['payload'], params['mask_format'], params['resolution'], params['tta'], params.get('patientId'),
+        StageTimer(), time.perf_counter(), endpoint='jobs',
+        # Jobs queued without a host URL get relative /data/ links
+        host_url=params.get('hostUrl') or '/'
+    )
+
+def job_started(job):
+    job_wait_seconds.observe(job['started_at'] - job['submitted_at'], lane=job['lane'])
+
+def job_finished(job, ok):
+    job_run_seconds.observe(time.time() - job['started_at'], lane=job['lane'], status='done' if ok else 'failed')
+
+def _iso(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat() if timestamp else None
+
+def job_response(job):
+    response = {
+        'jobId': job['id'],
+        'status': job['status'],
+        'priority': job['lane'],
+        'submittedAt': _iso(job['submitted_at']),
+        'startedAt': _iso(job['started_at']),
+        'finishedAt': _iso(job['finished_at']),
+        'attempts': job['attempts'],
+        'error': job['error']
+    }
+    if job['started_at']:
+        response['waitMs'] = round((job['started_at'] - job['submitted_at']) * 1000.0, 1)
+    if job['finished_at'] and job['started_at']:
+        response['runMs'] = round((job['finished_at'] - job['started_at']) * 1000.0, 1)
+    if job['status'] == 'queued':
+        response['position'] = job_queue.position(job['id'])
+    if 'result' in job:
+        response['result'] = job['result']
+    return response
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """Queue a scan for analysis and answer 202 with its job id straight away.
+
+    Takes the same upload, ``patientId`` and query options as /analyze, plus
+    ``priority``: ``urgent``, ``normal`` (default) or ``bulk``. Fetch the outcome
+    from GET /jobs/<id>, optionally long-polling with ``?wait=SECONDS``.
+    """
+    if 'file' not in request.files or request.files['file'].filename == '':
+        return jsonify({'error': 'No file uploaded'}), 400
+    try:
+        mask_format, resolution, tta_views = analysis_options(request.args, request.headers.get('Accept'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    priority = (request.args.get('priority') or request.form.get('priority') or 'normal').lower()
+    if priority not in LANES:
+        return jsonify({'error': f"priority must be one of {LANES}"}), 400
+
+    job_id = job_queue.submit(request.files['file'].read(), {
+        'mask_format': mask_format,
+        'resolution': resolution,
+        'tta': tta_views,
+        'patientId': request.form.get('patientId'),
+        'filename': request.files['file'].filename,
+        'hostUrl': request.host_url
+    }, lane=priority)
+    response = jsonify(job_response(job_queue.get(job_id)))
+    response.status_code = 202
+    response.headers['Location'] = f'/jobs/{job_id}'
+    return response
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Job status, with the /analyze result once done. ``?wait=N`` holds the request up to N seconds for it."""
+    wait = min(max(request.args.get('wait', 0, type=float), 0.0), JOB_WAIT_MAX_S)
+    job = job_queue.wait(job_id, wait) if wait else job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job_response(job))
+
 @app.route('/test-image', methods=['POST'])
 def test_image():
     try:
@@ -281,19 +782,12 @@ def test_image():
         # Read and verify the image
         image_bytes = file.read()
         try:
-            image = Image.open(io.BytesIO(image_bytes))
-
-            # Test segmentation preprocessing
-            image_seg = image.resize((128, 128)).convert('L')
-            img_array_seg = np.array(image_seg) / 255.0
-            img_array_seg = np.expand_dims(img_array_seg, axis=(0, -1))
+            timer = StageTimer()
+            prepared = prepare(image_bytes, timer)
+            img_array_seg = prepared.segmentation[None]
+            img_array_class = prepared.classification[None]
             print("Segmentation preprocessing successful")
             print(f"Segmentation input shape: {img_array_seg.shape}")
-
-            # Test classification preprocessing
-            image_class = image.resize((200, 200)).convert('RGB')
-            img_array_class = np.array(image_class) / 255.0
-            img_array_class = np.expand_dims(img_array_class, axis=0)
             print("Classification preprocessing successful")
             print(f"Classification input shape: {img_array_class.shape}")
 
@@ -312,12 +806,13 @@ def test_image():
                 'success': True,
                 'message': 'Image preprocessing successful',
                 'details': {
-                    'original_size': image.size,
-                    'original_mode': image.mode,
+                    'original_size': prepared.original_size,
+                    'original_mode': prepared.original_mode,
                     'segmentation_shape': img_array_seg.shape,
                     'classification_shape': img_array_class.shape,
                     'segmentation_preview': seg_base64,
-                    'classification_preview': class_base64
+                    'classification_preview': class_base64,
+                    'preprocessing_ms': timer.as_dict()
                 }
             })
 
@@ -334,52 +829,96 @@ def test_image():
         print(traceback.format_exc())
         return jsonify({'error': str(e)}), 500
 
+def wants_event_stream(data):
+    return data.get('stream') is True or 'text/event-stream' in request.headers.get('Accept', '')
+
+def stream_chat(key, messages, cached_answer):
+    """Server-sent events: ``token`` events with text deltas, then ``done`` (or ``error``)."""
+    started = time.perf_counter()
+    if cached_answer is not None:
+        yield sse_event('token', {'text': cached_answer})
+        yield sse_event('done', {'cached': True})
+        return
+    tokens = []
+    first_token_ms = None
+    try:
+        for token in stream_reply(chat_client(), messages):
+            if first_token_ms is None:
+                first_token_ms = (time.perf_counter() - started) * 1000.0
+                chat_seconds.observe(first_token_ms / 1000.0, stage='first_token', cached='false')
+            tokens.append(token)
+            yield sse_event('token', {'text': token})
+    except Exception as e:
+        print(f"Error during OpenAI API call: {str(e)}")
+        yield sse_event('error', {'error': f'OpenAI API error: {str(e)}'})
+        return
+    total_ms = (time.perf_counter() - started) * 1000.0
+    chat_seconds.observe(total_ms / 1000.0, stage='total', cached='false')
+    chat_cache.put(key, ''.join(tokens))
+    yield sse_event('done', {
+        'cached': False,
+        'first_token_ms': round(first_token_ms, 1) if first_token_ms is not None else None,
+        'total_ms': round(total_ms, 1)
+    })
+
 @app.route('/chat', methods=['POST'])
 def chat():
+    """Answer a question about a scan, as JSON or streamed as server-sent events.
+
+    Send ``Accept: text/event-stream`` (or ``"stream": true``) to receive tokens as
+    they are generated. Identical questions about the same scan within
+    CHAT_CACHE_TTL seconds are answered from the cache.
+    """
     try:
-        data = request.json
+        data = request.get_json(silent=True) or {}
         message = data.get('message')
-        scan_details = data.get('scanDetails')
-        
+        scan_details = data.get('scanDetails') or {}
+
         print("Received chat request with scan details:", scan_details)
-        
+
         headers = {
             'Access-Control-Allow-Origin': 'http://localhost:3000',
             'Access-Control-Allow-Headers': 'Content-Type',
         }
 
+        if not message or not str(message).strip():
+            return jsonify({'error': 'Message is required'}), 400, headers
+
         if not OPENAI_API_KEY:
             print("Error: OpenAI API key not found")
             return jsonify({'error': 'OpenAI API key not configured'}), 500, headers
 
+        client = chat_client()
         if not client:
             return jsonify({'error': 'OpenAI client not initialized'}), 500, headers
 
-        system_message = f"""You are a helpful medical imaging AI assistant. Current scan details:
-        - Tumor Type: {scan_details.get('tumorType')}
-        - Confidence: {scan_details.get('confidence')*100:.1f}%
-        - Status: {'Tumor detected' if scan_details.get('hasTumor') else 'No tumor detected'}
-        
-        Provide clear, empathetic responses about the scan results. Always include appropriate medical disclaimers."""
+        messages = build_chat_messages(message, scan_details)
+        key = ChatCache.make_key(messages)
+        answer = chat_cache.get(key)
 
-        try:
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": message}
-                ],
-                max_tokens=150,
-                temperature=0.7
+        if wants_event_stream(data):
+            headers.update({'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+            return Response(
+                stream_with_context(stream_chat(key, messages, answer)),
+                mimetype='text/event-stream',
+                headers=headers
             )
-            
+
+        if answer is not None:
+            return jsonify({'response': answer, 'cached': True}), 200, headers
+
+        try:
+            started = time.perf_counter()
+            answer = ''.join(stream_reply(client, messages))
+            chat_seconds.observe(time.perf_counter() - started, stage='total', cached='false')
+            chat_cache.put(key, answer)
             print("OpenAI response received successfully")
-            return jsonify({'response': response.choices[0].message.content}), 200, headers
-            
+            return jsonify({'response': answer, 'cached': False}), 200, headers
+
         except Exception as e:
             print(f"Error during OpenAI API call: {str(e)}")
             return jsonify({'error': f'OpenAI API error: {str(e)}'}), 500, headers
-            
+
     except Exception as e:
         print(f"Chat endpoint error: {str(e)}")
         print(f"Full error details: {traceback.format_exc()}")
@@ -387,20 +926,199 @@ def chat():
 
 @app.route('/', methods=['GET'])
 def home():
+    models = model_registry.status()
     return jsonify({
         'status': 'running',
-        'segmentation_model_loaded': segmentation_model is not None,
-        'classification_model_loaded': classification_model is not None,
+        'ready': model_registry.ready(),
+        'inference_backend': INFERENCE_BACKEND,
+        'model_server': MODEL_SERVER_SOCKET,
+        'segmentation_model_loaded': models['segmentation']['state'] == 'ready',
+        'classification_model_loaded': models['classification']['state'] == 'ready',
+        'warmup_seconds': {name: model['warmup_seconds'] for name, model in models.items()},
         'model_paths': {
             'segmentation': SEGMENTATION_MODEL_PATH,
             'classification': CLASSIFICATION_MODEL_PATH
         },
-        'openai_available': OPENAI_API_KEY is not None
+        'openai_available': OPENAI_API_KEY is not None,
+        'tuning': {
+            'target': TUNING_TARGET,
+            'profile': TUNING_PROFILE if tuning else None,
+            'intra_op_threads': INTRA_OP_THREADS,
+            'inter_op_threads': INTER_OP_THREADS,
+            'batch_max_size': BATCH_MAX_SIZE
+        }
+    })
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """Liveness: the process is up and serving HTTP, whether or not the models are loaded yet."""
+    return jsonify({'status': 'alive'})
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """Readiness: 200 once every model is loaded and warmed up, 503 until then."""
+    ready = model_registry.ready()
+    return jsonify({'ready': ready, 'models': model_registry.status()}), 200 if ready else 503
+
+@app.route('/models', methods=['GET'])
+def models():
+    """State, version, file, load and warm-up times of each model."""
+    return jsonify(model_registry.status())
+
+@app.route('/models/<name>/reload', methods=['POST'])
+def reload_model(name):
+    """Hot-swap a model from disk without a restart.
+
+    The new version is loaded and warmed up next to the serving one, then swapped
+    in atomically; requests already running finish on the old version. The JSON
+    body may name another file in the models directory (``{"path": "..."}``);
+    by default the configured file is re-read. Answers 202 straight away, or with
+    ``?wait=1`` once the new version serves (500 if it failed to load).
+    """
+    if name not in model_registry.status():
+        return jsonify({'error': f'Unknown model {name!r}'}), 404
+    if model_client is not None:
+        return jsonify({'error': 'Models are served by the model server; restart it to load new files'}), 400
+    path = (request.get_json(silent=True) or {}).get('path')
+    if path:
+        path = safe_join(models_dir, path)
+        if path is None or not os.path.isfile(path):
+            return jsonify({'error': 'path must name a file in the models directory'}), 400
+    if request.args.get('wait') in ('1', 'true'):
+        swapped = model_registry.swap(name, path, wait=True)
+        return jsonify(model_registry.status()[name]), 200 if swapped else 500
+    model_registry.swap(name, path)
+    return jsonify(model_registry.status()[name]), 202
+
+def segmentation_image_ms():
+    # Typical segmentation cost per image: median batch time over the mean batch size
+    if segmentation_batcher is None:
+        return None
+    batching = segmentation_batcher.stats()
+    if not batching['batches']:
+        return None
+    return batching['predict_ms']['p50'] / batching['mean_batch_size']
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = request.endpoint or 'unmatched'
+    requests_total.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    started = g.pop('request_started', None)
+    if started is not None:
+        request_seconds.observe(time.perf_counter() - started, endpoint=endpoint)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    return jsonify({
+        'batching': {
+            'segmentation': segmentation_batcher.stats() if segmentation_batcher else None,
+            'classification': classification_batcher.stats() if classification_batcher else None
+        },
+        'result_cache': result_cache.stats(),
+        'artifact_writer': artifact_writer.stats(),
+        'cascade': cascade.stats(segmentation_image_ms()),
+        'chat_cache': chat_cache.stats(),
+        'jobs': dict(job_queue.stats(), workers=JOB_WORKERS if job_workers else 0)
     })
 
+@app.route('/patients', methods=['GET', 'POST'])
+def patients():
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        if not data.get('name'):
+            return jsonify({'error': 'Patient name is required'}), 400
+        data.setdefault('updatedAt', utc_now())
+        try:
+            return jsonify(record_store.add_patient(data)), 201
+        except sqlite3.IntegrityError:
+            return jsonify({'error': f"Patient {data.get('id')} already exists"}), 409
+    try:
+        limit, cursor = page_args()
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    return jsonify(record_store.list_patients(limit, cursor))
+
+@app.route('/patients/<patient_id>', methods=['GET'])
+def get_patient(patient_id):
+    patient = record_store.get_patient(patient_id)
+    if patient is None:
+        return jsonify({'error': 'Patient not found'}), 404
+    return jsonify(patient)
+
+@app.route('/patients/<patient_id>/scans', methods=['GET'])
+def patient_scans(patient_id):
+    try:
+        limit, cursor = page_args()
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    return jsonify(record_store.scans_for_patient(patient_id, limit, cursor))
+
+@app.route('/scans', methods=['GET'])
+def scans():
+    """Scans newest first, optionally within ``?from=&to=`` (ISO 8601 dates)."""
+    try:
+        limit, cursor = page_args()
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    return jsonify(record_store.scans_between(request.args.get('from'), request.args.get('to'), limit, cursor))
+
+@app.route('/scans/<scan_id>', methods=['GET'])
+def get_scan(scan_id):
+    scan = record_store.get_scan(scan_id)
+    if scan is None:
+        return jsonify({'error': 'Scan not found'}), 404
+    return jsonify(scan)
+
 @app.route('/data/<path:filename>')
 def serve_file(filename):
-    return send_from_directory(DATA_DIR, filename)
+    """Serve stored artifacts with ETag/If-None-Match and Range support.
+
+    Content-addressed files never change, so they get a strong ETag from their
+    hash and a year-long immutable Cache-Control. ``?size=N`` serves a cached
+    JPEG thumbnail of an image. Only the artifact subtrees (SERVED_DATA_DIRS) are served.
+    """
+    path = safe_join(DATA_DIR, filename)
+    if path is None or os.path.relpath(path, DATA_DIR).split(os.sep, 1)[0] not in SERVED_DATA_DIRS:
+        return jsonify({'error': 'Not found'}), 404
+    # A client may ask for an artifact before the background writer has stored it
+    artifact_writer.wait_for(path, timeout=10)
+
+    size = request.args.get('size', type=int)
+    if size is not None:
+        if size not in THUMBNAIL_SIZES:
+            return jsonify({'error': f'Thumbnail size must be one of {list(THUMBNAIL_SIZES)}'}), 400
+        if not os.path.isfile(path):
+            return jsonify({'error': 'Not found'}), 404
+        try:
+            filename = os.path.relpath(thumbnail(path, THUMBS_DIR, size), DATA_DIR)
+        except UnidentifiedImageError:
+            return jsonify({'error': 'Thumbnails are only available for images'}), 400
+
+    etag = content_etag(filename)
+    mimetype = mimetypes.guess_type(filename)[0]
+    response = send_from_directory(
+        DATA_DIR,
+        filename,
+        mimetype=mimetype,
+        conditional=True,
+        etag=etag or True,
+        max_age=ARTIFACT_MAX_AGE if etag else 0
+    )
+    if etag:
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
 
 @app.route('/test-openai', methods=['GET'])
 def test_openai():
@@ -411,7 +1129,7 @@ def test_openai():
                 'error': 'OpenAI API key not configured'
             }), 500
             
-        response = client.chat.completions.create(
+        response = chat_client().chat.completions.create(
             model="gpt-3.5-turbo",
             messages=[
                 {"role": "system", "content": "You are a test assistant."},
@@ -436,6 +1154,22 @@ def test_openai():
             'api_key_preview': f"{OPENAI_API_KEY[:10]}..." if OPENAI_API_KEY else None
         }), 500
 
+def start_job_workers():
+    """Drain the job queue once the models are up; jobs a crashed process left running are requeued first."""
+    global job_workers
+    requeued = job_queue.recover()
+    if requeued:
+        print(f"Requeued {requeued} interrupted jobs")
+    job_workers = JobWorkers(
+        job_queue, run_job, workers=JOB_WORKERS, on_start=job_started, on_finish=job_finished,
+        retention_seconds=JOB_RETENTION_HOURS * 3600
+    )
+    atexit.register(job_workers.close)
+
+if JOB_WORKERS > 0:
+    model_registry.on_ready(start_job_workers)
+model_registry.start()
+
 if __name__ == '__main__':
     print("\nStarting Flask server...")
     print(f"Models directory: {models_dir}")
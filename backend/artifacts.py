@@ -0,0 +1,188 @@
+import hashlib
+import os
+import queue
+import re
+import threading
+import time
+from collections import deque
+
+from PIL import Image
+
+# Artifact names are the first 32 hex chars of the SHA-256 of their bytes
+CONTENT_NAME = re.compile(r'^(?P<digest>[0-9a-f]{32})(?:_(?P<variant>[a-z0-9]+))?\.[a-z0-9]+$')
+
+THUMBNAIL_SIZES = (64, 128, 256, 512)
+
+
+def content_digest(data):
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+def artifact_path(directory, digest, extension):
+    # Shard by the first two hex chars so no directory grows past a few thousand files
+    return os.path.join(directory, digest[:2], f"{digest}.{extension}")
+
+
+def _write_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def write_artifact(directory, data, extension):
+    """Write ``data`` under its content hash and return the path; identical content is written once."""
+    path = artifact_path(directory, content_digest(data), extension)
+    if not os.path.exists(path):
+        _write_file(path, data)
+    return path
+
+
+class ArtifactWriter:
+    """Write-behind persistence of content-addressed artifacts.
+
+    ``submit()`` returns the final path immediately and a background thread writes
+    the bytes after the response has gone out. Identical content is only queued
+    once. The queue is bounded: when it is full the write happens inline instead of
+    growing memory. ``wait_for(path)`` blocks until a queued file is on disk, and
+    ``close()`` drains the queue (call it at shutdown). ``on_write``, if given, is
+    called with the seconds each file write took.
+    """
+
+    def __init__(self, max_pending=256, name='artifacts', history=2048, on_write=None):
+        self.name = name
+        self.on_write = on_write
+        self.max_pending = max(1, int(max_pending))
+        self._queue = queue.Queue(maxsize=self.max_pending)
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._pending_bytes = 0
+        self._write_times = deque(maxlen=history)
+        self._written = 0
+        self._deduped = 0
+        self._inline_writes = 0
+        self._errors = 0
+        self._closed = False
+
+        self._worker = threading.Thread(target=self._run, name=f'{name}-writer', daemon=True)
+        self._worker.start()
+
+    def submit(self, directory, data, extension):
+        path = artifact_path(directory, content_digest(data), extension)
+        with self._lock:
+            if path in self._pending or os.path.exists(path):
+                self._deduped += 1
+                return path
+            done = threading.Event()
+            self._pending[path] = done
+            self._pending_bytes += len(data)
+            queued = False
+            if not self._closed:
+                try:
+                    self._queue.put_nowait((path, data, done))
+                    queued = True
+                except queue.Full:
+                    pass
+            if not queued:
+                self._inline_writes += 1
+        if not queued:
+            self._write(path, data, done)
+        return path
+
+    def wait_for(self, path, timeout=None):
+        """Block until ``path`` is written if it is still queued; returns False on timeout."""
+        with self._lock:
+            done = self._pending.get(path)
+        return done.wait(timeout) if done is not None else True
+
+    def flush(self):
+        self._queue.join()
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._queue.put(None)
+        self._worker.join()
+        print(f"{self.name} writer flushed: {self.stats()['written']} files written")
+
+    def _write(self, path, data, done):
+        started = time.perf_counter()
+        try:
+            _write_file(path, data)
+        except Exception as e:
+            print(f"Error writing {path}: {str(e)}")
+            with self._lock:
+                self._errors += 1
+        else:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self._written += 1
+                self._write_times.append(elapsed)
+            if self.on_write is not None:
+                self.on_write(elapsed)
+        finally:
+            with self._lock:
+                self._pending.pop(path, None)
+                self._pending_bytes -= len(data)
+            done.set()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self._write(*item)
+            finally:
+                self._queue.task_done()
+
+    def stats(self):
+        with self._lock:
+            write_times = sorted(self._write_times)
+            pending, pending_bytes = len(self._pending), self._pending_bytes
+            written, deduped, inline_writes, errors = self._written, self._deduped, self._inline_writes, self._errors
+
+        def ms(q):
+            if not write_times:
+                return 0.0
+            index = min(len(write_times) - 1, int(round(q / 100.0 * (len(write_times) - 1))))
+            return round(write_times[index] * 1000.0, 3)
+
+        return {
+            'queue_depth': self._queue.qsize(),
+            'max_pending': self.max_pending,
+            'pending_files': pending,
+            'pending_bytes': pending_bytes,
+            'written': written,
+            'deduped': deduped,
+            'inline_writes': inline_writes,
+            'errors': errors,
+            'write_ms': {'p50': ms(50), 'p95': ms(95), 'p99': ms(99), 'max': ms(100)}
+        }
+
+
+def content_etag(filename):
+    """Strong ETag for a content-addressed file name, or None for legacy names."""
+    match = CONTENT_NAME.match(os.path.basename(filename))
+    if not match:
+        return None
+    return match.group('digest') + (f"-{match.group('variant')}" if match.group('variant') else '')
+
+
+def thumbnail(source_path, thumbs_dir, size):
+    """Path of a JPEG thumbnail of ``source_path`` no larger than ``size`` px, generated on first use."""
+    base = os.path.splitext(os.path.basename(source_path))[0]
+    path = os.path.join(thumbs_dir, f"{base}_t{size}.jpg")
+    if not os.path.exists(path):
+        os.makedirs(thumbs_dir, exist_ok=True)
+        with Image.open(source_path) as image:
+            image.draft('RGB', (size, size))
+            image = image.convert('L' if image.mode == 'L' else 'RGB')
+            image.thumbnail((size, size))
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            image.save(tmp_path, format='JPEG', quality=85)
+        os.replace(tmp_path, path)
+    return path
@@ -0,0 +1,260 @@
+"""Find the fastest CPU settings for the models on this machine and write them to a profile.
+
+Usage:
+    python autotune.py [--backend keras|tflite] [--quantize MODE] [--target latency|throughput|both]
+                       [--intra 0,1,2,4] [--inter 0,1,2] [--workers 1,2,4] [--batch-sizes 1,2,4,8,16]
+                       [--seconds 2] [--latency-budget-ms MS] [--output models/cpu_profile.json]
+
+Sweeps TensorFlow's intra-op / inter-op thread pool sizes (the interpreter thread
+count on TFLite), the number of concurrent inference workers and the batch size.
+Each trial runs ``new_segmentation_model.h5`` and ``new_classification_model.h5`` back
+to back on synthetic batches of their real input shapes, from every worker for
+``--seconds``, and records the request latency and images per second. Thread pools
+can only be sized before TensorFlow starts, so every thread setting is measured in a
+fresh child process. ``0`` means the runtime's default.
+
+The profile holds one set of settings per target:
+
+* ``latency``: lowest p95 request latency
+* ``throughput``: most images per second, within ``--latency-budget-ms`` if given
+
+``app.py``, ``model_server.py`` and ``mri_service`` read the profile at startup
+(``TUNING_PROFILE``, ``TUNING_TARGET``); explicit environment variables still win.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
+SEGMENTATION_MODEL_PATH = os.path.join(MODELS_DIR, 'new_segmentation_model.h5')
+CLASSIFICATION_MODEL_PATH = os.path.join(MODELS_DIR, 'new_classification_model.h5')
+DEFAULT_PROFILE_PATH = os.path.join(MODELS_DIR, 'cpu_profile.json')
+
+TUNING_TARGETS = ('latency', 'throughput')
+SETTING_KEYS = ('intra_op_threads', 'inter_op_threads', 'inference_workers', 'batch_size')
+
+
+def load_profile(path, target='latency', backend=None):
+    """Tuned settings for ``target`` from an autotune profile, or {} when none applies."""
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r') as f:
+            profile = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring tuning profile {path}: {e}")
+        return {}
+    if backend and profile.get('backend') != backend:
+        print(f"Ignoring tuning profile {path}: tuned for {profile.get('backend')}, serving {backend}")
+        return {}
+    settings = (profile.get('targets') or {}).get(target)
+    if not settings:
+        print(f"Tuning profile {path} has no {target!r} settings")
+        return {}
+    cpus = (profile.get('host') or {}).get('cpu_count')
+    if cpus != os.cpu_count():
+        print(f"Warning: tuning profile {path} was measured on {cpus} CPUs, this machine has {os.cpu_count()}")
+    settings = {key: settings[key] for key in SETTING_KEYS if key in settings}
+    print(f"Applying {target} tuning profile from {path}: {settings}")
+    return settings
+
+
+def _ints(value):
+    return [int(v) for v in value.split(',') if v.strip()]
+
+
+def default_grid(cpu_count):
+    """(intra, inter, workers, batch_sizes) candidates for a machine with ``cpu_count`` CPUs."""
+    intra = [0]
+    size = 1
+    while size < cpu_count:
+        intra.append(size)
+        size *= 2
+    intra.append(cpu_count)
+    workers = [w for w in (1, 2, 4) if w <= max(1, cpu_count)]
+    return intra, [0, 1, 2], workers, [1, 2, 4, 8, 16]
+
+
+def measure(segmentation_runner, classification_runner, batch_size, workers, seconds, seed=0):
+    """Run both models on one synthetic batch from ``workers`` threads for ``seconds``."""
+    from benchmark import summarize
+
+    rng = np.random.default_rng(seed)
+    segmentation_batch = rng.random((batch_size,) + tuple(segmentation_runner.input_shape), dtype=np.float32)
+    classification_batch = rng.random((batch_size,) + tuple(classification_runner.input_shape), dtype=np.float32)
+    latencies = [[] for _ in range(workers)]
+    errors = [0] * workers
+    deadline = time.perf_counter() + seconds
+
+    def work(i):
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                classification_runner(classification_batch)
+                segmentation_runner(segmentation_batch)
+            except Exception:
+                errors[i] += 1
+                continue
+            latencies[i].append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=work, args=(i,), daemon=True) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    result = summarize([value for worker in latencies for value in worker], elapsed, sum(errors))
+    result['images_per_second'] = round(result.get('rps', 0.0) * batch_size, 3)
+    return result
+
+
+def run_thread_setting(args, intra, inter):
+    """Child process: load the models with one thread setting and measure every workers x batch size."""
+    from runtime import load_runners
+
+    segmentation_runner, classification_runner = load_runners(
+        args.backend, SEGMENTATION_MODEL_PATH, CLASSIFICATION_MODEL_PATH, args.quantize,
+        num_threads=intra or None, inter_op_threads=inter or None
+    )
+    for runner in (segmentation_runner, classification_runner):
+        runner.warmup(args.batch_sizes)
+
+    trials = []
+    for batch_size in args.batch_sizes:
+        for workers in args.workers:
+            result = measure(segmentation_runner, classification_runner, batch_size, workers, args.seconds)
+            trial = dict(zip(SETTING_KEYS, (intra, inter, workers, batch_size)), **result)
+            print(f"  intra={intra} inter={inter} workers={workers} batch={batch_size}: "
+                  f"p95 {trial.get('p95_ms')} ms, {trial['images_per_second']} images/s")
+            trials.append(trial)
+    return trials
+
+
+def spawn_trials(args, intra, inter):
+    """Measure one thread setting in a fresh interpreter; returns its trials ([] if it failed)."""
+    command = [
+        sys.executable, os.path.abspath(__file__), '--run-threads', f'{intra},{inter}',
+        '--backend', args.backend, '--quantize', args.quantize, '--seconds', str(args.seconds),
+        '--workers', ','.join(map(str, args.workers)), '--batch-sizes', ','.join(map(str, args.batch_sizes))
+    ]
+    # Progress goes to stderr, which is passed through; the trials come back as JSON on stdout
+    completed = subprocess.run(command, stdout=subprocess.PIPE, text=True)
+    lines = completed.stdout.strip().splitlines()
+    if completed.returncode != 0 or not lines:
+        print(f"Thread setting intra={intra} inter={inter} failed (exit code {completed.returncode})")
+        return []
+    return json.loads(lines[-1])
+
+
+def pick(trials, target, latency_budget_ms=None):
+    """The best trial for ``target``, or None."""
+    trials = [t for t in trials if t.get('requests') and not t.get('errors')]
+    if target == 'latency':
+        return min(trials, key=lambda t: (t['p95_ms'], -t['images_per_second']), default=None)
+    if latency_budget_ms:
+        within = [t for t in trials if t['p95_ms'] <= latency_budget_ms]
+        if not within:
+            print(f"No setting kept p95 under {latency_budget_ms} ms; picking the fastest overall")
+        trials = within or trials
+    return max(trials, key=lambda t: (t['images_per_second'], -t['p95_ms']), default=None)
+
+
+def write_profile(path, args, trials, targets):
+    """Write the chosen settings per target, keeping other targets already in the file."""
+    profile = {}
+    if os.path.exists(path):
+        try:
+            with open(path, 'r') as f:
+                profile = json.load(f)
+        except (OSError, ValueError):
+            profile = {}
+        if profile.get('backend') != args.backend:
+            profile = {}
+    profile_targets = profile.get('targets') or {}
+    for target, trial in targets.items():
+        profile_targets[target] = dict(trial, measured_at=time.strftime('%Y-%m-%dT%H:%M:%S'))
+    profile.update({
+        'backend': args.backend,
+        'quantization': args.quantize,
+        'host': {'node': platform.node(), 'cpu_count': os.cpu_count(), 'machine': platform.machine()},
+        'seconds_per_trial': args.seconds,
+        'targets': profile_targets,
+        'trials': trials
+    })
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(profile, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def print_trials(trials):
+    print(f"\n{'intra':>5} {'inter':>5} {'workers':>7} {'batch':>5} {'p50 ms':>9} {'p95 ms':>9} {'images/s':>9}")
+    for t in sorted(trials, key=lambda t: -t.get('images_per_second', 0)):
+        if not t.get('requests'):
+            continue
+        print(f"{t['intra_op_threads']:>5} {t['inter_op_threads']:>5} {t['inference_workers']:>7} "
+              f"{t['batch_size']:>5} {t['p50_ms']:>9.2f} {t['p95_ms']:>9.2f} {t['images_per_second']:>9.2f}")
+
+
+def main(argv=None):
+    from runtime import INFERENCE_BACKENDS, QUANTIZATION_MODES
+
+    intra, inter, workers, batch_sizes = default_grid(os.cpu_count() or 1)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', choices=INFERENCE_BACKENDS, default=os.getenv('INFERENCE_BACKEND', 'keras').lower())
+    parser.add_argument('--quantize', choices=QUANTIZATION_MODES, default=os.getenv('TFLITE_QUANTIZATION', 'none').lower())
+    parser.add_argument('--target', choices=TUNING_TARGETS + ('both',), default='both')
+    parser.add_argument('--intra', type=_ints, default=intra, help='intra-op threads (TFLite: interpreter threads)')
+    parser.add_argument('--inter', type=_ints, default=inter, help='inter-op threads (Keras only)')
+    parser.add_argument('--workers', type=_ints, default=workers)
+    parser.add_argument('--batch-sizes', type=_ints, default=batch_sizes)
+    parser.add_argument('--seconds', type=float, default=2.0, help='duration of each trial')
+    parser.add_argument('--latency-budget-ms', type=float, help='p95 ceiling for the throughput target')
+    parser.add_argument('--output', default=DEFAULT_PROFILE_PATH)
+    parser.add_argument('--run-threads', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_threads:
+        # Child mode: keep stdout for the JSON result
+        stdout, sys.stdout = sys.stdout, sys.stderr
+        trials = run_thread_setting(args, *_ints(args.run_threads))
+        stdout.write(json.dumps(trials) + '\n')
+        return 0
+
+    # The interpreter has a single thread count
+    inter = [0] if args.backend == 'tflite' else args.inter
+    settings = [(i, j) for i in args.intra for j in inter]
+    print(f"Tuning the {args.backend} models on {os.cpu_count()} CPUs: {len(settings)} thread settings x "
+          f"{len(args.workers)} worker counts x {len(args.batch_sizes)} batch sizes, {args.seconds}s each")
+    trials = []
+    for i, j in settings:
+        print(f"Thread setting intra={i} inter={j}")
+        trials.extend(spawn_trials(args, i, j))
+    if not trials:
+        print("No trial completed")
+        return 1
+    print_trials(trials)
+
+    targets = {}
+    for target in (TUNING_TARGETS if args.target == 'both' else (args.target,)):
+        best = pick(trials, target, args.latency_budget_ms)
+        if best is not None:
+            targets[target] = {key: best[key] for key in SETTING_KEYS + ('p50_ms', 'p95_ms', 'images_per_second')}
+            print(f"{target}: {targets[target]}")
+    write_profile(args.output, args, trials, targets)
+    print(f"\nProfile written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
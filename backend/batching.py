@@ -0,0 +1,140 @@
+import queue
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+
+import numpy as np
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class MicroBatcher:
+    """Groups single-sample predictions from concurrent requests into one batched call.
+
+    Callers block in ``submit()`` until their own slice of the batch output is ready.
+    A batch is dispatched once ``max_batch_size`` samples are pending or the oldest
+    pending sample has waited ``max_wait_ms``, whichever comes first.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=8, max_wait_ms=10.0, name='model', history=2048):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.name = name
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._waits = deque(maxlen=history)
+        self._predict_times = deque(maxlen=history)
+        self._requests = 0
+        self._batches = 0
+        self._errors = 0
+
+        self._worker = threading.Thread(target=self._run, name=f'{name}-batcher', daemon=True)
+        self._worker.start()
+
+    def submit(self, sample, timeout=None):
+        """Queue one sample (no batch axis) and return its row of the model output."""
+        return self.submit_async(sample).result(timeout=timeout)
+
+    def submit_async(self, sample):
+        future = Future()
+        self._queue.put((sample, time.perf_counter(), future))
+        return future
+
+    def close(self):
+        self._queue.put(None)
+        self._worker.join()
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = first[1] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                # Past the deadline we still drain whatever is already queued
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            self._dispatch(self._collect(first))
+
+    def _dispatch(self, batch):
+        samples, enqueued, futures = zip(*batch)
+        started = time.perf_counter()
+        try:
+            outputs = self.predict_fn(np.stack(samples))
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            with self._lock:
+                self._errors += 1
+            return
+        finished = time.perf_counter()
+
+        for i, future in enumerate(futures):
+            # Per-request view of the batch, for callers that report stage timings
+            future.timings = {
+                'queue_wait': round((started - enqueued[i]) * 1000.0, 3),
+                'predict': round((finished - started) * 1000.0, 3),
+                'batch_size': len(batch)
+            }
+            future.set_result(outputs[i])
+
+        with self._lock:
+            self._requests += len(batch)
+            self._batches += 1
+            self._batch_sizes[len(batch)] += 1
+            self._waits.extend(started - t for t in enqueued)
+            self._predict_times.append(finished - started)
+
+    def stats(self):
+        with self._lock:
+            waits = sorted(self._waits)
+            predict_times = sorted(self._predict_times)
+            batch_sizes = dict(sorted(self._batch_sizes.items()))
+            requests, batches, errors = self._requests, self._batches, self._errors
+
+        def ms(values, q):
+            return round(_percentile(values, q) * 1000.0, 3)
+
+        return {
+            'name': self.name,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000.0,
+            'queue_depth': self._queue.qsize(),
+            'requests': requests,
+            'batches': batches,
+            'errors': errors,
+            'mean_batch_size': round(requests / batches, 3) if batches else 0.0,
+            'batch_size_histogram': {str(size): count for size, count in batch_sizes.items()},
+            'queue_wait_ms': {
+                'mean': round(sum(waits) / len(waits) * 1000.0, 3) if waits else 0.0,
+                'p50': ms(waits, 50),
+                'p95': ms(waits, 95),
+                'p99': ms(waits, 99),
+                'max': ms(waits, 100),
+            },
+            'predict_ms': {
+                'p50': ms(predict_times, 50),
+                'p95': ms(predict_times, 95),
+                'max': ms(predict_times, 100),
+            },
+        }
@@ -0,0 +1,265 @@
+"""Load tests and microbenchmarks for the inference services, with baseline comparison.
+
+Usage:
+    python benchmark.py http [--url http://localhost:8080] [--mri-url http://localhost:8080]
+                             [--endpoints analyze,test-image,process-mri] [--concurrency 1,4,16]
+                             [--requests 200] [--image-size 256] [--reuse-images]
+    python benchmark.py micro [--backend keras|tflite] [--quantize MODE] [--repeats 50]
+
+    Either command also takes:
+        --save-baseline FILE   write the results as a baseline
+        --compare FILE         compare against a baseline and exit 1 on regressions
+        --tolerance 0.15       allowed relative slowdown (latency up / throughput down)
+
+Requests carry synthetic MRI-like JPEGs generated locally (skull ring, brain texture
+and an optional bright lesion), so no patient data is needed. Every /analyze request
+gets a distinct image unless --reuse-images is passed, so the result cache doesn't
+flatter the numbers.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+ENDPOINTS = {
+    'analyze': ('url', '/analyze'),
+    'test-image': ('url', '/test-image'),
+    'process-mri': ('mri_url', '/process-mri/'),
+}
+
+LATENCY_KEYS = ('p50_ms', 'p95_ms', 'p99_ms')
+
+
+def synthetic_mri(size, rng, lesion=True):
+    """(size, size) uint8 axial-slice lookalike: dark background, skull ring, textured brain, optional lesion."""
+    rows, cols = np.mgrid[:size, :size].astype(np.float32) / size - 0.5
+    ry, rx = rng.uniform(0.36, 0.44, size=2)
+    radius = np.sqrt((rows / ry) ** 2 + (cols / rx) ** 2)
+    image = np.zeros((size, size), dtype=np.float32)
+    image[(radius > 0.92) & (radius <= 1.0)] = 200.0
+    brain = radius <= 0.92
+    texture = rng.normal(0, 1, (size // 8 + 1, size // 8 + 1)).astype(np.float32)
+    texture = np.kron(texture, np.ones((8, 8), dtype=np.float32))[:size, :size]
+    image[brain] = 90.0 + 25.0 * texture[brain] + 20.0 * np.cos(radius[brain] * 6.0)
+    if lesion:
+        cy, cx = rng.uniform(-0.2, 0.2, size=2)
+        r = rng.uniform(0.04, 0.1)
+        image[(rows - cy) ** 2 + (cols - cx) ** 2 <= r * r] = 230.0
+    image += rng.normal(0, 6, image.shape)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def synthetic_jpeg(size, rng, quality=90):
+    buffer = io.BytesIO()
+    Image.fromarray(synthetic_mri(size, rng, lesion=rng.random() < 0.7), mode='L').save(
+        buffer, format='JPEG', quality=quality
+    )
+    return buffer.getvalue()
+
+
+def summarize(latencies, elapsed, errors):
+    values = np.sort(np.asarray(latencies, dtype=np.float64)) * 1000.0
+    if not len(values):
+        return {'requests': 0, 'errors': errors}
+    return {
+        'requests': int(len(values)),
+        'errors': int(errors),
+        'mean_ms': round(float(values.mean()), 3),
+        'p50_ms': round(float(np.percentile(values, 50)), 3),
+        'p95_ms': round(float(np.percentile(values, 95)), 3),
+        'p99_ms': round(float(np.percentile(values, 99)), 3),
+        'max_ms': round(float(values[-1]), 3),
+        'rps': round(len(values) / elapsed, 3) if elapsed > 0 else 0.0
+    }
+
+
+def run_http(url, payloads, concurrency, warmup=4):
+    """POST each payload once at the given concurrency; returns the latency summary."""
+    import requests
+
+    local = threading.local()
+
+    def post(data):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        started = time.perf_counter()
+        try:
+            response = session.post(url, files={'file': ('scan.jpg', data, 'image/jpeg')}, timeout=120)
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - started, ok
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(post, payloads[:warmup]))
+        started = time.perf_counter()
+        outcomes = list(pool.map(post, payloads[warmup:]))
+        elapsed = time.perf_counter() - started
+    latencies = [latency for latency, ok in outcomes if ok]
+    return summarize(latencies, elapsed, sum(not ok for _, ok in outcomes))
+
+
+def http_benchmarks(args):
+    rng = np.random.default_rng(args.seed)
+    results = {}
+    endpoints = [name.strip() for name in args.endpoints.split(',') if name.strip()]
+    for name in endpoints:
+        if name not in ENDPOINTS:
+            raise SystemExit(f"Unknown endpoint {name!r}, expected one of {sorted(ENDPOINTS)}")
+        base_attr, path = ENDPOINTS[name]
+        url = getattr(args, base_attr).rstrip('/') + path
+        for concurrency in args.concurrency:
+            count = args.requests + 4
+            if args.reuse_images:
+                pool = [synthetic_jpeg(args.image_size, rng) for _ in range(16)]
+                payloads = [pool[i % len(pool)] for i in range(count)]
+            else:
+                payloads = [synthetic_jpeg(args.image_size, rng) for _ in range(count)]
+            print(f"{name} at concurrency {concurrency}: {args.requests} requests to {url}")
+            results[f"http:{name}:c{concurrency}"] = run_http(url, payloads, concurrency)
+    return results
+
+
+def time_calls(fn, repeats, warmup=3):
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    return summarize(latencies, time.perf_counter() - started, 0)
+
+
+def micro_benchmarks(args):
+    from mask_encoding import MASK_FORMATS, encode_mask
+    from preprocessing import prepare, prepare_batch
+
+    rng = np.random.default_rng(args.seed)
+    results = {}
+    for size in (256, 512, 1024):
+        data = synthetic_jpeg(size, rng)
+        print(f"prepare {size}px")
+        results[f"micro:prepare:{size}px"] = time_calls(lambda: prepare(data), args.repeats)
+    batch = [synthetic_jpeg(512, rng) for _ in range(8)]
+    print("prepare_batch 8x512px")
+    results['micro:prepare_batch:8x512px'] = time_calls(lambda: prepare_batch(batch), args.repeats)
+
+    mask = synthetic_mri(128, rng) > 200
+    for mask_format in MASK_FORMATS:
+        if mask_format == 'list':
+            continue
+        print(f"mask encode {mask_format}")
+        results[f"micro:mask_encode:{mask_format}"] = time_calls(lambda: encode_mask(mask, mask_format), args.repeats)
+
+    if args.backend:
+        from inference import SEGMENTATION_INPUT_SHAPE, CLASSIFICATION_INPUT_SHAPE
+        from runtime import load_runners
+
+        models_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
+        segmentation_runner, classification_runner = load_runners(
+            args.backend,
+            os.path.join(models_dir, 'new_segmentation_model.h5'),
+            os.path.join(models_dir, 'new_classification_model.h5'),
+            args.quantize
+        )
+        for batch_size in (1, 8):
+            seg = rng.random((batch_size,) + SEGMENTATION_INPUT_SHAPE, dtype=np.float32)
+            cls = rng.random((batch_size,) + CLASSIFICATION_INPUT_SHAPE, dtype=np.float32)
+            print(f"model calls at batch size {batch_size} ({args.backend})")
+            results[f"micro:segmentation:{args.backend}:b{batch_size}"] = time_calls(
+                lambda: segmentation_runner(seg), args.repeats
+            )
+            results[f"micro:classification:{args.backend}:b{batch_size}"] = time_calls(
+                lambda: classification_runner(cls), args.repeats
+            )
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Print a comparison table and return the list of regressions."""
+    regressions = []
+    print(f"\n{'benchmark':<42} {'metric':>7} {'baseline':>10} {'current':>10} {'change':>8}")
+    for key in sorted(set(results) & set(baseline)):
+        current, before = results[key], baseline[key]
+        for metric in LATENCY_KEYS + ('rps',):
+            if metric not in current or metric not in before or not before[metric]:
+                continue
+            change = current[metric] / before[metric] - 1.0
+            worse = change > tolerance if metric != 'rps' else change < -tolerance
+            flag = '  REGRESSION' if worse else ''
+            print(f"{key:<42} {metric:>7} {before[metric]:>10.2f} {current[metric]:>10.2f} {change:>+7.1%}{flag}")
+            if worse:
+                regressions.append((key, metric, change))
+    missing = sorted(set(baseline) - set(results))
+    if missing:
+        print(f"Not run this time: {', '.join(missing)}")
+    return regressions
+
+
+def print_results(results):
+    print(f"\n{'benchmark':<42} {'n':>5} {'err':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'rps':>9}")
+    for key, r in results.items():
+        if not r.get('requests'):
+            print(f"{key:<42} {0:>5} {r.get('errors', 0):>4}")
+            continue
+        print(f"{key:<42} {r['requests']:>5} {r['errors']:>4} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} "
+              f"{r['p99_ms']:>9.2f} {r['rps']:>9.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('mode', choices=('http', 'micro'))
+    parser.add_argument('--url', default='http://localhost:8080', help='Flask backend')
+    parser.add_argument('--mri-url', default='http://localhost:8080', help='mri_service (also port 8080 by default)')
+    parser.add_argument('--endpoints', default='analyze,test-image')
+    parser.add_argument('--concurrency', default='1,4,16', type=lambda v: [int(c) for c in v.split(',')])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--image-size', type=int, default=256)
+    parser.add_argument('--reuse-images', action='store_true')
+    parser.add_argument('--backend', choices=('keras', 'tflite'))
+    parser.add_argument('--quantize', default='none')
+    parser.add_argument('--repeats', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save-baseline')
+    parser.add_argument('--compare')
+    parser.add_argument('--tolerance', type=float, default=0.15)
+    args = parser.parse_args(argv)
+
+    results = http_benchmarks(args) if args.mode == 'http' else micro_benchmarks(args)
+    print_results(results)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({
+                'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'host': platform.node(),
+                'python': platform.python_version(),
+                'cpus': os.cpu_count(),
+                'results': results
+            }, f, indent=2)
+        print(f"\nBaseline written to {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline['results'], args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}")
+            return 1
+        print(f"\nNo regressions beyond {args.tolerance:.0%}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
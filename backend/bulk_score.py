@@ -0,0 +1,216 @@
+"""Score a whole dataset offline, without the HTTP server.
+
+Usage:
+    python bulk_score.py INPUT --output results.csv [--masks-dir DIR] [--workers N]
+                         [--batch-size N] [--backend keras|tflite] [--quantize MODE]
+
+INPUT is a directory (searched recursively for images) or a manifest file with one
+image path per line. Images are decoded and preprocessed in a process pool and fed to
+the models in batches. Results are written one row per image (class, confidence, mask
+area and per-stage timings) to a CSV, or to Parquet when the output ends in .parquet
+and pyarrow is installed.
+
+Rows are appended to OUTPUT.partial.csv after every batch; rerunning the same command
+after an interruption skips the images already scored and retries the ones that failed.
+"""
+import argparse
+import csv
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from preprocessing import StageTimer, prepare
+from runtime import INFERENCE_BACKENDS, QUANTIZATION_MODES, load_runners
+from uploads import chunked, is_image_name
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+MODELS_DIR = os.path.join(current_dir, 'models')
+SEGMENTATION_MODEL_PATH = os.path.join(MODELS_DIR, 'new_segmentation_model.h5')
+CLASSIFICATION_MODEL_PATH = os.path.join(MODELS_DIR, 'new_classification_model.h5')
+
+class_names = ['Glioma', 'Meningioma', 'Pituitary', 'No Tumour']
+
+COLUMNS = [
+    'path', 'class', 'confidence', 'mask_area', 'mask_fraction',
+    'decode_ms', 'resize_ms', 'normalize_ms', 'segmentation_ms', 'classification_ms', 'error'
+]
+
+
+def list_inputs(source):
+    if os.path.isdir(source):
+        paths = []
+        for root, _, files in os.walk(source):
+            paths.extend(os.path.join(root, name) for name in files if is_image_name(name))
+        return sorted(paths)
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, 'r') as f:
+        lines = [line.strip() for line in f]
+    return [line if os.path.isabs(line) else os.path.join(base, line) for line in lines if line and not line.startswith('#')]
+
+
+def load_checkpoint(journal_path):
+    """Paths already scored successfully; failed rows are dropped from the journal so they are retried."""
+    if not os.path.exists(journal_path):
+        return set()
+    done = set()
+    dropped = 0
+    tmp_path = journal_path + '.tmp'
+    with open(journal_path, 'r', newline='') as f, open(tmp_path, 'w', newline='') as tmp:
+        writer = csv.DictWriter(tmp, fieldnames=COLUMNS)
+        writer.writeheader()
+        for row in csv.DictReader(f):
+            if row.get('error'):
+                dropped += 1
+                continue
+            writer.writerow(row)
+            done.add(row['path'])
+    if dropped:
+        os.replace(tmp_path, journal_path)
+    else:
+        os.remove(tmp_path)
+    return done
+
+
+def _prepare_path(path):
+    # Runs in a worker process; only plain arrays and dicts travel back
+    timer = StageTimer()
+    try:
+        with open(path, 'rb') as f:
+            prepared = prepare(f.read(), timer)
+        return path, prepared.segmentation, prepared.classification, timer.as_dict(), None
+    except Exception as e:
+        return path, None, None, timer.as_dict(), str(e)
+
+
+def prefetch(pool, items, depth, fn=_prepare_path):
+    # Keep at most ``depth`` images in flight so memory stays flat on huge datasets
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= depth:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def mask_file_name(path, root):
+    relative = os.path.relpath(path, root) if root else os.path.basename(path)
+    stem, _ = os.path.splitext(relative)
+    return stem.replace(os.sep, '__') + '_mask.png'
+
+
+def score_batch(batch, segmentation_runner, classification_runner, masks_dir, root):
+    rows = []
+    ok = [item for item in batch if item[4] is None]
+    for path, _, _, timings, error in batch:
+        if error is not None:
+            rows.append({'path': path, 'error': error, **{f"{k}_ms": v for k, v in timings.items()}})
+    if not ok:
+        return rows
+
+    start = time.perf_counter()
+    masks = segmentation_runner(np.stack([item[1] for item in ok])) > 0.5
+    seg_ms = (time.perf_counter() - start) * 1000.0 / len(ok)
+    start = time.perf_counter()
+    probs = classification_runner(np.stack([item[2] for item in ok]))
+    cls_ms = (time.perf_counter() - start) * 1000.0 / len(ok)
+
+    areas = np.count_nonzero(masks.reshape(len(ok), -1), axis=1)
+    class_idx = np.argmax(probs, axis=1)
+    confidences = probs[np.arange(len(ok)), class_idx]
+    pixels = masks[0].size
+
+    for i, (path, _, _, timings, _) in enumerate(ok):
+        if masks_dir:
+            mask = masks[i].squeeze().astype(np.uint8) * 255
+            Image.fromarray(mask, mode='L').save(os.path.join(masks_dir, mask_file_name(path, root)))
+        rows.append({
+            'path': path,
+            'class': class_names[class_idx[i]],
+            'confidence': round(float(confidences[i]), 6),
+            'mask_area': int(areas[i]),
+            'mask_fraction': round(float(areas[i]) / pixels, 6),
+            'decode_ms': timings.get('decode'),
+            'resize_ms': timings.get('resize'),
+            'normalize_ms': timings.get('normalize'),
+            'segmentation_ms': round(seg_ms, 3),
+            'classification_ms': round(cls_ms, 3),
+            'error': None
+        })
+    return rows
+
+
+def write_output(journal_path, output_path):
+    if output_path.endswith('.parquet'):
+        try:
+            import pyarrow.csv as pa_csv
+            import pyarrow.parquet as pq
+        except ImportError:
+            print("pyarrow is not installed, writing CSV instead")
+            output_path = os.path.splitext(output_path)[0] + '.csv'
+        else:
+            pq.write_table(pa_csv.read_csv(journal_path), output_path)
+            os.remove(journal_path)
+            return output_path
+    os.replace(journal_path, output_path)
+    return output_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', help='image directory or manifest file')
+    parser.add_argument('--output', default='results.csv')
+    parser.add_argument('--masks-dir', help='also save the thresholded masks as PNGs here')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--backend', choices=INFERENCE_BACKENDS, default='keras')
+    parser.add_argument('--quantize', choices=QUANTIZATION_MODES, default='none')
+    args = parser.parse_args(argv)
+
+    paths = list_inputs(args.input)
+    journal_path = args.output + '.partial.csv'
+    done = load_checkpoint(journal_path)
+    todo = [path for path in paths if path not in done]
+    print(f"{len(paths)} images found, {len(done)} already scored, {len(todo)} to go")
+
+    root = args.input if os.path.isdir(args.input) else None
+    if args.masks_dir:
+        os.makedirs(args.masks_dir, exist_ok=True)
+
+    segmentation_runner, classification_runner = load_runners(
+        args.backend, SEGMENTATION_MODEL_PATH, CLASSIFICATION_MODEL_PATH, args.quantize
+    )
+
+    started = time.perf_counter()
+    scored = 0
+    new_journal = not os.path.exists(journal_path)
+    # 'spawn' so the workers don't inherit a forked copy of the TensorFlow runtime
+    pool = ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context('spawn'))
+    with open(journal_path, 'a', newline='') as journal, pool:
+        writer = csv.DictWriter(journal, fieldnames=COLUMNS)
+        if new_journal:
+            writer.writeheader()
+        prepared = prefetch(pool, todo, depth=2 * args.batch_size)
+        for batch in chunked(prepared, args.batch_size):
+            writer.writerows(score_batch(batch, segmentation_runner, classification_runner, args.masks_dir, root))
+            journal.flush()
+            scored += len(batch)
+            elapsed = time.perf_counter() - started
+            print(f"\r{scored}/{len(todo)} images, {scored / elapsed:.1f} images/s", end='', flush=True)
+    print()
+
+    elapsed = time.perf_counter() - started
+    output_path = write_output(journal_path, args.output)
+    rate = scored / elapsed if elapsed > 0 else 0.0
+    print(f"Scored {scored} images in {elapsed:.1f}s ({rate:.1f} images/s), results in {output_path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,51 @@
+import threading
+
+import numpy as np
+
+
+class CascadePolicy:
+    """Classifier-first cascade: decides per image whether segmentation has to run.
+
+    Segmentation is skipped only when the classifier predicts one of ``skip_classes``
+    (``'No Tumour'``) with confidence at or above ``threshold``; tumor predictions and
+    uncertain ones are always segmented. With ``enabled=False`` every image is
+    segmented. Callers report what actually ran with ``record()``.
+    """
+
+    def __init__(self, class_names, enabled=False, threshold=0.9, skip_classes=('No Tumour',)):
+        self.class_names = list(class_names)
+        self.enabled = enabled
+        self.threshold = float(threshold)
+        self.skip_indices = {self.class_names.index(name) for name in skip_classes}
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._skipped = 0
+
+    def needs_segmentation(self, pred):
+        pred = np.asarray(pred).reshape(-1)
+        class_idx = int(np.argmax(pred))
+        return not (self.enabled and class_idx in self.skip_indices and pred[class_idx] >= self.threshold)
+
+    def record(self, segmented):
+        with self._lock:
+            self._requests += 1
+            self._skipped += not segmented
+
+    def stages(self, segmented):
+        return ['classification', 'segmentation'] if segmented else ['classification']
+
+    def stats(self, segmentation_ms=None):
+        """Counters; pass the typical per-image segmentation time to estimate the compute saved."""
+        with self._lock:
+            requests, skipped = self._requests, self._skipped
+        stats = {
+            'enabled': self.enabled,
+            'threshold': self.threshold,
+            'requests': requests,
+            'segmentation_runs': requests - skipped,
+            'segmentation_skipped': skipped,
+            'skip_rate': round(skipped / requests, 4) if requests else 0.0
+        }
+        if segmentation_ms is not None:
+            stats['segmentation_ms_saved_estimate'] = round(skipped * segmentation_ms, 3)
+        return stats
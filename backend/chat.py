@@ -0,0 +1,223 @@
+"""Chat completions for the scan assistant: shared client, answer cache and token streaming.
+
+One OpenAI client is created per process with a pooled HTTP connection and
+explicit timeouts, instead of a fresh connection per message. Answers are cached
+for ``ttl`` seconds keyed on the normalized question plus the scan details, and
+``stream_reply`` yields the answer as it is generated so ``/chat`` can forward
+tokens as server-sent events.
+
+``python chat.py --stub-server`` starts a local OpenAI-compatible completions server
+that streams a canned reply, for exercising the endpoint without an API key:
+
+    python chat.py --stub-server --port 8090 --delay-ms 30
+    OPENAI_API_KEY=stub OPENAI_BASE_URL=http://localhost:8090/v1 python app.py
+"""
+import hashlib
+import json
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+CHAT_MODEL = 'gpt-3.5-turbo'
+
+SYSTEM_PROMPT = """You are a helpful medical imaging AI assistant. You help users understand their brain scan analysis
+results and provide general information about brain tumors. Always be professional, empathetic, and clear in your responses.
+Do not make definitive medical diagnoses - always remind users to consult healthcare professionals for medical advice."""
+
+# What /chat asks of the model, sent together with the scan details
+CHAT_INSTRUCTIONS = "Provide clear, empathetic responses about the scan results. Always include appropriate medical disclaimers."
+
+
+def scan_summary(scan_details):
+    """System message describing the scan the user is asking about."""
+    confidence = scan_details.get('confidence')
+    lines = [f"- Tumor Type: {scan_details.get('tumorType')}"]
+    if isinstance(confidence, (int, float)):
+        lines.append(f"- Confidence: {confidence * 100:.1f}%")
+    lines.append(f"- Status: {'Tumor detected' if scan_details.get('hasTumor') else 'No tumor detected'}")
+    extra = {k: v for k, v in scan_details.items() if k not in ('tumorType', 'confidence', 'hasTumor')}
+    if extra:
+        lines.append(f"- Other details: {json.dumps(extra, sort_keys=True)}")
+    return "Current scan details:\n" + "\n".join(lines)
+
+
+def build_messages(message, scan_details=None):
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    if scan_details:
+        messages.append({"role": "system", "content": scan_summary(scan_details)})
+    messages.append({"role": "user", "content": message})
+    return messages
+
+
+def build_chat_messages(message, scan_details=None):
+    """Messages for ``/chat``: one system message with the scan details and the disclaimer instruction."""
+    system = (f"You are a helpful medical imaging AI assistant. {scan_summary(scan_details or {})}\n\n"
+              f"{CHAT_INSTRUCTIONS}")
+    return [{"role": "system", "content": system}, {"role": "user", "content": message}]
+
+
+def normalize_message(message):
+    """Lowercased, whitespace-collapsed question without trailing punctuation."""
+    return re.sub(r'\s+', ' ', (message or '').strip().lower()).rstrip('?!. ')
+
+
+class ChatCache:
+    """TTL- and size-bounded LRU of finished answers."""
+
+    def __init__(self, ttl=600, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'expired': 0, 'stores': 0}
+
+    @staticmethod
+    def make_key(messages, model=CHAT_MODEL):
+        """Key on the whole prompt, so each endpoint's instructions get their own answers."""
+        parts = [normalize_message(m['content']) if m['role'] == 'user' else m['content'] for m in messages]
+        return hashlib.sha256(json.dumps([model] + parts).encode()).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, answer = entry
+                if expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self._counters['hits'] += 1
+                    return answer
+                del self._entries[key]
+                self._counters['expired'] += 1
+            self._counters['misses'] += 1
+            return None
+
+    def put(self, key, answer):
+        if self.ttl <= 0 or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, answer)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._counters['stores'] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters, entries=len(self._entries), ttl_seconds=self.ttl)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else None
+        return stats
+
+
+def make_client(api_key, base_url=None, timeout=30.0, connect_timeout=5.0, max_connections=20, max_retries=1):
+    """OpenAI client over one pooled keep-alive HTTP connection pool, shared by every request."""
+    import httpx
+    from openai import OpenAI
+
+    http_client = httpx.Client(
+        timeout=httpx.Timeout(timeout, connect=connect_timeout),
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+    )
+    return OpenAI(api_key=api_key, base_url=base_url or None, http_client=http_client, max_retries=max_retries)
+
+
+def stream_reply(client, messages, model=CHAT_MODEL, max_tokens=150, temperature=0.7):
+    """Yield the reply's text deltas as the model produces them."""
+    stream = client.chat.completions.create(
+        model=model,
+        messages=messages,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        stream=True
+    )
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+def sse_event(event, data):
+    """One server-sent event; ``data`` is sent as JSON so newlines in tokens survive."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+STUB_REPLY = (
+    "Thanks for your question. Based on the scan details provided, the analysis is an automated "
+    "estimate only. Please discuss these results with your doctor, who can review the full images "
+    "and your medical history before drawing any conclusions."
+)
+
+
+def run_stub_server(port=8090, delay_ms=20.0, reply=STUB_REPLY):
+    """Serve an OpenAI-compatible ``POST /v1/chat/completions`` that replies with ``reply`` word by word."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_POST(self):
+            if not self.path.rstrip('/').endswith('/chat/completions'):
+                self.send_error(404)
+                return
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            words = reply.split(' ')[:int(body.get('max_tokens') or 150)]
+            created = int(time.time())
+            base = {'id': 'chatcmpl-stub', 'created': created, 'model': body.get('model', CHAT_MODEL)}
+
+            if not body.get('stream'):
+                time.sleep(delay_ms * len(words) / 1000.0)
+                payload = json.dumps(dict(base, object='chat.completion', choices=[{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': ' '.join(words)},
+                    'finish_reason': 'stop'
+                }])).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+                return
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+
+            def send(data):
+                line = f"data: {data}\n\n".encode()
+                self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+                self.wfile.flush()
+
+            for i, word in enumerate(words):
+                time.sleep(delay_ms / 1000.0)
+                delta = {'content': word if i == 0 else ' ' + word}
+                if i == 0:
+                    delta['role'] = 'assistant'
+                send(json.dumps(dict(base, object='chat.completion.chunk', choices=[
+                    {'index': 0, 'delta': delta, 'finish_reason': None}
+                ])))
+            send(json.dumps(dict(base, object='chat.completion.chunk', choices=[
+                {'index': 0, 'delta': {}, 'finish_reason': 'stop'}
+            ])))
+            send('[DONE]')
+            self.wfile.write(b"0\r\n\r\n")
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    print(f"Stub chat completions server on http://127.0.0.1:{port}/v1 ({delay_ms}ms per token)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    if '--stub-server' in sys.argv:
+        port = int(sys.argv[sys.argv.index('--port') + 1]) if '--port' in sys.argv else 8090
+        delay = float(sys.argv[sys.argv.index('--delay-ms') + 1]) if '--delay-ms' in sys.argv else 20.0
+        run_stub_server(port, delay)
+    else:
+        print(__doc__)
@@ -0,0 +1,388 @@
+"""Evaluate model versions against a labelled dataset, without the HTTP server.
+
+Usage:
+    python evaluate.py DATASET [--output summary.json] [--per-image images.csv]
+                       [--segmentation-model PATH] [--classification-model PATH]
+                       [--candidate-segmentation PATH] [--candidate-classification PATH]
+                       [--workers N] [--batch-size N] [--threshold 0.5]
+                       [--backend keras|tflite] [--quantize MODE]
+
+DATASET is either a CSV manifest with an ``image`` column and optional ``mask`` and
+``label`` columns (paths relative to the manifest), or a directory. In a directory the
+label is taken from the parent folder name (e.g. ``glioma/``, ``notumor/``) and the
+ground-truth mask from a sibling ``<name>_mask.<ext>`` file when there is one.
+
+Images and masks are decoded in a process pool and streamed through the models in
+batches. Dice, IoU and the classifier's confusion matrix are computed per batch with
+vectorized NumPy, so only a few numbers per image are kept in memory. Passing a
+``--candidate-*`` model evaluates it on the same batches in the same pass and adds a
+paired comparison against the baseline.
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from bulk_score import CLASSIFICATION_MODEL_PATH, SEGMENTATION_MODEL_PATH, class_names, prefetch
+from preprocessing import SEGMENTATION_SIZE, prepare
+from runtime import INFERENCE_BACKENDS, QUANTIZATION_MODES, load_runners
+from uploads import chunked, is_image_name
+
+SMOOTH = 1e-6
+
+
+def _key(name):
+    return re.sub('[^a-z]', '', name.lower())
+
+
+def label_index(name):
+    """Class index for a label or folder name ('glioma_tumor', 'notumor', 'No Tumour', ...), or None."""
+    key = _key(name or '')
+    if not key:
+        return None
+    for i, class_name in enumerate(class_names):
+        # Six letters tell the classes apart and absorb 'tumor'/'tumour' spellings
+        if key.startswith(_key(class_name)[:6]):
+            return i
+    return None
+
+
+def list_pairs(source):
+    """[(image path, mask path or None, label index or None)] for a manifest or directory."""
+    if os.path.isdir(source):
+        pairs = []
+        for root, _, files in os.walk(source):
+            stems = {os.path.splitext(name)[0]: name for name in files if is_image_name(name)}
+            label = label_index(os.path.basename(root))
+            for stem, name in sorted(stems.items()):
+                if stem.endswith('_mask'):
+                    continue
+                mask = stems.get(stem + '_mask')
+                pairs.append((os.path.join(root, name), mask and os.path.join(root, mask), label))
+        return sorted(pairs, key=lambda pair: pair[0])
+
+    base = os.path.dirname(os.path.abspath(source))
+
+    def resolve(path):
+        return path if not path or os.path.isabs(path) else os.path.join(base, path)
+
+    with open(source, 'r', newline='') as f:
+        rows = list(csv.DictReader(f))
+    if rows and 'image' not in rows[0]:
+        raise ValueError(f"{source} has no 'image' column")
+    return [
+        (resolve(row['image']), resolve(row.get('mask') or None), label_index(row.get('label')))
+        for row in rows if row.get('image')
+    ]
+
+
+def load_mask(path):
+    """Ground-truth mask as a (128, 128) bool array, resized with nearest neighbour so it stays binary."""
+    with Image.open(path) as image:
+        return np.asarray(image.convert('L').resize(SEGMENTATION_SIZE, Image.NEAREST)) > 127
+
+
+def _prepare_pair(pair):
+    # Runs in a worker process; only plain arrays travel back
+    image_path, mask_path, _ = pair
+    try:
+        with open(image_path, 'rb') as f:
+            prepared = prepare(f.read())
+        mask = load_mask(mask_path) if mask_path else None
+        return pair, prepared.segmentation, prepared.classification, mask, None
+    except Exception as e:
+        return pair, None, None, None, str(e)
+
+
+def segmentation_scores(pred, true, smooth=SMOOTH):
+    """Per-image overlap counts and Dice / IoU for two (N, ...) stacks of binary masks.
+
+    Same formulas as the training metrics in mri_service, applied to thresholded
+    masks: an image where both masks are empty scores 1.
+    """
+    pred = pred.reshape(len(pred), -1)
+    true = true.reshape(len(true), -1)
+    intersection = np.count_nonzero(pred & true, axis=1)
+    pred_sum = np.count_nonzero(pred, axis=1)
+    true_sum = np.count_nonzero(true, axis=1)
+    union = pred_sum + true_sum - intersection
+    return {
+        'intersection': intersection,
+        'pred': pred_sum,
+        'true': true_sum,
+        'dice': (2.0 * intersection + smooth) / (pred_sum + true_sum + smooth),
+        'iou': (intersection + smooth) / (union + smooth)
+    }
+
+
+def confusion_matrix(true, pred, num_classes):
+    """(K, K) counts with true classes as rows, from two integer label arrays."""
+    return np.bincount(true * num_classes + pred, minlength=num_classes * num_classes).reshape(num_classes, num_classes)
+
+
+def classification_report(matrix, names):
+    """Accuracy, macro F1 and per-class precision / recall / F1 / support from a confusion matrix."""
+    matrix = np.asarray(matrix, dtype=np.float64)
+    tp = np.diag(matrix)
+    support = matrix.sum(axis=1)
+    predicted = matrix.sum(axis=0)
+    precision = np.divide(tp, predicted, out=np.zeros_like(tp), where=predicted > 0)
+    recall = np.divide(tp, support, out=np.zeros_like(tp), where=support > 0)
+    f1 = np.divide(2 * precision * recall, precision + recall, out=np.zeros_like(tp), where=precision + recall > 0)
+    total = matrix.sum()
+    present = support > 0
+    return {
+        'images': int(total),
+        'accuracy': round(float(tp.sum() / total), 4) if total else None,
+        'macro_f1': round(float(f1[present].mean()), 4) if present.any() else None,
+        'per_class': {
+            name: {
+                'precision': round(float(precision[i]), 4),
+                'recall': round(float(recall[i]), 4),
+                'f1': round(float(f1[i]), 4),
+                'support': int(support[i])
+            }
+            for i, name in enumerate(names)
+        },
+        'confusion_matrix': matrix.astype(int).tolist()
+    }
+
+
+class Evaluation:
+    """Running per-image scores and confusion matrix for one (segmentation, classification) model pair."""
+
+    def __init__(self, name, segmentation_runner, classification_runner, threshold=0.5):
+        self.name = name
+        self.segmentation_runner = segmentation_runner
+        self.classification_runner = classification_runner
+        self.threshold = threshold
+        self.matrix = np.zeros((len(class_names), len(class_names)), dtype=np.int64)
+        self.scores = {key: [] for key in ('intersection', 'pred', 'true', 'dice', 'iou')}
+        self.model_ms = 0.0
+
+    def update(self, segmentation, classification, masks, has_mask, labels, has_label):
+        """Score one batch; returns (class indices, confidences, dice, iou) with NaN where there is no mask."""
+        start = time.perf_counter()
+        pred_masks = np.asarray(self.segmentation_runner(segmentation))[..., 0] > self.threshold
+        probs = np.asarray(self.classification_runner(classification))
+        self.model_ms += (time.perf_counter() - start) * 1000.0
+
+        class_idx = np.argmax(probs, axis=1)
+        confidences = probs[np.arange(len(probs)), class_idx]
+        self.matrix += confusion_matrix(labels[has_label], class_idx[has_label], len(class_names))
+
+        dice = np.full(len(probs), np.nan)
+        iou = np.full(len(probs), np.nan)
+        if has_mask.any():
+            scores = segmentation_scores(pred_masks[has_mask], masks[has_mask])
+            for key, values in scores.items():
+                self.scores[key].append(values)
+            dice[has_mask] = scores['dice']
+            iou[has_mask] = scores['iou']
+        return class_idx, confidences, dice, iou
+
+    def summary(self):
+        scores = {key: np.concatenate(values) if values else np.zeros(0) for key, values in self.scores.items()}
+        segmentation = {'images': int(len(scores['dice']))}
+        if len(scores['dice']):
+            intersection, pred, true = (int(scores[key].sum()) for key in ('intersection', 'pred', 'true'))
+            segmentation.update({
+                'dice_mean': round(float(scores['dice'].mean()), 4),
+                'dice_median': round(float(np.median(scores['dice'])), 4),
+                'dice_p10': round(float(np.percentile(scores['dice'], 10)), 4),
+                'iou_mean': round(float(scores['iou'].mean()), 4),
+                'iou_median': round(float(np.median(scores['iou'])), 4),
+                # Pixel-level scores over the whole set, so large tumours weigh more
+                'dice_global': round((2.0 * intersection + SMOOTH) / (pred + true + SMOOTH), 4),
+                'iou_global': round((intersection + SMOOTH) / (pred + true - intersection + SMOOTH), 4)
+            })
+        return {
+            'segmentation': segmentation,
+            'classification': classification_report(self.matrix, class_names),
+            'model_ms': round(self.model_ms, 1)
+        }
+
+
+def paired_comparison(baseline_rows, candidate_rows, labels, has_label):
+    """Per-image wins and losses of the candidate over the baseline, on the same images."""
+    base_dice, cand_dice = (np.concatenate([rows[2] for rows in r]) for r in (baseline_rows, candidate_rows))
+    base_cls, cand_cls = (np.concatenate([rows[0] for rows in r]) for r in (baseline_rows, candidate_rows))
+    scored = ~np.isnan(base_dice)
+    delta = cand_dice[scored] - base_dice[scored]
+    base_ok = base_cls[has_label] == labels[has_label]
+    cand_ok = cand_cls[has_label] == labels[has_label]
+    return {
+        'segmentation': {
+            'images': int(scored.sum()),
+            'dice_delta_mean': round(float(delta.mean()), 4) if len(delta) else None,
+            'candidate_better': int(np.count_nonzero(delta > 1e-4)),
+            'candidate_worse': int(np.count_nonzero(delta < -1e-4))
+        },
+        'classification': {
+            'images': int(has_label.sum()),
+            'both_correct': int(np.count_nonzero(base_ok & cand_ok)),
+            'only_baseline_correct': int(np.count_nonzero(base_ok & ~cand_ok)),
+            'only_candidate_correct': int(np.count_nonzero(~base_ok & cand_ok)),
+            'both_wrong': int(np.count_nonzero(~base_ok & ~cand_ok)),
+            'prediction_agreement': round(float(np.mean(base_cls == cand_cls)), 4) if len(base_cls) else None
+        }
+    }
+
+
+def _round(value):
+    return None if np.isnan(value) else round(float(value), 4)
+
+
+def print_summary(summaries):
+    names = list(summaries)
+    print(f"\n{'metric':<24}" + ''.join(f"{name:>12}" for name in names))
+    rows = [('dice_mean', 'segmentation'), ('dice_global', 'segmentation'), ('iou_mean', 'segmentation'),
+            ('iou_global', 'segmentation'), ('accuracy', 'classification'), ('macro_f1', 'classification')]
+    for metric, section in rows:
+        values = [summaries[name][section].get(metric) for name in names]
+        print(f"{metric:<24}" + ''.join(f"{'-' if v is None else f'{v:.4f}':>12}" for v in values))
+    for class_name in class_names:
+        values = [summaries[name]['classification']['per_class'][class_name]['f1'] for name in names]
+        print(f"{'f1 ' + class_name:<24}" + ''.join(f"{v:>12.4f}" for v in values))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('dataset', help='CSV manifest or labelled image directory')
+    parser.add_argument('--output', default='evaluation.json', help='summary JSON')
+    parser.add_argument('--per-image', help='also write per-image predictions and scores to this CSV')
+    parser.add_argument('--segmentation-model', default=SEGMENTATION_MODEL_PATH)
+    parser.add_argument('--classification-model', default=CLASSIFICATION_MODEL_PATH)
+    parser.add_argument('--candidate-segmentation', help='second segmentation model to compare')
+    parser.add_argument('--candidate-classification', help='second classification model to compare')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--threshold', type=float, default=0.5)
+    parser.add_argument('--backend', choices=INFERENCE_BACKENDS, default='keras')
+    parser.add_argument('--quantize', choices=QUANTIZATION_MODES, default='none')
+    args = parser.parse_args(argv)
+
+    pairs = list_pairs(args.dataset)
+    with_masks = sum(mask is not None for _, mask, _ in pairs)
+    with_labels = sum(label is not None for _, _, label in pairs)
+    print(f"{len(pairs)} images, {with_masks} with masks, {with_labels} with labels")
+    if not pairs:
+        return 1
+
+    evaluations = [Evaluation('baseline', *load_runners(
+        args.backend, args.segmentation_model, args.classification_model, args.quantize
+    ), threshold=args.threshold)]
+    if args.candidate_segmentation or args.candidate_classification:
+        evaluations.append(Evaluation('candidate', *load_runners(
+            args.backend,
+            args.candidate_segmentation or args.segmentation_model,
+            args.candidate_classification or args.classification_model,
+            args.quantize
+        ), threshold=args.threshold))
+
+    per_image = None
+    if args.per_image:
+        per_image = open(args.per_image, 'w', newline='')
+        columns = ['image', 'mask', 'label'] + [
+            f"{evaluation.name}_{field}" for evaluation in evaluations
+            for field in ('class', 'confidence', 'dice', 'iou')
+        ]
+        writer = csv.DictWriter(per_image, fieldnames=columns + ['error'])
+        writer.writeheader()
+
+    rows = {evaluation.name: [] for evaluation in evaluations}
+    all_labels, all_has_label = [], []
+    errors = 0
+    scored = 0
+    started = time.perf_counter()
+    # 'spawn' so the workers don't inherit a forked copy of the TensorFlow runtime
+    pool = ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context('spawn'))
+    with pool:
+        prepared = prefetch(pool, pairs, depth=2 * args.batch_size, fn=_prepare_pair)
+        for batch in chunked(prepared, args.batch_size):
+            failed = [item for item in batch if item[4] is not None]
+            ok = [item for item in batch if item[4] is None]
+            errors += len(failed)
+            scored += len(batch)
+            if per_image:
+                for (image_path, mask_path, label), _, _, _, error in failed:
+                    writer.writerow({'image': image_path, 'mask': mask_path, 'error': error})
+            if not ok:
+                continue
+
+            segmentation = np.stack([item[1] for item in ok])
+            classification = np.stack([item[2] for item in ok])
+            has_mask = np.array([item[3] is not None for item in ok])
+            masks = np.zeros((len(ok),) + segmentation.shape[1:3], dtype=bool)
+            for i, item in enumerate(ok):
+                if item[3] is not None:
+                    masks[i] = item[3]
+            has_label = np.array([item[0][2] is not None for item in ok])
+            labels = np.array([item[0][2] if item[0][2] is not None else -1 for item in ok])
+            all_labels.append(labels)
+            all_has_label.append(has_label)
+
+            results = {}
+            for evaluation in evaluations:
+                results[evaluation.name] = evaluation.update(
+                    segmentation, classification, masks, has_mask, labels, has_label
+                )
+                rows[evaluation.name].append(results[evaluation.name])
+
+            if per_image:
+                for i, ((image_path, mask_path, label), _, _, _, _) in enumerate(ok):
+                    row = {'image': image_path, 'mask': mask_path, 'label': None if label is None else class_names[label]}
+                    for name, (class_idx, confidences, dice, iou) in results.items():
+                        row[f"{name}_class"] = class_names[class_idx[i]]
+                        row[f"{name}_confidence"] = round(float(confidences[i]), 6)
+                        row[f"{name}_dice"] = _round(dice[i])
+                        row[f"{name}_iou"] = _round(iou[i])
+                    writer.writerow(row)
+
+            elapsed = time.perf_counter() - started
+            print(f"\r{scored}/{len(pairs)} images, {scored / elapsed:.1f} images/s", end='', flush=True)
+    print()
+    if per_image:
+        per_image.close()
+
+    summaries = {evaluation.name: evaluation.summary() for evaluation in evaluations}
+    report = {
+        'dataset': os.path.abspath(args.dataset),
+        'images': len(pairs),
+        'errors': errors,
+        'threshold': args.threshold,
+        'backend': args.backend,
+        'models': {
+            'baseline': {'segmentation': args.segmentation_model, 'classification': args.classification_model}
+        },
+        'results': summaries,
+        'seconds': round(time.perf_counter() - started, 1)
+    }
+    if len(evaluations) > 1:
+        report['models']['candidate'] = {
+            'segmentation': args.candidate_segmentation or args.segmentation_model,
+            'classification': args.candidate_classification or args.classification_model
+        }
+        if all_labels:
+            labels, has_label = np.concatenate(all_labels), np.concatenate(all_has_label)
+            report['comparison'] = paired_comparison(rows['baseline'], rows['candidate'], labels, has_label)
+
+    print_summary(summaries)
+    if 'comparison' in report:
+        print(f"\nCandidate vs baseline: {json.dumps(report['comparison'])}")
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nEvaluated {scored} images ({errors} unreadable), summary in {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
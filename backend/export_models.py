@@ -0,0 +1,114 @@
+"""Export the Keras models in models/ to TensorFlow Lite for the lightweight serving backend.
+
+Usage:
+    python export_models.py [--quantize none|float16|int8] [--calibration-dir DIR]
+                            [--num-calibration N] [--skip-parity]
+
+INT8 post-training quantization is calibrated on the images in --calibration-dir
+(backend/data/uploads by default). After exporting, the new files are compared
+against the Keras models on the same images and the parity report is printed.
+Serve the exported models with INFERENCE_BACKEND=tflite TFLITE_QUANTIZATION=<mode>.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+
+import numpy as np
+import tensorflow as tf
+
+from inference import CompiledModel, SEGMENTATION_INPUT_SHAPE, CLASSIFICATION_INPUT_SHAPE
+from runtime import QUANTIZATION_MODES, TFLiteModel, parity_check, tflite_model_path
+from preprocessing import prepare_batch
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+MODELS_DIR = os.path.join(current_dir, 'models')
+SEGMENTATION_MODEL_PATH = os.path.join(MODELS_DIR, 'new_segmentation_model.h5')
+CLASSIFICATION_MODEL_PATH = os.path.join(MODELS_DIR, 'new_classification_model.h5')
+DEFAULT_CALIBRATION_DIR = os.path.join(current_dir, 'data', 'uploads')
+
+IMAGE_EXTENSIONS = ('*.jpg', '*.jpeg', '*.png', '*.bmp', '*.tif', '*.tiff')
+
+
+def load_calibration_inputs(directory, limit):
+    paths = []
+    for pattern in IMAGE_EXTENSIONS:
+        paths.extend(glob.glob(os.path.join(directory, '**', pattern), recursive=True))
+    paths = sorted(paths)[:limit]
+    if not paths:
+        print(f"Warning: no calibration images found in {directory}, using random images instead")
+        rng = np.random.default_rng(0)
+        return (
+            rng.random((limit,) + SEGMENTATION_INPUT_SHAPE, dtype=np.float32),
+            rng.random((limit,) + CLASSIFICATION_INPUT_SHAPE, dtype=np.float32)
+        )
+    print(f"Using {len(paths)} calibration images from {directory}")
+    items = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            items.append(f.read())
+    # Same preprocessing as analyze()
+    _, seg_inputs, cls_inputs = prepare_batch(items)
+    return seg_inputs, cls_inputs
+
+
+def convert(model, quantization, representative_inputs):
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if quantization == 'float16':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization == 'int8':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = lambda: ([sample[None]] for sample in representative_inputs)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    return converter.convert()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--quantize', choices=QUANTIZATION_MODES, default='none')
+    parser.add_argument('--calibration-dir', default=DEFAULT_CALIBRATION_DIR)
+    parser.add_argument('--num-calibration', type=int, default=100)
+    parser.add_argument('--skip-parity', action='store_true')
+    args = parser.parse_args(argv)
+
+    print("Loading Keras models...")
+    segmentation_model = tf.keras.models.load_model(SEGMENTATION_MODEL_PATH, compile=False)
+    classification_model = tf.keras.models.load_model(CLASSIFICATION_MODEL_PATH, compile=False)
+
+    seg_inputs, cls_inputs = load_calibration_inputs(args.calibration_dir, args.num_calibration)
+
+    exported = {}
+    for name, model, keras_path, inputs in (
+        ('segmentation', segmentation_model, SEGMENTATION_MODEL_PATH, seg_inputs),
+        ('classification', classification_model, CLASSIFICATION_MODEL_PATH, cls_inputs),
+    ):
+        output_path = tflite_model_path(keras_path, args.quantize)
+        print(f"Converting {name} model ({args.quantize})...")
+        with open(output_path, 'wb') as f:
+            f.write(convert(model, args.quantize, inputs))
+        exported[name] = output_path
+        print(f"Wrote {output_path}: {os.path.getsize(keras_path) / 1e6:.1f} MB -> "
+              f"{os.path.getsize(output_path) / 1e6:.1f} MB")
+
+    if args.skip_parity:
+        return 0
+
+    print("Checking parity against the Keras models...")
+    reference = (
+        CompiledModel(segmentation_model, SEGMENTATION_INPUT_SHAPE, name='segmentation'),
+        CompiledModel(classification_model, CLASSIFICATION_INPUT_SHAPE, name='classification')
+    )
+    candidate = (
+        TFLiteModel(exported['segmentation'], name='segmentation'),
+        TFLiteModel(exported['classification'], name='classification')
+    )
+    report = parity_check(reference, candidate, seg_inputs, cls_inputs)
+    report['quantization'] = args.quantize
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
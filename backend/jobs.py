@@ -0,0 +1,304 @@
+"""Durable local job queue for asynchronous analysis.
+
+Jobs live in a SQLite table (WAL mode), so queued scans survive a restart and
+every gunicorn worker can submit to and drain the same queue without a broker.
+Uploads are stored with the job and dropped once it finishes. Workers claim the
+oldest job of the most urgent lane inside a ``BEGIN IMMEDIATE`` transaction, so
+two workers never take the same job.
+
+Lanes, most urgent first: ``urgent`` (clinical), ``normal``, ``bulk`` (research).
+"""
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+LANES = ('urgent', 'normal', 'bulk')
+TERMINAL_STATUSES = ('done', 'failed')
+
+# A job that was running in a crashed process this many times is failed, not retried
+MAX_ATTEMPTS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    lane INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    submitted_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    worker TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    params TEXT NOT NULL,
+    payload BLOB,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_by_lane ON jobs (status, lane, submitted_at);
+"""
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobQueue:
+    """SQLite-backed priority queue of analysis jobs, with one connection per thread."""
+
+    def __init__(self, path):
+        self.path = path
+        self.worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+        self._local = threading.local()
+        # Wakes idle workers on submit and long-polling readers on completion in this process;
+        # other processes' changes are picked up by polling
+        self._changed = threading.Condition()
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def notify(self):
+        with self._changed:
+            self._changed.notify_all()
+
+    def wait_for_change(self, timeout):
+        with self._changed:
+            self._changed.wait(timeout)
+
+    @staticmethod
+    def _row_to_job(row):
+        job = {
+            'id': row['id'],
+            'lane': LANES[row['lane']],
+            'status': row['status'],
+            'submitted_at': row['submitted_at'],
+            'started_at': row['started_at'],
+            'finished_at': row['finished_at'],
+            'attempts': row['attempts'],
+            'params': json.loads(row['params']),
+            'error': row['error']
+        }
+        if row['result'] is not None:
+            job['result'] = json.loads(row['result'])
+        return job
+
+    def submit(self, payload, params=None, lane='normal'):
+        """Queue one upload; returns the job id."""
+        if lane not in LANES:
+            raise ValueError(f"Unknown priority {lane!r}, expected one of {LANES}")
+        job_id = uuid.uuid4().hex
+        self._connect().execute(
+            "INSERT INTO jobs (id, lane, status, submitted_at, params, payload) VALUES (?, ?, 'queued', ?, ?, ?)",
+            (job_id, LANES.index(lane), time.time(), json.dumps(params or {}), sqlite3.Binary(payload))
+        )
+        self.notify()
+        return job_id
+
+    def claim(self, worker):
+        """Mark the next queued job as running and return it with its payload, or None."""
+        conn = self._connect()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' ORDER BY lane, submitted_at LIMIT 1"
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', started_at = ?, worker = ?, attempts = attempts + 1 "
+                    "WHERE id = ?",
+                    (now, worker, row['id'])
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        if row is None:
+            return None
+        job = self._row_to_job(row)
+        job.update(status='running', started_at=now, attempts=job['attempts'] + 1, payload=bytes(row['payload']))
+        return job
+
+    def _finish(self, job_id, status, result=None, error=None):
+        self._connect().execute(
+            "UPDATE jobs SET status = ?, finished_at = ?, result = ?, error = ?, payload = NULL WHERE id = ?",
+            (status, time.time(), None if result is None else json.dumps(result), error, job_id)
+        )
+        self.notify()
+
+    def complete(self, job_id, result):
+        self._finish(job_id, 'done', result=result)
+
+    def fail(self, job_id, error):
+        self._finish(job_id, 'failed', error=error)
+
+    def get(self, job_id):
+        row = self._connect().execute(
+            "SELECT id, lane, status, submitted_at, started_at, finished_at, attempts, params, result, error "
+            "FROM jobs WHERE id = ?",
+            (job_id,)
+        ).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def wait(self, job_id, timeout, poll_interval=0.25):
+        """Long-poll: return the job once it has finished, or as it is after ``timeout`` seconds."""
+        deadline = time.monotonic() + max(0.0, timeout)
+        while True:
+            job = self.get(job_id)
+            remaining = deadline - time.monotonic()
+            if job is None or job['status'] in TERMINAL_STATUSES or remaining <= 0:
+                return job
+            self.wait_for_change(min(remaining, poll_interval))
+
+    def position(self, job_id):
+        """Jobs ahead of a queued job (more urgent lanes first, then older in its lane)."""
+        row = self._connect().execute(
+            "SELECT lane, submitted_at FROM jobs WHERE id = ? AND status = 'queued'", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return self._connect().execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND (lane < ? OR (lane = ? AND submitted_at < ?))",
+            (row['lane'], row['lane'], row['submitted_at'])
+        ).fetchone()[0]
+
+    def recover(self):
+        """Requeue jobs left running by a dead process on this host; returns how many were requeued."""
+        conn = self._connect()
+        host = socket.gethostname()
+        requeued = 0
+        for (worker,) in conn.execute("SELECT DISTINCT worker FROM jobs WHERE status = 'running'").fetchall():
+            # Worker ids look like 'host:pid/thread'
+            worker_host, _, rest = (worker or '').partition(':')
+            pid = rest.split('/')[0]
+            pid = int(pid) if pid.isdigit() else None
+            if worker_host != host or (pid is not None and pid != os.getpid() and _pid_alive(pid)):
+                continue
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', finished_at = ?, payload = NULL, "
+                "error = 'Worker died while processing the job' "
+                "WHERE status = 'running' AND worker = ? AND attempts >= ?",
+                (time.time(), worker, MAX_ATTEMPTS)
+            )
+            requeued += conn.execute(
+                "UPDATE jobs SET status = 'queued', started_at = NULL, worker = NULL "
+                "WHERE status = 'running' AND worker = ?",
+                (worker,)
+            ).rowcount
+        if requeued:
+            self.notify()
+        return requeued
+
+    def purge(self, max_age_seconds):
+        """Delete finished jobs older than ``max_age_seconds``."""
+        return self._connect().execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+            (time.time() - max_age_seconds,)
+        ).rowcount
+
+    def depth(self):
+        """Queued jobs per lane."""
+        rows = self._connect().execute(
+            "SELECT lane, COUNT(*) FROM jobs WHERE status = 'queued' GROUP BY lane"
+        ).fetchall()
+        depth = dict.fromkeys(LANES, 0)
+        for lane, count in rows:
+            depth[LANES[lane]] = count
+        return depth
+
+    def stats(self):
+        conn = self._connect()
+        now = time.time()
+        counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        oldest = dict.fromkeys(LANES)
+        for lane, submitted_at in conn.execute(
+            "SELECT lane, MIN(submitted_at) FROM jobs WHERE status = 'queued' GROUP BY lane"
+        ).fetchall():
+            oldest[LANES[lane]] = round(now - submitted_at, 3)
+        return {
+            'queued': self.depth(),
+            'running': counts.get('running', 0),
+            'done': counts.get('done', 0),
+            'failed': counts.get('failed', 0),
+            'oldest_queued_seconds': oldest
+        }
+
+
+class JobWorkers:
+    """Threads that drain a ``JobQueue`` by calling ``handler(job)`` and storing what it returns.
+
+    ``on_start(job)`` and ``on_finish(job, ok)`` are optional hooks for metrics.
+    """
+
+    def __init__(self, queue, handler, workers=2, poll_interval=0.5, on_start=None, on_finish=None,
+                 retention_seconds=24 * 3600):
+        self.queue = queue
+        self.handler = handler
+        self.poll_interval = poll_interval
+        self.on_start = on_start
+        self.on_finish = on_finish
+        self.retention_seconds = retention_seconds
+        self._stopping = threading.Event()
+        self._last_purge = 0.0
+        self._threads = [
+            threading.Thread(target=self._run, args=(f"{queue.worker_prefix}/{i}",), name=f'job-worker-{i}', daemon=True)
+            for i in range(max(1, int(workers)))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _run(self, worker):
+        while not self._stopping.is_set():
+            try:
+                job = self.queue.claim(worker)
+            except sqlite3.Error as e:
+                print(f"Job queue error: {e}")
+                job = None
+            if job is None:
+                self._idle()
+                continue
+            if self.on_start:
+                self.on_start(job)
+            try:
+                self.queue.complete(job['id'], self.handler(job))
+                ok = True
+            except Exception as e:
+                print(f"Job {job['id']} failed: {e}")
+                self.queue.fail(job['id'], str(e))
+                ok = False
+            if self.on_finish:
+                self.on_finish(job, ok)
+
+    def _idle(self):
+        now = time.monotonic()
+        if self.retention_seconds and now - self._last_purge > 600:
+            self._last_purge = now
+            try:
+                purged = self.queue.purge(self.retention_seconds)
+                if purged:
+                    print(f"Purged {purged} finished jobs")
+            except sqlite3.Error as e:
+                print(f"Job purge failed: {e}")
+        self.queue.wait_for_change(self.poll_interval)
+
+    def close(self, timeout=5.0):
+        self._stopping.set()
+        self.queue.notify()
+        for thread in self._threads:
+            thread.join(timeout)
@@ -0,0 +1,240 @@
+"""Compact representations of binary segmentation masks for API responses.
+
+Formats:
+    list      nested float list of the raw model output (what /process-mri/ returned)
+    png       base64 PNG of the 0/255 mask (what /analyze returned)
+    rle       run lengths over the row-major flattened mask, starting with a run of zeros
+    bits      base64 of the mask bit-packed with np.packbits (1 bit per pixel)
+    polygons  bounding box plus outer contour polygon of each connected region (lossy: holes are dropped)
+
+Run ``python mask_encoding.py --benchmark`` for a size/latency comparison.
+"""
+import base64
+import io
+import json
+import re
+import sys
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+MASK_FORMATS = ('list', 'png', 'rle', 'bits', 'polygons')
+
+_ACCEPT_PARAM = re.compile(r'mask-format\s*=\s*"?([a-z]+)"?', re.IGNORECASE)
+
+
+def negotiate_format(query_value, accept_header, default):
+    """Pick the mask format from ``?mask_format=`` or an ``Accept: ...; mask-format=rle`` parameter."""
+    value = query_value
+    if not value and accept_header:
+        match = _ACCEPT_PARAM.search(accept_header)
+        value = match.group(1) if match else None
+    value = (value or default).lower()
+    if value not in MASK_FORMATS:
+        raise ValueError(f"Unknown mask format {value!r}, expected one of {MASK_FORMATS}")
+    return value
+
+
+def to_binary(mask, threshold=0.5):
+    """(H, W[, 1]) probabilities or 0/255 values -> (H, W) bool."""
+    mask = np.asarray(mask)
+    if mask.ndim == 3:
+        mask = mask[..., 0]
+    if mask.dtype == np.bool_:
+        return mask
+    if mask.dtype == np.uint8:
+        return mask > 127
+    return mask > threshold
+
+
+def encode_rle(mask):
+    binary = to_binary(mask)
+    flat = binary.ravel()
+    # Indices where the value changes, then run lengths between them
+    changes = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    bounds = np.concatenate(([0], changes, [flat.size]))
+    counts = np.diff(bounds)
+    if flat.size and flat[0]:
+        counts = np.concatenate(([0], counts))
+    return {'format': 'rle', 'shape': list(binary.shape), 'counts': counts.tolist()}
+
+
+def decode_rle(encoded):
+    counts = np.asarray(encoded['counts'], dtype=np.int64)
+    values = np.arange(len(counts)) % 2 == 1
+    return np.repeat(values, counts).reshape(encoded['shape'])
+
+
+def encode_bits(mask):
+    binary = to_binary(mask)
+    packed = np.packbits(binary.ravel())
+    return {'format': 'bits', 'shape': list(binary.shape), 'data': base64.b64encode(packed.tobytes()).decode()}
+
+
+def decode_bits(encoded):
+    shape = encoded['shape']
+    packed = np.frombuffer(base64.b64decode(encoded['data']), dtype=np.uint8)
+    return np.unpackbits(packed, count=int(np.prod(shape))).astype(bool).reshape(shape)
+
+
+def bounding_box(binary):
+    rows = np.flatnonzero(binary.any(axis=1))
+    cols = np.flatnonzero(binary.any(axis=0))
+    if not rows.size:
+        return None
+    return {'x': int(cols[0]), 'y': int(rows[0]), 'width': int(cols[-1] - cols[0] + 1), 'height': int(rows[-1] - rows[0] + 1)}
+
+
+# Moore neighbourhood, clockwise starting west (row, col offsets)
+_NEIGHBOURS = ((0, -1), (-1, -1), (-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1))
+
+
+def _trace_outer(padded, start):
+    """Moore-neighbour boundary trace of the region containing ``start`` in a zero-padded mask."""
+    contour = [start]
+    point = start
+    backtrack = 0  # we enter the first pixel in raster order from its west neighbour
+    for _ in range(4 * padded.size):
+        for k in range(1, 9):
+            direction = (backtrack + k) % 8
+            dr, dc = _NEIGHBOURS[direction]
+            candidate = (point[0] + dr, point[1] + dc)
+            if padded[candidate]:
+                break
+        else:
+            return contour  # isolated pixel
+        # Next search starts from the background neighbour checked just before
+        prev = _NEIGHBOURS[(direction + 7) % 8]
+        background = (point[0] + prev[0], point[1] + prev[1])
+        backtrack = _NEIGHBOURS.index((background[0] - candidate[0], background[1] - candidate[1]))
+        if point == start and len(contour) > 1 and candidate == contour[1]:
+            return contour[:-1]
+        contour.append(candidate)
+        point = candidate
+    return contour
+
+
+def _simplify(points):
+    # Drop points in the middle of straight runs (same step before and after)
+    if len(points) < 3:
+        return points
+    steps = np.diff(points, axis=0, append=points[:1])
+    keep = np.any(steps != np.roll(steps, 1, axis=0), axis=1)
+    return points[keep]
+
+
+def encode_polygons(mask):
+    from scipy import ndimage
+
+    binary = to_binary(mask)
+    labels, _ = ndimage.label(binary)
+    polygons = []
+    # Each region is traced inside its own bounding box, so the cost follows the
+    # region sizes instead of (regions x image size)
+    for region, (rows, cols) in enumerate(ndimage.find_objects(labels), start=1):
+        component = np.pad(labels[rows, cols] == region, 1)
+        first = np.argmax(component)
+        start = (int(first // component.shape[1]), int(first % component.shape[1]))
+        offset = np.array([rows.start - 1, cols.start - 1])
+        points = np.asarray(_trace_outer(component, start)) + offset
+        polygons.append(_simplify(points)[:, ::-1].tolist())  # (row, col) -> (x, y)
+    return {
+        'format': 'polygons',
+        'shape': list(binary.shape),
+        'bbox': bounding_box(binary),
+        'area': int(np.count_nonzero(binary)),
+        'polygons': polygons
+    }
+
+
+def decode_polygons(encoded):
+    height, width = encoded['shape']
+    canvas = Image.new('1', (width, height), 0)
+    draw = ImageDraw.Draw(canvas)
+    for polygon in encoded['polygons']:
+        points = [tuple(point) for point in polygon]
+        if len(points) == 1:
+            draw.point(points, fill=1)
+        else:
+            draw.polygon(points, fill=1, outline=1)
+    return np.asarray(canvas, dtype=bool)
+
+
+def encode_png(mask):
+    buffer = io.BytesIO()
+    Image.fromarray(to_binary(mask).astype(np.uint8) * 255, mode='L').save(buffer, format='PNG')
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def decode_png(encoded):
+    return np.asarray(Image.open(io.BytesIO(base64.b64decode(encoded)))) > 127
+
+
+def encode_mask(mask, mask_format):
+    if mask_format == 'list':
+        mask = np.asarray(mask)
+        return (mask.astype(np.float32) if mask.dtype == np.bool_ else mask).tolist()
+    if mask_format == 'png':
+        return encode_png(mask)
+    if mask_format == 'rle':
+        return encode_rle(mask)
+    if mask_format == 'bits':
+        return encode_bits(mask)
+    if mask_format == 'polygons':
+        return encode_polygons(mask)
+    raise ValueError(f"Unknown mask format {mask_format!r}, expected one of {MASK_FORMATS}")
+
+
+def decode_mask(encoded, mask_format):
+    if mask_format == 'list':
+        return to_binary(np.asarray(encoded, dtype=np.float32).squeeze())
+    if mask_format == 'png':
+        return decode_png(encoded)
+    return {'rle': decode_rle, 'bits': decode_bits, 'polygons': decode_polygons}[mask_format](encoded)
+
+
+def _synthetic_mask(size, rng):
+    rows, cols = np.ogrid[:size, :size]
+    mask = np.zeros((size, size), dtype=bool)
+    for _ in range(rng.integers(1, 4)):
+        cy, cx = rng.integers(size // 4, 3 * size // 4, size=2)
+        ry, rx = rng.integers(size // 16, size // 5, size=2)
+        mask |= ((rows - cy) / ry) ** 2 + ((cols - cx) / rx) ** 2 <= 1
+    return mask
+
+
+def _speckled_mask(size, rng, regions):
+    """Many small blobs, like a thresholded full-resolution mask with noise."""
+    mask = np.zeros((size, size), dtype=bool)
+    for cy, cx in rng.integers(0, size - 4, size=(regions, 2)):
+        mask[cy:cy + rng.integers(1, 5), cx:cx + rng.integers(1, 5)] = True
+    return mask
+
+
+def benchmark(sizes=(128, 512), repeats=50, full_size=2048, full_regions=1000, full_repeats=5):
+    rng = np.random.default_rng(0)
+    cases = [(str(size), [_synthetic_mask(size, rng) for _ in range(repeats)]) for size in sizes]
+    # Full resolution with many regions: what polygon tracing costs on noisy masks
+    cases.append((f"{full_size} x{full_regions}", [_speckled_mask(full_size, rng, full_regions) for _ in range(full_repeats)]))
+    print(f"{'mask':>10} {'format':>9} {'json bytes':>11} {'encode ms':>10} {'decode ms':>10} {'exact':>6}")
+    for label, masks in cases:
+        repeats = len(masks)
+        for mask_format in MASK_FORMATS:
+            inputs = [m.astype(np.float32)[None, ..., None] if mask_format == 'list' else m for m in masks]
+            start = time.perf_counter()
+            payloads = [json.dumps(encode_mask(m, mask_format)) for m in inputs]
+            encode_ms = (time.perf_counter() - start) * 1000.0 / repeats
+            start = time.perf_counter()
+            decoded = [decode_mask(json.loads(p), mask_format) for p in payloads]
+            decode_ms = (time.perf_counter() - start) * 1000.0 / repeats
+            exact = all(np.array_equal(d, m) for d, m in zip(decoded, masks))
+            size_bytes = sum(len(p) for p in payloads) // repeats
+            print(f"{label:>10} {mask_format:>9} {size_bytes:>11} {encode_ms:>10.3f} {decode_ms:>10.3f} {str(exact):>6}")
+
+
+if __name__ == '__main__':
+    if '--benchmark' in sys.argv:
+        benchmark()
+    else:
+        print(__doc__)
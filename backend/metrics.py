@@ -0,0 +1,153 @@
+"""Minimal Prometheus text-format metrics (counters, histograms and callback gauges and counters).
+
+Kept dependency-free so both services can expose ``/metrics`` without
+prometheus_client. Durations are recorded in seconds, as Prometheus expects.
+"""
+import bisect
+import threading
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds; covers sub-millisecond decode steps up to multi-second volume requests
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._series.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class CallbackGauge:
+    """Gauge read at scrape time; ``fn`` returns a number or a ``{label value: number}`` dict."""
+
+    type_name = 'gauge'
+
+    def __init__(self, name, help_text, fn, labelname=None):
+        self.name = name
+        self.help = help_text
+        self.fn = fn
+        self.labelname = labelname
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type_name}"]
+        try:
+            value = self.fn()
+        except Exception:
+            return lines
+        if isinstance(value, dict):
+            for label, v in sorted(value.items()):
+                if v is not None:
+                    lines.append(f"{self.name}{_format_labels((self.labelname,), (label,))} {_format_value(v)}")
+        elif value is not None:
+            lines.append(f"{self.name} {_format_value(value)}")
+        return lines
+
+
+class CallbackCounter(CallbackGauge):
+    """Counter read at scrape time from a running total kept elsewhere (e.g. a cache's hit count)."""
+
+    type_name = 'counter'
+
+
+class Registry:
+    def __init__(self, prefix=''):
+        self.prefix = prefix
+        self._metrics = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._add(Counter(self.prefix + name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(self.prefix + name, help_text, labelnames, buckets))
+
+    def gauge(self, name, help_text, fn, labelname=None):
+        return self._add(CallbackGauge(self.prefix + name, help_text, fn, labelname))
+
+    def callback_counter(self, name, help_text, fn, labelname=None):
+        return self._add(CallbackCounter(self.prefix + name, help_text, fn, labelname))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+def observe_stages(histogram, timings_ms, **labels):
+    """Feed a StageTimer-style ``{stage: milliseconds}`` dict into a histogram labelled by stage."""
+    for stage, ms in timings_ms.items():
+        histogram.observe(ms / 1000.0, stage=stage, **labels)
@@ -0,0 +1,434 @@
+"""Shared inference process: one copy of the models and micro-batchers for every web worker.
+
+Start it once, then point the web workers at its socket:
+
+    python model_server.py --socket /tmp/brain-tumor-models.sock
+    MODEL_SERVER_SOCKET=/tmp/brain-tumor-models.sock gunicorn -w 4 --threads 8 app:app
+
+Workers send small JSON headers over a Unix socket. Tensors go through a
+shared-memory block owned by each connection: the client writes its input batch
+into the block, the server reads it in place and writes the output back after
+it. Arrays are never pickled or sent through the socket. The server feeds
+single-sample requests from every worker into the same MicroBatcher, so requests
+from different processes share one forward pass.
+
+Each connection carries one request at a time. A client keeps a small thread pool
+with one connection (and one block) per pool thread, so a worker holds a bounded
+number of connections however many request threads it runs.
+"""
+import argparse
+import atexit
+import json
+import os
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+HEADER = struct.Struct('!I')
+ALIGN = 64
+DEFAULT_SOCKET = '/tmp/brain-tumor-models.sock'
+
+
+def _aligned(size):
+    return (size + ALIGN - 1) // ALIGN * ALIGN
+
+
+def _recv_exact(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def send_message(sock, message):
+    data = json.dumps(message).encode()
+    sock.sendall(HEADER.pack(len(data)) + data)
+
+
+def recv_message(sock):
+    header = _recv_exact(sock, HEADER.size)
+    if header is None:
+        return None
+    body = _recv_exact(sock, HEADER.unpack(header)[0])
+    return None if body is None else json.loads(body)
+
+
+def attach(name):
+    """Map a block created by a client without taking ownership of it."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 attaching registers the block with this process's
+        # resource tracker, which would unlink it when the server exits
+        from multiprocessing import resource_tracker
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+def _close(shm):
+    if shm is None:
+        return
+    try:
+        shm.close()
+    except BufferError:
+        # A view into the block is still referenced; the mapping goes when it is collected
+        pass
+
+
+class BufferTooSmall(Exception):
+    def __init__(self, needed):
+        super().__init__(f"shared buffer too small, {needed} bytes needed")
+        self.needed = needed
+
+
+class ModelServer:
+    """Answers ``info``, ``stats``, ``submit`` (one sample, micro-batched) and ``predict`` (a whole batch)."""
+
+    def __init__(self, runners, max_batch_size=8, max_wait_ms=10.0, info=None):
+        from batching import MicroBatcher
+
+        self.runners = runners
+        self.batchers = {
+            name: MicroBatcher(runner, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms, name=name)
+            for name, runner in runners.items()
+        }
+        self.info = dict(info or {})
+        self.started = time.time()
+        self._clients = 0
+        self._lock = threading.Lock()
+
+    def connected(self, delta):
+        with self._lock:
+            self._clients += delta
+
+    def handle(self, request, shm):
+        op = request.get('op')
+        if op == 'info':
+            return dict(self.info, models={
+                name: {'input_shape': list(runner.input_shape), 'warmup_seconds': runner.warmup_seconds}
+                for name, runner in self.runners.items()
+            })
+        if op == 'stats':
+            with self._lock:
+                clients = self._clients
+            return {
+                'batching': {name: batcher.stats() for name, batcher in self.batchers.items()},
+                'clients': clients,
+                'uptime_seconds': round(time.time() - self.started, 1)
+            }
+        if op not in ('submit', 'predict'):
+            raise ValueError(f"Unknown op {op!r}")
+        if request.get('model') not in self.runners:
+            raise ValueError(f"Unknown model {request.get('model')!r}")
+        if shm is None:
+            raise ValueError("No shared buffer attached")
+
+        batch = np.ndarray(tuple(request['shape']), dtype=np.float32, buffer=shm.buf)
+        timings = None
+        if op == 'submit':
+            future = self.batchers[request['model']].submit_async(batch[0])
+            output = future.result()
+            timings = getattr(future, 'timings', None)
+        else:
+            output = self.runners[request['model']](batch)
+        del batch
+        output = np.asarray(output, dtype=np.float32)
+
+        offset = _aligned(int(np.prod(request['shape'])) * 4)
+        if offset + output.nbytes > shm.size:
+            raise BufferTooSmall(offset + output.nbytes)
+        np.ndarray(output.shape, dtype=np.float32, buffer=shm.buf, offset=offset)[...] = output
+        return {'shape': list(output.shape), 'offset': offset, 'timings': timings}
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        model_server = self.server.model_server
+        model_server.connected(1)
+        shm = None
+        try:
+            while True:
+                request = recv_message(self.request)
+                if request is None:
+                    break
+                try:
+                    if request.get('shm') and (shm is None or shm.name != request['shm']):
+                        # The client replaced its block with a bigger one
+                        _close(shm)
+                        shm = attach(request['shm'])
+                    response = model_server.handle(request, shm)
+                except BufferTooSmall as e:
+                    response = {'error': str(e), 'needed': e.needed}
+                except Exception as e:
+                    response = {'error': str(e)}
+                send_message(self.request, response)
+        except OSError:
+            pass
+        finally:
+            model_server.connected(-1)
+            _close(shm)
+
+
+class _Connection:
+    """One socket plus the shared-memory block its requests use."""
+
+    def __init__(self, path, timeout):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(path)
+        self.shm = None
+
+    def _ensure(self, size):
+        if self.shm is not None and self.shm.size >= size:
+            return
+        self._release()
+        self.shm = shared_memory.SharedMemory(create=True, size=max(_aligned(size), 1024 * 1024))
+
+    def _release(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def call(self, op, model=None, batch=None):
+        request = {'op': op, 'model': model}
+        if batch is None:
+            send_message(self.sock, request)
+            response = recv_message(self.sock)
+        else:
+            batch = np.asarray(batch, dtype=np.float32)
+            # Outputs are never bigger than inputs for these models; the server says so if they are
+            needed = 2 * _aligned(batch.nbytes)
+            for _ in range(2):
+                self._ensure(needed)
+                np.ndarray(batch.shape, dtype=np.float32, buffer=self.shm.buf)[...] = batch
+                request.update(shm=self.shm.name, shape=list(batch.shape))
+                send_message(self.sock, request)
+                response = recv_message(self.sock)
+                if response is None or 'needed' not in response:
+                    break
+                needed = response['needed']
+        if response is None:
+            raise ConnectionError("Model server closed the connection")
+        if response.get('error'):
+            raise RuntimeError(f"Model server error: {response['error']}")
+        output = None
+        if 'offset' in response:
+            output = np.ndarray(
+                tuple(response['shape']), dtype=np.float32, buffer=self.shm.buf, offset=response['offset']
+            ).copy()
+        return response, output
+
+    def close(self):
+        try:
+            self.sock.close()
+        finally:
+            self._release()
+
+
+class ModelClient:
+    """Web-worker side of the model server: ``runner(name)`` and ``batcher(name)`` stand in for local ones."""
+
+    def __init__(self, path, timeout=60.0, max_concurrency=32):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='model-client')
+        self.info = None
+        atexit.register(self.close)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = _Connection(self.path, self.timeout)
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _drop_connection(self):
+        conn = getattr(self._local, 'conn', None)
+        self._local.conn = None
+        if conn is not None:
+            with self._lock:
+                if conn in self._connections:
+                    self._connections.remove(conn)
+            conn.close()
+
+    def call(self, op, model=None, batch=None):
+        """Returns ``(response header, output array or None)``.
+
+        Calls run on the client's own thread pool, so the number of connections and
+        shared blocks stays bounded however many request threads the worker has.
+        """
+        return self._executor.submit(self._call, op, model, batch).result()
+
+    def _call(self, op, model=None, batch=None):
+        # Reconnects once in case the server restarted
+        for attempt in range(2):
+            try:
+                return self._connection().call(op, model, batch)
+            except (ConnectionError, BrokenPipeError, socket.timeout, FileNotFoundError):
+                self._drop_connection()
+                if attempt:
+                    raise
+
+    def wait_ready(self, timeout=60.0):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                self.info = self.call('info')[0]
+                return self.info
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.5)
+
+    def runner(self, name):
+        model = (self.info or self.wait_ready())['models'][name]
+        return RemoteRunner(self, name, model['input_shape'], model['warmup_seconds'])
+
+    def batcher(self, name):
+        return RemoteBatcher(self, name)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+
+
+class RemoteRunner:
+    """Calls a whole batch on the model server, like a local ``CompiledModel``."""
+
+    def __init__(self, client, name, input_shape, warmup_seconds):
+        self.client = client
+        self.name = name
+        self.input_shape = tuple(input_shape)
+        # JSON turns the batch-size keys into strings
+        self.warmup_seconds = {int(size): seconds for size, seconds in (warmup_seconds or {}).items()}
+
+    def __call__(self, batch):
+        return self.client.call('predict', self.name, batch)[1]
+
+    def warmup(self, batch_sizes=(1,)):
+        # The server warmed its models up before it started listening
+        return self.warmup_seconds
+
+
+class RemoteBatcher:
+    """``MicroBatcher`` interface whose batching happens in the model server, across all workers."""
+
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def submit_async(self, sample):
+        future = Future()
+
+        def run():
+            try:
+                response, output = self.client._call('submit', self.name, np.asarray(sample)[None])
+                future.timings = response.get('timings')
+                future.set_result(output)
+            except Exception as e:
+                future.set_exception(e)
+
+        self.client._executor.submit(run)
+        return future
+
+    def submit(self, sample, timeout=None):
+        return self.submit_async(sample).result(timeout=timeout)
+
+    def stats(self):
+        return self.client.call('stats')[0]['batching'][self.name]
+
+    def close(self):
+        pass
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def main(argv=None):
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass
+    from autotune import DEFAULT_PROFILE_PATH, TUNING_TARGETS, load_profile
+    from inference import warmup_batch_sizes
+    from runtime import INFERENCE_BACKENDS, QUANTIZATION_MODES, load_runners
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--socket', default=os.getenv('MODEL_SERVER_SOCKET', DEFAULT_SOCKET))
+    parser.add_argument('--backend', choices=INFERENCE_BACKENDS, default=os.getenv('INFERENCE_BACKEND', 'keras').lower())
+    parser.add_argument('--quantize', choices=QUANTIZATION_MODES, default=os.getenv('TFLITE_QUANTIZATION', 'none').lower())
+    parser.add_argument('--batch-max-size', type=int, default=None)
+    parser.add_argument('--batch-max-wait-ms', type=float, default=float(os.getenv('BATCH_MAX_WAIT_MS', '10')))
+    parser.add_argument('--tuning-profile', default=os.getenv('TUNING_PROFILE', DEFAULT_PROFILE_PATH))
+    parser.add_argument('--tuning-target', choices=TUNING_TARGETS, default=os.getenv('TUNING_TARGET', 'latency').lower())
+    args = parser.parse_args(argv)
+
+    # The autotune profile fills in whatever the flags and environment leave unset
+    tuning = load_profile(args.tuning_profile, args.tuning_target, backend=args.backend)
+    if args.batch_max_size is None:
+        args.batch_max_size = int(os.getenv('BATCH_MAX_SIZE', tuning.get('batch_size') or 8))
+    intra_op_threads = int(os.getenv('INTRA_OP_THREADS', tuning.get('intra_op_threads') or 0))
+    inter_op_threads = int(os.getenv('INTER_OP_THREADS', tuning.get('inter_op_threads') or 0))
+
+    models_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
+    print(f"Loading {args.backend} models from {models_dir}...")
+    segmentation_runner, classification_runner = load_runners(
+        args.backend,
+        os.path.join(models_dir, 'new_segmentation_model.h5'),
+        os.path.join(models_dir, 'new_classification_model.h5'),
+        args.quantize,
+        num_threads=intra_op_threads or None,
+        inter_op_threads=inter_op_threads or None
+    )
+    sizes = warmup_batch_sizes(args.batch_max_size)
+    for runner in (segmentation_runner, classification_runner):
+        print(f"Warming up {runner.name} model for batch sizes {sizes}...")
+        runner.warmup(sizes)
+
+    model_server = ModelServer(
+        {'segmentation': segmentation_runner, 'classification': classification_runner},
+        max_batch_size=args.batch_max_size,
+        max_wait_ms=args.batch_max_wait_ms,
+        info={'backend': args.backend, 'quantization': args.quantize, 'pid': os.getpid()}
+    )
+
+    if os.path.exists(args.socket):
+        os.remove(args.socket)
+    with _UnixServer(args.socket, _Handler) as server:
+        server.model_server = model_server
+        os.chmod(args.socket, 0o660)
+        print(f"Model server listening on {args.socket} (max batch {args.batch_max_size}, "
+              f"max wait {args.batch_max_wait_ms}ms)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(args.socket)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,167 @@
+import io
+import time
+from contextlib import contextmanager
+
+import numpy as np
+from PIL import Image
+
+from inference import SEGMENTATION_INPUT_SHAPE, CLASSIFICATION_INPUT_SHAPE
+
+SEGMENTATION_SIZE = SEGMENTATION_INPUT_SHAPE[1], SEGMENTATION_INPUT_SHAPE[0]
+CLASSIFICATION_SIZE = CLASSIFICATION_INPUT_SHAPE[1], CLASSIFICATION_INPUT_SHAPE[0]
+
+# Both model inputs are built from one intermediate at the larger of the two sizes
+INTERMEDIATE_SIZE = max(SEGMENTATION_SIZE, CLASSIFICATION_SIZE)
+
+_SCALE = np.float32(1.0 / 255.0)
+
+# Single-channel modes wider than 8 bits (16-bit PNG/TIFF, 32-bit int and float TIFF)
+WIDE_MODES = ('I', 'I;16', 'I;16B', 'I;16L', 'F')
+
+# Stages that turn upload bytes into model inputs, as opposed to model or storage time
+PREPROCESSING_STAGES = ('decode', 'resize', 'normalize', 'decode_full')
+
+
+class StageTimer:
+    """Accumulates wall-clock milliseconds per named pipeline stage."""
+
+    def __init__(self):
+        self.timings = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000.0
+            self.timings[name] = round(self.timings.get(name, 0.0) + elapsed, 3)
+
+    def as_dict(self, names=None):
+        """Timings in ms, optionally only for the stages in ``names``."""
+        if names is None:
+            return dict(self.timings)
+        return {name: ms for name, ms in self.timings.items() if name in names}
+
+
+class PreparedImage:
+    """A decoded upload and the two model inputs derived from it."""
+
+    def __init__(self, data, image, source_format, original_size, original_mode, segmentation, classification):
+        self.data = data
+        self.image = image
+        self.source_format = source_format
+        self.original_size = original_size
+        self.original_mode = original_mode
+        self.segmentation = segmentation
+        self.classification = classification
+
+    def jpeg_bytes(self, timer=None):
+        """The upload as JPEG: the original bytes when it already was one, otherwise re-encoded."""
+        if self.source_format == 'JPEG':
+            return self.data
+        with (timer or StageTimer()).stage('encode'):
+            buffer = io.BytesIO()
+            self.image.save(buffer, format='JPEG')
+            return buffer.getvalue()
+
+
+def decode(data, timer=None):
+    """Decode once, letting libjpeg downscale in the DCT when the source is much larger than needed."""
+    timer = timer or StageTimer()
+    with timer.stage('decode'):
+        image = Image.open(io.BytesIO(data))
+        source_format = image.format
+        original_size = image.size
+        original_mode = image.mode
+        if source_format == 'JPEG':
+            # Only reduces by powers of two while staying >= INTERMEDIATE_SIZE
+            image.draft('L' if image.mode == 'L' else 'RGB', INTERMEDIATE_SIZE)
+        image.load()
+        if image.mode in WIDE_MODES:
+            image = stretch_to_8bit(image)
+        elif image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+    return image, source_format, original_size, original_mode
+
+
+def stretch_to_8bit(image):
+    """'L' image from a 16-bit or float one, its min..max range stretched to 0..255.
+
+    A plain ``convert()`` clips these to 255, so most 16-bit scans would come out white.
+    """
+    pixels = np.asarray(image, dtype=np.float32)
+    low, high = float(pixels.min()), float(pixels.max())
+    scale = np.float32(255.0 / (high - low)) if high > low else np.float32(0.0)
+    return Image.fromarray(((pixels - low) * scale).astype(np.uint8), mode='L')
+
+
+def to_float32(array, out=None):
+    """uint8 -> float32 in [0, 1] without a float64 intermediate, optionally into ``out``."""
+    if out is None:
+        out = np.empty(array.shape, dtype=np.float32)
+    np.multiply(array, _SCALE, out=out)
+    return out
+
+
+def prepare(data, timer=None, segmentation_out=None, classification_out=None):
+    """Build the (128, 128, 1) and (200, 200, 3) float32 model inputs from raw upload bytes.
+
+    ``segmentation_out`` / ``classification_out`` may be rows of preallocated batch
+    buffers, in which case the inputs are written in place.
+    """
+    timer = timer or StageTimer()
+    image, source_format, original_size, original_mode = decode(data, timer)
+    segmentation, classification = model_inputs(image, timer, segmentation_out, classification_out)
+    return PreparedImage(data, image, source_format, original_size, original_mode, segmentation, classification)
+
+
+def model_inputs(image, timer=None, segmentation_out=None, classification_out=None):
+    """(segmentation, classification) float32 inputs from an already decoded 'L' or 'RGB' image."""
+    timer = timer or StageTimer()
+    with timer.stage('resize'):
+        intermediate = image.resize(INTERMEDIATE_SIZE)
+        classification_u8 = np.asarray(intermediate.convert('RGB'))
+        segmentation_u8 = np.asarray(intermediate.convert('L').resize(SEGMENTATION_SIZE))
+
+    with timer.stage('normalize'):
+        if segmentation_out is not None:
+            segmentation = segmentation_out
+            to_float32(segmentation_u8, out=segmentation[..., 0])
+        else:
+            segmentation = to_float32(segmentation_u8)[..., None]
+        classification = to_float32(classification_u8, out=classification_out)
+    return segmentation, classification
+
+
+def full_resolution_gray(prepared, timer=None):
+    """(H, W) uint8 grayscale of the upload at its original size.
+
+    ``decode()`` may have let libjpeg downscale large JPEGs, in which case the
+    bytes are decoded again without the draft.
+    """
+    timer = timer or StageTimer()
+    with timer.stage('decode_full'):
+        image = prepared.image
+        if image.size != prepared.original_size:
+            image = Image.open(io.BytesIO(prepared.data))
+        return np.asarray(image.convert('L'))
+
+
+def allocate_batch(batch_size):
+    """Preallocated float32 input buffers for ``batch_size`` images."""
+    return (
+        np.empty((batch_size,) + SEGMENTATION_INPUT_SHAPE, dtype=np.float32),
+        np.empty((batch_size,) + CLASSIFICATION_INPUT_SHAPE, dtype=np.float32)
+    )
+
+
+def prepare_batch(items, timer=None, buffers=None):
+    """Prepare many uploads straight into (N, ...) batch buffers; returns (prepared, seg_batch, cls_batch)."""
+    timer = timer or StageTimer()
+    segmentation_batch, classification_batch = buffers or allocate_batch(len(items))
+    prepared = [
+        prepare(data, timer, segmentation_batch[i], classification_batch[i])
+        for i, data in enumerate(items)
+    ]
+    return prepared, segmentation_batch[:len(items)], classification_batch[:len(items)]
@@ -0,0 +1,171 @@
+"""Named model slots loaded in the background and hot-swappable without a restart.
+
+The services register a loader per model and call ``start()``: loading,
+including the TensorFlow import, and warm-up then happen on a background thread
+while the web server already answers liveness probes. ``ready()`` turns true once
+every model is loaded and warmed up.
+
+``swap(name, path)`` loads and warms a new version next to the serving one and
+then replaces the reference under a lock. Requests that already took the old
+runner with ``get()`` finish on it, later ones get the new runner, and nothing is
+refused or dropped in between. A failed swap leaves the serving version in place.
+"""
+import os
+import threading
+import time
+import traceback
+from datetime import datetime, timezone
+
+from result_cache import file_version
+
+
+class ModelNotReady(RuntimeError):
+    pass
+
+
+class ModelRegistry:
+    """Current runner, version and load/warm-up timings of each named model.
+
+    ``loader(name, path)`` returns a runner with the ``CompiledModel`` interface
+    (callable on a batch, ``warmup(sizes)``); it is warmed up on every size in
+    ``warmup_sizes`` before it serves.
+    """
+
+    def __init__(self, loader, warmup_sizes=(1,)):
+        self.loader = loader
+        self.warmup_sizes = tuple(warmup_sizes)
+        self._slots = {}
+        self._lock = threading.Lock()
+        self._ready_callbacks = []
+        self._ready_fired = False
+
+    def register(self, name, path):
+        self._slots[name] = {
+            'runner': None,
+            'path': path,
+            'state': 'pending',
+            'version': None,
+            'loaded_at': None,
+            'load_seconds': None,
+            'warmup_seconds': None,
+            'swaps': 0,
+            'error': None,
+            'loading': None,
+            # Serializes loads of one model, so two reloads can't race each other
+            'load_lock': threading.Lock()
+        }
+
+    def start(self):
+        """Load and warm up every registered model on a background thread."""
+        thread = threading.Thread(target=self._load_all, name='model-loader', daemon=True)
+        thread.start()
+        return thread
+
+    def _load_all(self):
+        for name in list(self._slots):
+            self.load(name)
+
+    def load(self, name, path=None):
+        """Load ``path`` (default: the registered file) into ``name``'s slot; True once it serves."""
+        slot = self._slots[name]
+        path = path or slot['path']
+        with slot['load_lock']:
+            with self._lock:
+                slot['loading'] = path
+                if slot['runner'] is None:
+                    slot['state'] = 'loading'
+            print(f"Loading {name} model from {path}...")
+            try:
+                started = time.perf_counter()
+                runner = self.loader(name, path)
+                load_seconds = round(time.perf_counter() - started, 3)
+                warmup_seconds = runner.warmup(self.warmup_sizes)
+                # TFLite runners know the file they actually read
+                version_path = getattr(runner, 'path', None) or path
+                version = file_version(version_path) if os.path.exists(version_path) else None
+            except Exception as e:
+                print(f"Error loading {name} model from {path}: {e}")
+                print(traceback.format_exc())
+                with self._lock:
+                    slot['loading'] = None
+                    slot['error'] = str(e)
+                    if slot['runner'] is None:
+                        slot['state'] = 'failed'
+                return False
+
+            with self._lock:
+                swapped = slot['runner'] is not None
+                slot.update(runner=runner, path=path, state='ready', version=version, error=None, loading=None,
+                            load_seconds=load_seconds, warmup_seconds=warmup_seconds,
+                            loaded_at=datetime.now(timezone.utc).isoformat())
+                slot['swaps'] += swapped
+                fire = not self._ready_fired and self._all_loaded()
+                self._ready_fired = self._ready_fired or fire
+            print(f"{name} model {'swapped in' if swapped else 'ready'}: loaded in {load_seconds}s, "
+                  f"warm-up (s) {warmup_seconds}")
+        if fire:
+            for callback in self._ready_callbacks:
+                callback()
+        return True
+
+    def swap(self, name, path=None, wait=False):
+        """Hot-swap ``name`` to ``path`` (default: re-read the registered file).
+
+        Runs on a background thread unless ``wait`` is set, in which case it returns
+        whether the new version is serving.
+        """
+        if name not in self._slots:
+            raise KeyError(name)
+        if wait:
+            return self.load(name, path)
+        threading.Thread(target=self.load, args=(name, path), name=f'{name}-swap', daemon=True).start()
+        return None
+
+    def get(self, name):
+        """The runner serving ``name`` right now; raises ``ModelNotReady`` while it loads."""
+        runner = self._slots[name]['runner']
+        if runner is None:
+            raise ModelNotReady(f"{name} model is not loaded yet")
+        return runner
+
+    def predictor(self, name):
+        """A predict function for ``MicroBatcher`` that always runs the current version."""
+        return lambda batch: self.get(name)(batch)
+
+    def version(self, name):
+        return self._slots[name]['version']
+
+    def _all_loaded(self):
+        return all(slot['runner'] is not None for slot in self._slots.values())
+
+    def ready(self):
+        return bool(self._slots) and self._all_loaded()
+
+    def failed(self):
+        """Errors of models that failed to load and have no version serving."""
+        with self._lock:
+            return {name: slot['error'] for name, slot in self._slots.items() if slot['state'] == 'failed'}
+
+    def on_ready(self, callback):
+        """Call ``callback()`` once every model is first ready (right away if they already are)."""
+        with self._lock:
+            fired = self._ready_fired
+            if not fired:
+                self._ready_callbacks.append(callback)
+        if fired:
+            callback()
+
+    def wait_ready(self, timeout=None, poll_interval=0.1):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.ready():
+            if self.failed() or (deadline is not None and time.monotonic() >= deadline):
+                return False
+            time.sleep(poll_interval)
+        return True
+
+    def status(self):
+        with self._lock:
+            return {
+                name: {key: value for key, value in slot.items() if key not in ('runner', 'load_lock')}
+                for name, slot in self._slots.items()
+            }
@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+
+def file_version(path, length=12):
+    """Short content hash of a model file, used to tie cached results to the model that produced them."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:length]
+
+
+class ResultCache:
+    """Content-addressed cache of analysis results.
+
+    Entries are keyed on a hash of the uploaded bytes plus the model versions, so a
+    re-uploaded image is answered without running inference and a model swap
+    naturally invalidates every entry. The in-memory tier is an LRU bounded by the
+    serialized size of the stored results; the optional disk tier keeps one JSON file
+    per entry under ``disk_dir`` and survives restarts.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, disk_dir=None):
+        self.max_bytes = int(max_bytes)
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0, 'stores': 0}
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(data, model_versions):
+        digest = hashlib.sha256(data)
+        for name in sorted(model_versions):
+            digest.update(f"|{name}={model_versions[name]}".encode())
+        return digest.hexdigest()
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._counters['hits'] += 1
+                self._counters['memory_hits'] += 1
+                return json.loads(entry)
+
+        if self.disk_dir:
+            try:
+                with open(self._disk_path(key), 'r') as f:
+                    payload = f.read()
+            except (FileNotFoundError, OSError):
+                payload = None
+            if payload is not None:
+                self._remember(key, payload)
+                with self._lock:
+                    self._counters['hits'] += 1
+                    self._counters['disk_hits'] += 1
+                return json.loads(payload)
+
+        with self._lock:
+            self._counters['misses'] += 1
+        return None
+
+    def put(self, key, result):
+        payload = json.dumps(result)
+        self._remember(key, payload)
+        if self.disk_dir:
+            path = self._disk_path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w') as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+        with self._lock:
+            self._counters['stores'] += 1
+
+    def _remember(self, key, payload):
+        size = len(payload)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._entries[key] = payload
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self._counters['evictions'] += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self._counters['hits'] + self._counters['misses']
+            return {
+                **self._counters,
+                'hit_rate': round(self._counters['hits'] / lookups, 4) if lookups else 0.0,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'disk_dir': self.disk_dir
+            }
@@ -0,0 +1,227 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+# Runtimes the serving code can run the models on
+INFERENCE_BACKENDS = ('keras', 'tflite')
+QUANTIZATION_MODES = ('none', 'float16', 'int8')
+
+
+def tflite_model_path(keras_path, quantization='none'):
+    """``models/foo.h5`` -> ``models/foo.tflite`` / ``models/foo.int8.tflite``."""
+    base, _ = os.path.splitext(keras_path)
+    suffix = '' if quantization in (None, 'none') else f".{quantization}"
+    return f"{base}{suffix}.tflite"
+
+
+def _interpreter_class():
+    # Prefer the standalone runtime so serving doesn't need the full TensorFlow stack
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        import tensorflow as tf
+        Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+def _quantize(batch, detail):
+    dtype = detail['dtype']
+    if dtype == np.float32:
+        return batch
+    scale, zero_point = detail['quantization']
+    info = np.iinfo(dtype)
+    return np.clip(np.round(batch / scale + zero_point), info.min, info.max).astype(dtype)
+
+
+def _dequantize(output, detail):
+    if output.dtype == np.float32:
+        return output
+    scale, zero_point = detail['quantization']
+    return (output.astype(np.float32) - zero_point) * scale
+
+
+class TFLiteModel:
+    """Runs an exported ``.tflite`` model with the same call interface as ``CompiledModel``.
+
+    An interpreter is kept per batch size, all sharing the same model buffer, so
+    batches of varying size don't reallocate tensors on every call. Quantized
+    inputs and outputs are converted to and from float32 transparently.
+    """
+
+    def __init__(self, path, name='model', num_threads=None):
+        self.path = path
+        self.name = name
+        self.num_threads = num_threads
+        self.warmup_seconds = {}
+        with open(path, 'rb') as f:
+            self._model_content = f.read()
+        self._interpreter_cls = _interpreter_class()
+        self._interpreters = {}
+        self._lock = threading.Lock()
+
+        interpreter = self._create(None)
+        detail = interpreter.get_input_details()[0]
+        self.input_shape = tuple(int(d) for d in detail['shape'][1:])
+        self._interpreters[int(detail['shape'][0])] = interpreter
+
+    def _create(self, batch_size):
+        interpreter = self._interpreter_cls(model_content=self._model_content, num_threads=self.num_threads)
+        if batch_size is not None:
+            detail = interpreter.get_input_details()[0]
+            interpreter.resize_tensor_input(detail['index'], (batch_size,) + self.input_shape)
+        interpreter.allocate_tensors()
+        return interpreter
+
+    def __call__(self, batch):
+        batch = np.asarray(batch, dtype=np.float32)
+        if batch.shape[1:] != self.input_shape:
+            raise ValueError(
+                f"{self.name} model expects input shape (N, {', '.join(map(str, self.input_shape))}), "
+                f"got {batch.shape}"
+            )
+        with self._lock:
+            interpreter = self._interpreters.get(len(batch))
+            if interpreter is None:
+                interpreter = self._create(len(batch))
+                self._interpreters[len(batch)] = interpreter
+            input_detail = interpreter.get_input_details()[0]
+            output_detail = interpreter.get_output_details()[0]
+            interpreter.set_tensor(input_detail['index'], _quantize(batch, input_detail))
+            interpreter.invoke()
+            output = interpreter.get_tensor(output_detail['index'])
+        return _dequantize(output, output_detail)
+
+    def warmup(self, batch_sizes=(1,)):
+        for size in batch_sizes:
+            start = time.perf_counter()
+            self(np.zeros((size,) + self.input_shape, dtype=np.float32))
+            self.warmup_seconds[size] = round(time.perf_counter() - start, 4)
+        return self.warmup_seconds
+
+
+def resolve_tflite_path(path, quantization='none'):
+    """The exported ``.tflite`` file for a ``.h5`` model path (or ``path`` itself if it is one).
+
+    Raises ValueError for an unknown quantization mode and FileNotFoundError when the
+    export doesn't exist yet.
+    """
+    if quantization not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown quantization mode {quantization!r}, expected one of {QUANTIZATION_MODES}")
+    if not path.endswith('.tflite'):
+        path = tflite_model_path(path, quantization)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{path} not found, run 'python export_models.py --quantize {quantization}' first")
+    return path
+
+
+def load_tflite_runners(segmentation_keras_path, classification_keras_path, quantization='none', num_threads=None):
+    """Backend selector for ``INFERENCE_BACKEND=tflite``: loads the exported files next to the ``.h5`` models."""
+    segmentation_path = resolve_tflite_path(segmentation_keras_path, quantization)
+    classification_path = resolve_tflite_path(classification_keras_path, quantization)
+    return (
+        TFLiteModel(segmentation_path, name='segmentation', num_threads=num_threads),
+        TFLiteModel(classification_path, name='classification', num_threads=num_threads)
+    )
+
+
+def dice_scores(mask_a, mask_b, smooth=1e-6):
+    """Per-sample Dice between two stacks of binary masks of shape (N, ...)."""
+    a = mask_a.reshape(len(mask_a), -1).astype(bool)
+    b = mask_b.reshape(len(mask_b), -1).astype(bool)
+    intersection = np.count_nonzero(a & b, axis=1)
+    total = np.count_nonzero(a, axis=1) + np.count_nonzero(b, axis=1)
+    return (2.0 * intersection + smooth) / (total + smooth)
+
+
+def parity_check(reference, candidate, segmentation_inputs, classification_inputs, threshold=0.5, batch_size=8):
+    """Compare a candidate (segmentation, classification) runner pair against the Keras baseline.
+
+    Reports how often the predicted class agrees and the Dice overlap of the
+    thresholded masks, so a quantized export can be vetted before it serves traffic.
+    """
+    ref_seg, ref_cls = reference
+    cand_seg, cand_cls = candidate
+
+    def run(runner, inputs):
+        return np.concatenate([runner(inputs[i:i + batch_size]) for i in range(0, len(inputs), batch_size)])
+
+    ref_masks = run(ref_seg, segmentation_inputs) > threshold
+    cand_masks = run(cand_seg, segmentation_inputs) > threshold
+    ref_probs = run(ref_cls, classification_inputs)
+    cand_probs = run(cand_cls, classification_inputs)
+
+    dice = dice_scores(ref_masks, cand_masks)
+    agreement = np.argmax(ref_probs, axis=1) == np.argmax(cand_probs, axis=1)
+    return {
+        'samples': int(len(segmentation_inputs)),
+        'classification_agreement': round(float(agreement.mean()), 4),
+        'max_confidence_diff': round(float(np.abs(ref_probs - cand_probs).max()), 4),
+        'mask_dice_mean': round(float(dice.mean()), 4),
+        'mask_dice_min': round(float(dice.min()), 4)
+    }
+
+
+def load_keras_runners(segmentation_path, classification_path):
+    """Load both .h5 models for inference only and wrap them in ``CompiledModel``."""
+    import tensorflow as tf
+    from inference import CompiledModel, SEGMENTATION_INPUT_SHAPE, CLASSIFICATION_INPUT_SHAPE
+
+    # compile=False: the custom training losses and metrics aren't needed to predict
+    segmentation_model = tf.keras.models.load_model(segmentation_path, compile=False)
+    classification_model = tf.keras.models.load_model(classification_path, compile=False)
+    return (
+        CompiledModel(segmentation_model, SEGMENTATION_INPUT_SHAPE, name='segmentation'),
+        CompiledModel(classification_model, CLASSIFICATION_INPUT_SHAPE, name='classification')
+    )
+
+
+def configure_tf_threads(intra_op_threads=None, inter_op_threads=None):
+    """Size TensorFlow's CPU thread pools; 0 or None keeps TensorFlow's default.
+
+    Only possible before TensorFlow runs its first op, so later calls with other
+    values print a note and leave the pools as they are.
+    """
+    if not intra_op_threads and not inter_op_threads:
+        return
+    import tensorflow as tf
+    try:
+        if intra_op_threads:
+            tf.config.threading.set_intra_op_parallelism_threads(int(intra_op_threads))
+        if inter_op_threads:
+            tf.config.threading.set_inter_op_parallelism_threads(int(inter_op_threads))
+    except RuntimeError as e:
+        print(f"TensorFlow thread pools already initialized, keeping them: {e}")
+
+
+def load_runner(backend, name, path, quantization='none', num_threads=None, inter_op_threads=None):
+    """One model's runner: ``name`` is 'segmentation' or 'classification', ``path`` its ``.h5`` file.
+
+    On the TFLite backend the exported file next to ``path`` is loaded, or ``path``
+    itself when it already is a ``.tflite`` file. ``num_threads`` is the TFLite
+    interpreter's thread count, or TensorFlow's intra-op pool size on Keras.
+    """
+    if backend == 'tflite':
+        return TFLiteModel(resolve_tflite_path(path, quantization), name=name, num_threads=num_threads)
+    if backend == 'keras':
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{name} model not found at {path}")
+        configure_tf_threads(num_threads, inter_op_threads)
+        import tensorflow as tf
+        from inference import CompiledModel, SEGMENTATION_INPUT_SHAPE, CLASSIFICATION_INPUT_SHAPE
+
+        input_shapes = {'segmentation': SEGMENTATION_INPUT_SHAPE, 'classification': CLASSIFICATION_INPUT_SHAPE}
+        return CompiledModel(tf.keras.models.load_model(path, compile=False), input_shapes[name], name=name)
+    raise ValueError(f"Unknown inference backend {backend!r}, expected one of {INFERENCE_BACKENDS}")
+
+
+def load_runners(backend, segmentation_path, classification_path, quantization='none', num_threads=None,
+                 inter_op_threads=None):
+    """(segmentation, classification) runners for the offline tools, on either backend."""
+    if backend == 'tflite':
+        return load_tflite_runners(segmentation_path, classification_path, quantization, num_threads)
+    if backend == 'keras':
+        configure_tf_threads(num_threads, inter_op_threads)
+        return load_keras_runners(segmentation_path, classification_path)
+    raise ValueError(f"Unknown inference backend {backend!r}, expected one of {INFERENCE_BACKENDS}")
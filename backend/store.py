@@ -0,0 +1,262 @@
+"""SQLite-backed store for patients and scans.
+
+Replaces the whole-file patients.json / scans.json rewrites: every write is a single
+atomic INSERT (WAL mode, safe across threads and gunicorn workers), scans are indexed
+by patient id and by date, and listings use keyset pagination so a page costs the same
+no matter how deep it is.
+
+Run ``python store.py --benchmark`` for write and lookup latency at 10k, 100k and 1M scans.
+"""
+import json
+import os
+import queue
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS patients (
+    id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS scans (
+    id TEXT PRIMARY KEY,
+    patient_id TEXT,
+    created_at TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS scans_by_patient ON scans (patient_id, created_at, id);
+CREATE INDEX IF NOT EXISTS scans_by_date ON scans (created_at, id);
+CREATE INDEX IF NOT EXISTS patients_by_date ON patients (created_at, id);
+"""
+
+
+def utc_now():
+    return datetime.now(timezone.utc).isoformat(timespec='microseconds')
+
+
+def encode_cursor(row):
+    return f"{row['createdAt']}|{row['id']}"
+
+
+def decode_cursor(cursor):
+    created_at, _, record_id = cursor.partition('|')
+    return created_at, record_id
+
+
+class RecordStore:
+    """Patients and scans as JSON documents in SQLite, on a pool of reused connections."""
+
+    def __init__(self, path):
+        self.path = path
+        # Flask's threaded server runs each request on a fresh thread, so thread-local
+        # connections would be opened (and set up) once per request; pooled ones are reused
+        self._pool = queue.LifoQueue()
+        with self._connection() as conn:
+            # WAL is a property of the database file, so it is set once here
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        """Borrow a connection for one transaction (committed on success), then return it to the pool."""
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._open()
+        try:
+            with conn:
+                yield conn
+        finally:
+            self._pool.put(conn)
+
+    @staticmethod
+    def _normalize(record, created_at=None):
+        record = dict(record)
+        record.setdefault('id', uuid.uuid4().hex)
+        record.setdefault('createdAt', created_at or utc_now())
+        return record
+
+    @staticmethod
+    def _row_to_record(row):
+        return json.loads(row['data'])
+
+    # Patients
+
+    def add_patient(self, record):
+        record = self._normalize(record)
+        with self._connection() as conn:
+            conn.execute(
+                'INSERT INTO patients (id, created_at, data) VALUES (?, ?, ?)',
+                (record['id'], record['createdAt'], json.dumps(record))
+            )
+        return record
+
+    def get_patient(self, patient_id):
+        with self._connection() as conn:
+            row = conn.execute('SELECT data FROM patients WHERE id = ?', (patient_id,)).fetchone()
+        return self._row_to_record(row) if row else None
+
+    def list_patients(self, limit=50, cursor=None):
+        return self._page('patients', '1 = 1', (), limit, cursor)
+
+    # Scans
+
+    def add_scan(self, record):
+        return self.add_scans([record])[0]
+
+    def add_scans(self, records):
+        records = [self._normalize(record) for record in records]
+        with self._connection() as conn:
+            conn.executemany(
+                'INSERT INTO scans (id, patient_id, created_at, data) VALUES (?, ?, ?, ?)',
+                [(r['id'], r.get('patientId'), r['createdAt'], json.dumps(r)) for r in records]
+            )
+        return records
+
+    def get_scan(self, scan_id):
+        with self._connection() as conn:
+            row = conn.execute('SELECT data FROM scans WHERE id = ?', (scan_id,)).fetchone()
+        return self._row_to_record(row) if row else None
+
+    def scans_for_patient(self, patient_id, limit=50, cursor=None):
+        return self._page('scans', 'patient_id = ?', (patient_id,), limit, cursor)
+
+    def scans_between(self, start=None, end=None, limit=50, cursor=None):
+        """Scans with ``start <= createdAt < end`` (ISO 8601 strings), newest first."""
+        clauses, params = ['1 = 1'], []
+        if start:
+            clauses.append('created_at >= ?')
+            params.append(start)
+        if end:
+            clauses.append('created_at < ?')
+            params.append(end)
+        return self._page('scans', ' AND '.join(clauses), tuple(params), limit, cursor)
+
+    def count(self, table):
+        with self._connection() as conn:
+            return conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+    def _page(self, table, where, params, limit, cursor):
+        # Keyset pagination on (created_at, id), newest first
+        if cursor:
+            where += ' AND (created_at, id) < (?, ?)'
+            params += decode_cursor(cursor)
+        with self._connection() as conn:
+            rows = conn.execute(
+                f'SELECT data FROM {table} WHERE {where} ORDER BY created_at DESC, id DESC LIMIT ?',
+                params + (int(limit),)
+            ).fetchall()
+        items = [self._row_to_record(row) for row in rows]
+        next_cursor = encode_cursor(items[-1]) if len(items) == limit else None
+        return {'items': items, 'nextCursor': next_cursor}
+
+    # Migration
+
+    def migrate_json(self, patients_json, scans_json):
+        """Import the legacy JSON lists once (ids are kept), then rename the files to *.migrated.
+
+        Records without a createdAt are dated from the file's modification time, one
+        microsecond apart in list order (the lists were append-only), so they keep their
+        order and sort before anything stored after the migration.
+        """
+        imported = {}
+        for table, path in (('patients', patients_json), ('scans', scans_json)):
+            if not os.path.exists(path):
+                continue
+            try:
+                with open(path, 'r') as f:
+                    records = json.load(f)
+            except (OSError, ValueError):
+                records = []
+            modified = datetime.fromtimestamp(os.path.getmtime(path), timezone.utc)
+            records = [
+                self._normalize(record, (modified - timedelta(microseconds=len(records) - 1 - i))
+                                .isoformat(timespec='microseconds'))
+                for i, record in enumerate(records)
+            ]
+            with self._connection() as conn:
+                if table == 'scans':
+                    conn.executemany(
+                        'INSERT OR IGNORE INTO scans (id, patient_id, created_at, data) VALUES (?, ?, ?, ?)',
+                        [(r['id'], r.get('patientId'), r['createdAt'], json.dumps(r)) for r in records]
+                    )
+                else:
+                    conn.executemany(
+                        'INSERT OR IGNORE INTO patients (id, created_at, data) VALUES (?, ?, ?)',
+                        [(r['id'], r['createdAt'], json.dumps(r)) for r in records]
+                    )
+            os.replace(path, f"{path}.migrated")
+            imported[table] = len(records)
+        return imported
+
+
+def _timed(fn, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) * 1000.0 / repeats
+
+
+def benchmark(sizes=(10_000, 100_000, 1_000_000), json_baseline_max=100_000, patients=1000, repeats=200):
+    print(f"{'scans':>9} {'bulk load s':>11} {'append ms':>10} {'by patient ms':>14} "
+          f"{'by date ms':>11} {'deep page ms':>13} {'json append ms':>15}")
+    base_time = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            store = RecordStore(os.path.join(tmp, 'bench.db'))
+            start = time.perf_counter()
+            for offset in range(0, size, 10_000):
+                store.add_scans([
+                    {
+                        'patientId': f"p{i % patients}",
+                        'createdAt': (base_time + timedelta(seconds=i)).isoformat(),
+                        'tumorType': 'Glioma',
+                        'confidence': 0.9
+                    }
+                    for i in range(offset, min(size, offset + 10_000))
+                ])
+            load_s = time.perf_counter() - start
+
+            append_ms = _timed(lambda: store.add_scan({'patientId': 'p1', 'tumorType': 'Glioma'}), repeats)
+            patient_ms = _timed(lambda: store.scans_for_patient('p7', limit=50), repeats)
+            day = (base_time + timedelta(seconds=size // 2)).isoformat()
+            date_ms = _timed(lambda: store.scans_between(start=day, limit=50), repeats)
+            cursor = f"{(base_time + timedelta(seconds=size // 10)).isoformat()}|~"
+            deep_ms = _timed(lambda: store.scans_between(limit=50, cursor=cursor), repeats)
+
+            json_ms = float('nan')
+            if size <= json_baseline_max:
+                # The old approach: load the whole list, append, rewrite the file
+                json_path = os.path.join(tmp, 'scans.json')
+                with open(json_path, 'w') as f:
+                    json.dump(store.scans_between(limit=size)['items'], f)
+
+                def json_append():
+                    with open(json_path, 'r') as f:
+                        data = json.load(f)
+                    data.append({'id': uuid.uuid4().hex, 'patientId': 'p1'})
+                    with open(json_path, 'w') as f:
+                        json.dump(data, f)
+                json_ms = _timed(json_append, 3)
+
+            print(f"{size:>9} {load_s:>11.2f} {append_ms:>10.3f} {patient_ms:>14.3f} "
+                  f"{date_ms:>11.3f} {deep_ms:>13.3f} {json_ms:>15.1f}")
+
+
+if __name__ == '__main__':
+    if '--benchmark' in sys.argv:
+        benchmark()
+    else:
+        print(__doc__)
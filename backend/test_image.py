@@ -74,7 +74,7 @@ def test_image_processing(image_path):
             print("\nTesting full analysis...")
             with open(image_path, 'rb') as f:
                 files = {'file': (os.path.basename(image_path), f, 'image/jpeg')}
-                response = requests.post('http://localhost:8080/upload', files=files)
+                response = requests.post('http://localhost:8080/analyze', files=files)
             
             print(f"Analysis response status: {response.status_code}")
             
@@ -82,12 +82,13 @@ def test_image_processing(image_path):
                 result = response.json()
                 print("\nAnalysis successful!")
                 print("\nResults:")
-                print(f"Tumor Type: {result['tumorType']}")
-                print(f"Confidence: {result['confidence']:.2%}")
-                print(f"Has Tumor: {result['hasTumor']}")
+                print(f"Tumor Type: {result['classification']['class']}")
+                print(f"Confidence: {result['classification']['confidence']:.2%}")
+                print(f"Has Tumor: {result['classification']['class'] != 'No Tumour'}")
+                print(f"Processing time: {result['processingTime']:.3f}s")
                 
                 # Save the segmentation mask
-                mask_data = base64.b64decode(result['segmentationMask'])
+                mask_data = base64.b64decode(result['segmentation_mask'])
                 with open('segmentation_mask.png', 'wb') as f:
                     f.write(mask_data)
                 print("\nSaved segmentation mask as 'segmentation_mask.png'")
@@ -0,0 +1,76 @@
+import io
+import os
+import sys
+import time
+
+import numpy as np
+import pytest
+from PIL import Image
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+class FakeRunner:
+    """Stands in for ``CompiledModel``: echoes the input as a mask, or returns fixed class probabilities."""
+
+    def __init__(self, name, input_shape, probabilities=None):
+        self.name = name
+        self.input_shape = tuple(input_shape)
+        self.probabilities = probabilities
+        self.warmup_seconds = {}
+        self.calls = 0
+
+    def __call__(self, batch):
+        batch = np.asarray(batch, dtype=np.float32)
+        assert batch.shape[1:] == self.input_shape, batch.shape
+        self.calls += 1
+        if self.probabilities is not None:
+            return np.tile(np.asarray(self.probabilities, dtype=np.float32), (len(batch), 1))
+        return batch
+
+    def warmup(self, batch_sizes=(1,)):
+        self.warmup_seconds = {size: 0.0 for size in batch_sizes}
+        return self.warmup_seconds
+
+
+def fake_loader(name, path, probabilities=(0.7, 0.1, 0.1, 0.1)):
+    from inference import CLASSIFICATION_INPUT_SHAPE, SEGMENTATION_INPUT_SHAPE
+
+    if name == 'segmentation':
+        return FakeRunner(name, SEGMENTATION_INPUT_SHAPE)
+    return FakeRunner(name, CLASSIFICATION_INPUT_SHAPE, probabilities)
+
+
+def image_bytes(size=64, fmt='PNG', seed=0):
+    rng = np.random.default_rng(seed)
+    buffer = io.BytesIO()
+    Image.fromarray(rng.integers(0, 255, (size, size), dtype=np.uint8), mode='L').save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """The Flask app on a temporary data directory, serving fake models."""
+    os.environ['DATA_DIR'] = str(tmp_path_factory.mktemp('data'))
+    # No TFLite export exists, so the startup load fails fast; fake runners are swapped in below
+    os.environ['INFERENCE_BACKEND'] = 'tflite'
+    os.environ['TUNING_PROFILE'] = ''
+    os.environ['JOB_WORKERS'] = '1'
+    import app as app_module
+
+    registry = app_module.model_registry
+    deadline = time.monotonic() + 30
+    while any(m['state'] in ('pending', 'loading') for m in registry.status().values()):
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    registry.loader = fake_loader
+    for name in ('segmentation', 'classification'):
+        assert registry.load(name)
+    yield app_module
+    app_module.artifact_writer.close()
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
@@ -0,0 +1,185 @@
+import io
+import json
+import os
+import zipfile
+
+import pytest
+
+from conftest import image_bytes
+
+
+def ndjson(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines() if line.strip()]
+
+
+def test_analyze_batch_streams_images_and_zip_members(client):
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as zf:
+        zf.writestr('scans/a.png', image_bytes(seed=3))
+        zf.writestr('scans/b.jpg', image_bytes(fmt='JPEG', seed=4))
+        zf.writestr('notes.txt', 'not an image')
+    response = client.post('/analyze/batch', data={
+        'files': [
+            (io.BytesIO(image_bytes(seed=1)), 'one.png'),
+            (io.BytesIO(image_bytes(seed=2)), 'two.png'),
+            (io.BytesIO(archive.getvalue()), 'more.zip'),
+        ]
+    }, content_type='multipart/form-data')
+
+    assert response.status_code == 200
+    lines = ndjson(response)
+    results, summary = lines[:-1], lines[-1]
+    assert summary['done'] is True
+    assert summary['count'] == 4
+    assert summary['errors'] == 0
+    assert [r['filename'] for r in sorted(results, key=lambda r: r['index'])] == [
+        'one.png', 'two.png', 'scans/a.png', 'scans/b.jpg'
+    ]
+    for result in results:
+        assert result['error'] is None
+        assert result['classification']['class'] == 'Glioma'
+        assert result['segmentation_mask']
+
+
+def test_analyze_batch_reports_a_damaged_archive_and_keeps_going(client):
+    response = client.post('/analyze/batch', data={
+        'files': [
+            (io.BytesIO(b'PK\x03\x04 definitely not a zip'), 'broken.zip'),
+            (io.BytesIO(b'\x1f\x8b garbage'), 'broken.tar.gz'),
+            (io.BytesIO(image_bytes(seed=6)), 'after.png'),
+        ]
+    }, content_type='multipart/form-data')
+
+    assert response.status_code == 200
+    lines = ndjson(response)
+    assert lines[-1]['done'] is True
+    assert lines[-1]['count'] == 3 and lines[-1]['errors'] == 2
+    by_name = {line['filename']: line for line in lines[:-1]}
+    assert by_name['broken.zip']['error'].startswith('Unreadable archive')
+    assert by_name['broken.tar.gz']['error'].startswith('Unreadable archive')
+    assert by_name['after.png']['error'] is None
+
+
+def test_analyze_batch_accepts_uploads_over_the_single_image_limit(client, app_module):
+    limit = app_module.app.config['MAX_CONTENT_LENGTH']
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w', zipfile.ZIP_STORED) as zf:
+        zf.writestr('scan.png', image_bytes(seed=7))
+        zf.writestr('padding.bin', b'\0' * limit)
+    response = client.post('/analyze/batch', data={'files': [(io.BytesIO(archive.getvalue()), 'big.zip')]},
+                           content_type='multipart/form-data')
+
+    assert response.status_code == 200
+    summary = ndjson(response)[-1]
+    assert summary['count'] == 1 and summary['errors'] == 0
+
+
+def test_artifacts_are_served_with_strong_etags(client):
+    response = client.post('/analyze', data={'file': (io.BytesIO(image_bytes(seed=5)), 'scan.png')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 200
+    mask_url = response.get_json()['maskUrl']
+    path = mask_url[mask_url.index('/data/'):]
+
+    first = client.get(path)
+    assert first.status_code == 200
+    assert first.mimetype == 'image/png'
+    assert 'immutable' in first.headers['Cache-Control']
+    assert 'Content-Encoding' not in first.headers
+
+    again = client.get(path, headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+
+    thumb = client.get(path + '?size=64')
+    assert thumb.status_code == 200 and thumb.mimetype == 'image/jpeg'
+
+
+def test_only_artifact_directories_are_served(client, app_module):
+    cache_dir = os.path.join(app_module.DATA_DIR, 'cache')
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(os.path.join(cache_dir, 'result.json'), 'w') as f:
+        f.write('{}')
+    assert os.path.exists(app_module.RECORDS_DB)
+
+    for path in ('records.sqlite3', 'jobs.sqlite3-wal', 'cache/result.json', 'uploads/../records.sqlite3'):
+        assert client.get(f'/data/{path}').status_code == 404, path
+
+
+def test_thumbnail_of_a_non_image_is_a_bad_request(client, app_module):
+    with open(os.path.join(app_module.UPLOADS_DIR, 'notes.txt'), 'w') as f:
+        f.write('not an image')
+    assert client.get('/data/uploads/notes.txt?size=64').status_code == 400
+    assert client.get('/data/uploads/notes.txt').status_code == 200
+
+
+def test_analyze_volume_streams_every_slice(client, tmp_path):
+    nibabel = pytest.importorskip('nibabel')
+    import numpy as np
+
+    volume = np.random.default_rng(0).integers(0, 1000, (48, 48, 5)).astype(np.int16)
+    path = tmp_path / 'scan.nii.gz'
+    nibabel.save(nibabel.Nifti1Image(volume, np.eye(4)), str(path))
+
+    response = client.post('/analyze/volume', data={'file': (io.BytesIO(path.read_bytes()), 'scan.nii.gz')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 200
+    lines = ndjson(response)
+    slices, summary = lines[:-1], lines[-1]
+    assert summary['done'] is True
+    assert 'error' not in summary
+    assert len(slices) == 5
+    assert all(item['mask_format'] == 'rle' for item in slices)
+
+
+def test_tta_applies_the_cascade_to_the_averaged_prediction(client, app_module, monkeypatch):
+    classifier = app_module.model_registry.get('classification')
+    segmenter = app_module.model_registry.get('segmentation')
+    monkeypatch.setattr(app_module.cascade, 'enabled', True)
+    monkeypatch.setattr(classifier, 'probabilities', (0.01, 0.01, 0.01, 0.97))
+    calls = segmenter.calls
+
+    response = client.post('/analyze?tta=4', data={'file': (io.BytesIO(image_bytes(seed=6)), 'scan.png')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['classification']['class'] == 'No Tumour'
+    assert body['segmentation_skipped'] is True
+    assert body['stages'] == ['classification']
+    assert set(body['tta']) == {'class_agreement', 'uncertainty', 'views'}
+    assert segmenter.calls == calls
+
+
+def test_preprocessing_ms_only_holds_preprocessing_stages(client):
+    from preprocessing import PREPROCESSING_STAGES
+
+    response = client.post('/analyze', data={'file': (io.BytesIO(image_bytes(seed=7)), 'scan.png')},
+                           content_type='multipart/form-data')
+    body = response.get_json()
+    assert body['preprocessing_ms']
+    assert set(body['preprocessing_ms']) <= set(PREPROCESSING_STAGES)
+    assert 'total' in body['timings'] and 'classification_predict' in body['timings']
+
+
+def test_metrics_expose_cache_totals_as_counters(client):
+    client.post('/analyze', data={'file': (io.BytesIO(image_bytes(seed=7)), 'scan.png')},
+                content_type='multipart/form-data')
+    text = client.get('/metrics').get_data(as_text=True)
+    for name in ('result_cache_hits_total', 'result_cache_misses_total', 'chat_cache_hits_total',
+                 'chat_cache_misses_total', 'cascade_segmentation_skipped_total'):
+        assert f'# TYPE brain_tumor_{name} counter' in text
+    assert 'brain_tumor_stage_seconds_bucket{endpoint="analyze",stage="decode"' in text
+
+
+def test_job_runs_to_completion(client):
+    response = client.post('/jobs?priority=urgent', data={'file': (io.BytesIO(image_bytes(seed=8)), 'scan.png')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 202
+    job_id = response.get_json()['jobId']
+
+    job = client.get(f'/jobs/{job_id}?wait=10').get_json()
+    assert job['status'] == 'done', job
+    assert job['priority'] == 'urgent'
+    result = job['result']
+    assert result['classification']['class'] == 'Glioma'
+    assert result['maskUrl'].startswith('http://localhost/data/masks/')
+    assert client.get(result['maskUrl'][len('http://localhost'):]).status_code == 200
@@ -0,0 +1,43 @@
+import os
+
+from artifacts import ArtifactWriter, content_digest, content_etag, write_artifact
+
+
+def test_identical_content_is_written_once(tmp_path):
+    first = write_artifact(str(tmp_path), b'mask', 'png')
+    assert write_artifact(str(tmp_path), b'mask', 'png') == first
+    assert os.path.basename(first) == f"{content_digest(b'mask')}.png"
+    assert content_etag(first) == content_digest(b'mask')
+    assert content_etag('scan_1234.png') is None
+
+
+def test_writer_dedupes_and_waits_for_queued_files(tmp_path):
+    writes = []
+    writer = ArtifactWriter(on_write=writes.append)
+    try:
+        path = writer.submit(str(tmp_path), b'mask', 'png')
+        assert writer.submit(str(tmp_path), b'mask', 'png') == path
+        assert writer.wait_for(path, timeout=5)
+        with open(path, 'rb') as f:
+            assert f.read() == b'mask'
+        stats = writer.stats()
+        assert stats['written'] == 1 and stats['deduped'] == 1 and len(writes) == 1
+    finally:
+        writer.close()
+
+
+def test_submit_after_close_writes_inline(tmp_path):
+    writer = ArtifactWriter(max_pending=1)
+    writer.close()
+    # After close every submit is written on the caller's thread
+    path = writer.submit(str(tmp_path), b'late', 'bin')
+    assert os.path.exists(path)
+    assert writer.stats()['inline_writes'] == 1
+
+
+def test_close_drains_pending_writes(tmp_path):
+    writer = ArtifactWriter()
+    paths = [writer.submit(str(tmp_path), bytes([i]) * 100, 'bin') for i in range(20)]
+    writer.close()
+    assert all(os.path.exists(path) for path in paths)
+    assert writer.stats()['written'] == 20 and writer.stats()['pending_files'] == 0
@@ -0,0 +1,35 @@
+import argparse
+import json
+import os
+
+from autotune import load_profile, pick, write_profile
+
+
+def trial(p95, images_per_second, errors=0):
+    return {'intra_op_threads': 1, 'inter_op_threads': 0, 'inference_workers': 1, 'batch_size': 1,
+            'requests': 10, 'errors': errors, 'p50_ms': p95 / 2, 'p95_ms': p95, 'images_per_second': images_per_second}
+
+
+def test_pick_per_target():
+    fast = trial(50.0, 100.0)
+    snappy = trial(10.0, 40.0)
+    broken = trial(1.0, 1000.0, errors=1)
+    trials = [fast, snappy, broken]
+    assert pick(trials, 'latency') is snappy
+    assert pick(trials, 'throughput') is fast
+    assert pick(trials, 'throughput', latency_budget_ms=20.0) is snappy
+    assert pick(trials, 'throughput', latency_budget_ms=5.0) is fast
+    assert pick([broken], 'latency') is None
+
+
+def test_profile_round_trip_and_backend_check(tmp_path):
+    path = str(tmp_path / 'cpu_profile.json')
+    args = argparse.Namespace(backend='tflite', quantize='none', seconds=1.0)
+    write_profile(path, args, [], {'latency': {'intra_op_threads': 2, 'batch_size': 1, 'p95_ms': 5.0}})
+
+    assert load_profile(path, 'latency', backend='tflite') == {'intra_op_threads': 2, 'batch_size': 1}
+    assert load_profile(path, 'latency', backend='keras') == {}
+    assert load_profile(path, 'throughput') == {}
+    assert load_profile(str(tmp_path / 'missing.json')) == {}
+    with open(path) as f:
+        assert json.load(f)['host']['cpu_count'] == os.cpu_count()
@@ -0,0 +1,65 @@
+import threading
+
+import numpy as np
+import pytest
+
+from batching import MicroBatcher
+
+
+def test_concurrent_submits_share_one_forward_pass():
+    calls = []
+    gate = threading.Event()
+
+    def predict(batch):
+        calls.append(len(batch))
+        return batch * 2
+
+    batcher = MicroBatcher(predict, max_batch_size=4, max_wait_ms=2000, name='test')
+    try:
+        results = {}
+
+        def submit(i):
+            gate.wait()
+            results[i] = batcher.submit(np.full((3,), i, dtype=np.float32), timeout=10)
+
+        threads = [threading.Thread(target=submit, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        gate.set()
+        for thread in threads:
+            thread.join(10)
+
+        assert calls == [4]
+        for i in range(4):
+            np.testing.assert_array_equal(results[i], np.full((3,), 2 * i))
+        stats = batcher.stats()
+        assert stats['requests'] == 4 and stats['batches'] == 1
+        assert stats['batch_size_histogram'] == {'4': 1}
+    finally:
+        batcher.close()
+
+
+def test_lone_sample_is_dispatched_after_max_wait():
+    batcher = MicroBatcher(lambda batch: batch + 1, max_batch_size=8, max_wait_ms=5)
+    try:
+        future = batcher.submit_async(np.zeros(2, dtype=np.float32))
+        np.testing.assert_array_equal(future.result(timeout=5), np.ones(2))
+        assert future.timings['batch_size'] == 1
+        assert future.timings['queue_wait'] >= 0
+    finally:
+        batcher.close()
+
+
+def test_predict_errors_reach_every_caller_in_the_batch():
+    def predict(batch):
+        raise RuntimeError('model failed')
+
+    batcher = MicroBatcher(predict, max_batch_size=2, max_wait_ms=1000)
+    try:
+        futures = [batcher.submit_async(np.zeros(1)) for _ in range(2)]
+        for future in futures:
+            with pytest.raises(RuntimeError, match='model failed'):
+                future.result(timeout=5)
+        assert batcher.stats()['errors'] == 1
+    finally:
+        batcher.close()
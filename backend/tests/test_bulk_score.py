@@ -0,0 +1,98 @@
+import csv
+
+import numpy as np
+import pytest
+
+import bulk_score
+from conftest import image_bytes
+
+
+@pytest.fixture
+def runners(monkeypatch):
+    """Stub models: the mask echoes the input, every image is called a Glioma."""
+    scored = []
+
+    def segmentation(batch):
+        scored.append(len(batch))
+        return np.asarray(batch)
+
+    def classification(batch):
+        return np.tile(np.array([0.7, 0.1, 0.1, 0.1], dtype=np.float32), (len(batch), 1))
+
+    monkeypatch.setattr(bulk_score, 'load_runners', lambda *args: (segmentation, classification))
+    return scored
+
+
+def read_rows(path):
+    with open(path, newline='') as f:
+        return list(csv.DictReader(f))
+
+
+def score(source, output, *extra):
+    return bulk_score.main([str(source), '--output', str(output), '--workers', '1', '--batch-size', '2', *extra])
+
+
+def test_every_image_gets_a_row_and_unreadable_ones_an_error(tmp_path, runners):
+    images = tmp_path / 'images'
+    (images / 'sub').mkdir(parents=True)
+    (images / 'a.png').write_bytes(image_bytes(seed=1))
+    (images / 'sub' / 'b.jpg').write_bytes(image_bytes(seed=2, fmt='JPEG'))
+    (images / 'broken.png').write_bytes(b'not an image')
+    (images / 'notes.txt').write_text('skipped, not an image name')
+    output = tmp_path / 'results.csv'
+
+    assert score(images, output, '--masks-dir', str(tmp_path / 'masks')) == 0
+
+    rows = {row['path']: row for row in read_rows(output)}
+    assert set(rows) == {str(images / 'a.png'), str(images / 'sub' / 'b.jpg'), str(images / 'broken.png')}
+    assert list(read_rows(output)[0]) == bulk_score.COLUMNS
+    good = rows[str(images / 'a.png')]
+    assert good['class'] == 'Glioma' and good['error'] == ''
+    assert 0 < int(good['mask_area']) <= 128 * 128
+    assert rows[str(images / 'broken.png')]['error']
+    assert sorted(p.name for p in (tmp_path / 'masks').iterdir()) == ['a_mask.png', 'sub__b_mask.png']
+    assert not (tmp_path / 'results.csv.partial.csv').exists()
+
+
+def test_resume_skips_scored_images_and_retries_failed_ones(tmp_path, runners):
+    images = tmp_path / 'images'
+    images.mkdir()
+    for name in ('a.png', 'b.png', 'c.png'):
+        (images / name).write_bytes(image_bytes(seed=len(name)))
+    output = tmp_path / 'results.csv'
+    journal = tmp_path / 'results.csv.partial.csv'
+    # An interrupted run that scored a.png and failed on b.png
+    with open(journal, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=bulk_score.COLUMNS)
+        writer.writeheader()
+        writer.writerow({'path': str(images / 'a.png'), 'class': 'Meningioma', 'confidence': 0.9})
+        writer.writerow({'path': str(images / 'b.png'), 'error': 'cannot identify image file'})
+
+    assert score(images, output) == 0
+
+    rows = read_rows(output)
+    assert sorted(row['path'] for row in rows) == [str(images / name) for name in ('a.png', 'b.png', 'c.png')]
+    assert all(row['error'] == '' for row in rows)
+    # a.png kept its journaled result; b.png and c.png went through the models
+    assert {row['path']: row['class'] for row in rows}[str(images / 'a.png')] == 'Meningioma'
+    assert sum(runners) == 2
+
+
+def test_manifest_paths_are_relative_to_the_manifest(tmp_path):
+    (tmp_path / 'scans').mkdir()
+    manifest = tmp_path / 'manifest.txt'
+    manifest.write_text('# comment\nscans/a.png\n\n/abs/b.png\n')
+    assert bulk_score.list_inputs(str(manifest)) == [str(tmp_path / 'scans' / 'a.png'), '/abs/b.png']
+
+
+def test_load_checkpoint_leaves_a_clean_journal_untouched(tmp_path):
+    journal = tmp_path / 'results.csv.partial.csv'
+    with open(journal, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=bulk_score.COLUMNS)
+        writer.writeheader()
+        writer.writerow({'path': 'a.png', 'class': 'Glioma'})
+    before = journal.read_bytes()
+
+    assert bulk_score.load_checkpoint(str(journal)) == {'a.png'}
+    assert journal.read_bytes() == before
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['results.csv.partial.csv']
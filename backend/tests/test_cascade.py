@@ -0,0 +1,25 @@
+from cascade import CascadePolicy
+
+CLASS_NAMES = ['Glioma', 'Meningioma', 'Pituitary', 'No Tumour']
+
+
+def test_only_confident_no_tumour_skips_segmentation():
+    policy = CascadePolicy(CLASS_NAMES, enabled=True, threshold=0.9)
+    assert not policy.needs_segmentation([0.02, 0.02, 0.01, 0.95])
+    assert policy.needs_segmentation([0.1, 0.1, 0.1, 0.7])
+    assert policy.needs_segmentation([0.95, 0.02, 0.02, 0.01])
+
+
+def test_disabled_policy_always_segments():
+    policy = CascadePolicy(CLASS_NAMES, enabled=False)
+    assert policy.needs_segmentation([[0.0, 0.0, 0.0, 1.0]])
+
+
+def test_stats_count_skips_and_estimate_savings():
+    policy = CascadePolicy(CLASS_NAMES, enabled=True)
+    for segmented in (True, False, False, True):
+        policy.record(segmented)
+    stats = policy.stats(segmentation_ms=50.0)
+    assert stats['segmentation_skipped'] == 2 and stats['skip_rate'] == 0.5
+    assert stats['segmentation_ms_saved_estimate'] == 100.0
+    assert policy.stages(False) == ['classification']
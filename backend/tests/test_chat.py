@@ -0,0 +1,38 @@
+import time
+
+from chat import CHAT_INSTRUCTIONS, ChatCache, build_chat_messages, build_messages, normalize_message
+
+
+def test_key_ignores_case_whitespace_and_trailing_punctuation():
+    details = {'tumorType': 'Glioma', 'confidence': 0.9}
+    key = ChatCache.make_key(build_chat_messages('What is a glioma?', details))
+    assert normalize_message('  What   is a Glioma?? ') == 'what is a glioma'
+    assert key == ChatCache.make_key(build_chat_messages('what is  a glioma', details))
+    assert key != ChatCache.make_key(build_chat_messages('What is a glioma?', {}))
+    # /chat and the generic assistant prompt don't share answers
+    assert key != ChatCache.make_key(build_messages('What is a glioma?', details))
+
+
+def test_chat_prompt_keeps_the_disclaimer_instruction():
+    messages = build_chat_messages('Is it serious?', {'tumorType': 'Glioma', 'confidence': 0.93, 'hasTumor': True})
+    assert [m['role'] for m in messages] == ['system', 'user']
+    assert 'Always include appropriate medical disclaimers.' in CHAT_INSTRUCTIONS
+    assert messages[0]['content'].endswith(CHAT_INSTRUCTIONS)
+    assert '- Tumor Type: Glioma' in messages[0]['content'] and 'Confidence: 93.0%' in messages[0]['content']
+
+
+def test_entries_expire_and_the_oldest_is_evicted():
+    cache = ChatCache(ttl=0.05, max_entries=2)
+    for key in 'abc':
+        cache.put(key, key.upper())
+    assert cache.get('a') is None and cache.get('c') == 'C'
+    time.sleep(0.06)
+    assert cache.get('c') is None
+    stats = cache.stats()
+    assert stats['expired'] == 1 and stats['hits'] == 1 and stats['misses'] == 2
+
+
+def test_scan_details_become_a_system_message():
+    messages = build_messages('hi', {'tumorType': 'Glioma', 'confidence': 0.93, 'hasTumor': True})
+    assert [m['role'] for m in messages] == ['system', 'system', 'user']
+    assert 'Confidence: 93.0%' in messages[1]['content']
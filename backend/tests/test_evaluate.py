@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+
+from evaluate import (Evaluation, classification_report, confusion_matrix, label_index, list_pairs,
+                      paired_comparison, segmentation_scores)
+
+NAMES = ['Glioma', 'Meningioma', 'Pituitary', 'No Tumour']
+
+
+def test_dice_and_iou_match_hand_computed_values():
+    pred = np.array([[[1, 1], [0, 0]], [[0, 0], [0, 0]]], dtype=bool)
+    true = np.array([[[1, 0], [1, 0]], [[0, 0], [0, 0]]], dtype=bool)
+    scores = segmentation_scores(pred, true)
+
+    assert scores['intersection'].tolist() == [1, 0]
+    np.testing.assert_allclose(scores['dice'], [0.5, 1.0], atol=1e-6)
+    np.testing.assert_allclose(scores['iou'], [1 / 3, 1.0], atol=1e-6)
+
+
+def test_disjoint_masks_score_zero():
+    pred = np.array([[1, 0, 0, 0]], dtype=bool)
+    true = np.array([[0, 0, 0, 1]], dtype=bool)
+    scores = segmentation_scores(pred, true)
+    assert scores['dice'][0] < 1e-5 and scores['iou'][0] < 1e-5
+
+
+def test_confusion_matrix_and_per_class_report():
+    matrix = confusion_matrix(np.array([0, 0, 1, 2]), np.array([0, 1, 1, 0]), 4)
+    assert matrix.tolist() == [[1, 1, 0, 0], [0, 1, 0, 0], [1, 0, 0, 0], [0, 0, 0, 0]]
+
+    report = classification_report(matrix, NAMES)
+    assert report['images'] == 4 and report['accuracy'] == 0.5
+    assert report['per_class']['Glioma'] == {'precision': 0.5, 'recall': 0.5, 'f1': 0.5, 'support': 2}
+    assert report['per_class']['Meningioma'] == {'precision': 0.5, 'recall': 1.0, 'f1': 0.6667, 'support': 1}
+    assert report['per_class']['Pituitary'] == {'precision': 0.0, 'recall': 0.0, 'f1': 0.0, 'support': 1}
+    # No support: reported as zeros and left out of the macro average
+    assert report['per_class']['No Tumour'] == {'precision': 0.0, 'recall': 0.0, 'f1': 0.0, 'support': 0}
+    assert report['macro_f1'] == round((0.5 + 2 / 3 + 0.0) / 3, 4)
+
+
+def test_empty_report():
+    report = classification_report(np.zeros((4, 4)), NAMES)
+    assert report['accuracy'] is None and report['macro_f1'] is None
+
+
+@pytest.mark.parametrize('name, index', [
+    ('glioma', 0), ('glioma_tumor', 0), ('Meningioma Tumour', 1), ('pituitary_tumor', 2),
+    ('notumor', 3), ('no_tumor', 3), ('No Tumour', 3), ('', None), (None, None), ('healthy', None),
+])
+def test_label_index_accepts_common_folder_spellings(name, index):
+    assert label_index(name) == index
+
+
+def test_list_pairs_reads_labels_from_folders_and_masks_from_siblings(tmp_path):
+    for folder, files in {'glioma_tumor': ['a.png', 'a_mask.png'], 'notumor': ['b.jpg']}.items():
+        (tmp_path / folder).mkdir()
+        for name in files:
+            (tmp_path / folder / name).write_bytes(b'')
+    assert list_pairs(str(tmp_path)) == [
+        (str(tmp_path / 'glioma_tumor' / 'a.png'), str(tmp_path / 'glioma_tumor' / 'a_mask.png'), 0),
+        (str(tmp_path / 'notumor' / 'b.jpg'), None, 3),
+    ]
+
+
+def stub_runner(outputs):
+    outputs = iter(outputs)
+    return lambda batch: next(outputs)
+
+
+def test_summary_reports_mean_and_global_dice():
+    small_pred = np.zeros((1, 4, 4, 1), dtype=np.float32)
+    small_pred[0, 0, 0] = 1.0
+    small_true = np.zeros((1, 4, 4), dtype=bool)
+    small_true[0, 3, 3] = True
+    large = np.zeros((1, 4, 4), dtype=bool)
+    large[0, :2, :] = True
+    probs = np.array([[0.9, 0.05, 0.03, 0.02]], dtype=np.float32)
+
+    evaluation = Evaluation('baseline', stub_runner([small_pred, large[..., None].astype(np.float32)]),
+                            stub_runner([probs, probs]))
+    yes, label = np.array([True]), np.array([0])
+    evaluation.update(None, None, small_true, yes, label, yes)
+    evaluation.update(None, None, large, yes, np.array([1]), yes)
+
+    summary = evaluation.summary()
+    segmentation = summary['segmentation']
+    assert segmentation['images'] == 2
+    assert segmentation['dice_mean'] == 0.5
+    # 8 overlapping pixels out of 1 + 8 predicted and 1 + 8 true
+    assert segmentation['dice_global'] == round(16 / 18, 4)
+    assert segmentation['iou_global'] == round(8 / 10, 4)
+    assert summary['classification']['confusion_matrix'][1][0] == 1
+
+
+def test_paired_comparison_counts_wins_and_losses():
+    labels = np.array([0, 1, 2])
+    has_label = np.array([True, True, True])
+    baseline = [(np.array([0, 0, 2]), None, np.array([0.5, 0.9, np.nan]), None)]
+    candidate = [(np.array([0, 1, 1]), None, np.array([0.7, 0.8, np.nan]), None)]
+
+    comparison = paired_comparison(baseline, candidate, labels, has_label)
+    assert comparison['segmentation'] == {
+        'images': 2, 'dice_delta_mean': 0.05, 'candidate_better': 1, 'candidate_worse': 1
+    }
+    assert comparison['classification'] == {
+        'images': 3, 'both_correct': 1, 'only_baseline_correct': 1, 'only_candidate_correct': 1,
+        'both_wrong': 0, 'prediction_agreement': round(1 / 3, 4)
+    }
@@ -0,0 +1,93 @@
+import sys
+import types
+
+import numpy as np
+import pytest
+
+from inference import CLASSIFICATION_INPUT_SHAPE, SEGMENTATION_INPUT_SHAPE, CompiledModel, warmup_batch_sizes
+
+
+class FakeTensor:
+    def __init__(self, value):
+        self.value = value
+
+    def numpy(self):
+        return self.value
+
+
+@pytest.fixture
+def fake_tf(monkeypatch):
+    """Just enough of ``tensorflow`` for CompiledModel: tf.function traces nothing and records its signature."""
+    traced = []
+
+    def function(fn, input_signature):
+        traced.append(input_signature)
+        return lambda x: FakeTensor(np.asarray(fn(x)))
+
+    tf = types.SimpleNamespace(
+        function=function,
+        TensorSpec=lambda shape, dtype: (tuple(shape), dtype),
+        float32='float32'
+    )
+    monkeypatch.setitem(sys.modules, 'tensorflow', tf)
+    return traced
+
+
+class StubModel:
+    """Per-sample class scores from the mean pixel, recording every batch it is called with."""
+
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, x, training=True):
+        assert training is False
+        self.batches.append(x)
+        means = x.reshape(len(x), -1).mean(axis=1)
+        return np.stack([means, 1.0 - means], axis=1)
+
+
+@pytest.mark.parametrize('max_batch_size, expected', [
+    (1, (1,)),
+    (8, (1, 2, 4, 8)),
+    (12, (1, 2, 4, 8, 12)),
+    (0, (1,)),
+])
+def test_warmup_batch_sizes_are_powers_of_two_up_to_the_maximum(max_batch_size, expected):
+    assert warmup_batch_sizes(max_batch_size) == expected
+
+
+def test_signature_is_pinned_to_the_input_shape_with_any_batch_size(fake_tf):
+    CompiledModel(StubModel(), SEGMENTATION_INPUT_SHAPE, name='segmentation')
+    CompiledModel(StubModel(), CLASSIFICATION_INPUT_SHAPE, name='classification')
+    assert fake_tf == [
+        [((None, 128, 128, 1), 'float32')],
+        [((None, 200, 200, 3), 'float32')],
+    ]
+
+
+def test_calls_are_float32_and_keep_one_output_per_input(fake_tf):
+    model = StubModel()
+    runner = CompiledModel(model, (4, 4, 1))
+    batch = np.stack([np.full((4, 4, 1), value) for value in (0.0, 0.25, 1.0)])  # float64
+
+    outputs = runner(batch)
+    assert model.batches[0].dtype == np.float32
+    np.testing.assert_allclose(outputs[:, 0], [0.0, 0.25, 1.0])
+    assert runner(batch[:1]).shape == (1, 2)
+
+
+def test_a_wrong_input_shape_is_rejected_before_the_model_runs(fake_tf):
+    model = StubModel()
+    runner = CompiledModel(model, SEGMENTATION_INPUT_SHAPE, name='segmentation')
+    with pytest.raises(ValueError, match=r'segmentation model expects input shape \(N, 128, 128, 1\)'):
+        runner(np.zeros((1, 200, 200, 3)))
+    assert model.batches == []
+
+
+def test_warmup_runs_one_pass_per_batch_size(fake_tf):
+    model = StubModel()
+    runner = CompiledModel(model, (4, 4, 1))
+    seconds = runner.warmup(warmup_batch_sizes(4))
+
+    assert [len(batch) for batch in model.batches] == [1, 2, 4]
+    assert set(seconds) == {1, 2, 4} and runner.warmup_seconds is seconds
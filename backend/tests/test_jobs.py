@@ -0,0 +1,118 @@
+import os
+import socket
+import threading
+import time
+
+import pytest
+
+from jobs import MAX_ATTEMPTS, JobQueue, JobWorkers
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / 'jobs.db'))
+
+
+def test_claims_most_urgent_lane_then_oldest(queue):
+    bulk = queue.submit(b'1', lane='bulk')
+    first = queue.submit(b'2')
+    second = queue.submit(b'3')
+    urgent = queue.submit(b'4', lane='urgent')
+
+    assert queue.position(bulk) == 3 and queue.position(urgent) == 0
+    assert queue.depth() == {'urgent': 1, 'normal': 2, 'bulk': 1}
+    claimed = [queue.claim('w') for _ in range(4)]
+    assert [job['id'] for job in claimed] == [urgent, first, second, bulk]
+    assert claimed[0]['payload'] == b'4' and claimed[0]['attempts'] == 1
+    assert queue.claim('w') is None
+
+
+def test_unknown_lane_is_rejected(queue):
+    with pytest.raises(ValueError):
+        queue.submit(b'', lane='asap')
+
+
+def test_concurrent_workers_never_claim_the_same_job(queue):
+    ids = {queue.submit(b'x') for _ in range(20)}
+    claimed = []
+
+    def drain(name):
+        while True:
+            job = queue.claim(name)
+            if job is None:
+                return
+            claimed.append(job['id'])
+
+    threads = [threading.Thread(target=drain, args=(f"w{i}",)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert sorted(claimed) == sorted(ids)
+
+
+def test_finished_jobs_keep_the_result_and_drop_the_payload(queue):
+    job_id = queue.submit(b'scan', params={'mask_format': 'rle'})
+    queue.claim('w')
+    queue.complete(job_id, {'tumor': 'Glioma'})
+
+    job = queue.wait(job_id, timeout=0)
+    assert job['status'] == 'done' and job['result'] == {'tumor': 'Glioma'}
+    assert job['params'] == {'mask_format': 'rle'}
+    assert queue.claim('w') is None
+
+
+def test_recover_requeues_jobs_of_a_dead_process(queue):
+    # A previous run of this process, e.g. before a restart
+    dead_worker = f"{socket.gethostname()}:{os.getpid()}/0"
+    retried = queue.submit(b'a')
+    exhausted = queue.submit(b'b')
+    queue.claim(dead_worker)
+    for _ in range(MAX_ATTEMPTS):
+        queue._connect().execute("UPDATE jobs SET status = 'queued' WHERE id = ?", (exhausted,))
+        assert queue.claim(dead_worker)['id'] == exhausted
+
+    assert queue.recover() == 1
+    assert queue.get(retried)['status'] == 'queued'
+    assert queue.get(exhausted)['status'] == 'failed'
+
+
+def test_recover_leaves_live_and_remote_workers_alone(queue):
+    job_id = queue.submit(b'a')
+    queue.claim('elsewhere:1/0')
+    assert queue.recover() == 0
+    assert queue.get(job_id)['status'] == 'running'
+
+
+def test_purge_deletes_only_old_finished_jobs(queue):
+    done = queue.submit(b'a')
+    queue.claim('w')
+    queue.complete(done, {})
+    queued = queue.submit(b'b')
+
+    assert queue.purge(3600) == 0
+    assert queue.purge(-1) == 1
+    assert queue.get(done) is None and queue.get(queued)['status'] == 'queued'
+
+
+def test_workers_store_results_and_errors(queue):
+    def handler(job):
+        if job['params'].get('fail'):
+            raise ValueError('bad scan')
+        return {'size': len(job['payload'])}
+
+    finished = []
+    workers = JobWorkers(queue, handler, workers=2, poll_interval=0.05,
+                         on_finish=lambda job, ok: finished.append(ok))
+    try:
+        ok_id = queue.submit(b'abc')
+        failed_id = queue.submit(b'', params={'fail': True})
+        assert queue.wait(ok_id, timeout=10)['result'] == {'size': 3}
+        failed = queue.wait(failed_id, timeout=10)
+        assert failed['status'] == 'failed' and failed['error'] == 'bad scan'
+    finally:
+        workers.close()
+    deadline = time.monotonic() + 5
+    while len(finished) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert sorted(finished) == [False, True]
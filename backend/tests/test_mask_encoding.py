@@ -0,0 +1,55 @@
+import json
+
+import numpy as np
+import pytest
+
+from mask_encoding import MASK_FORMATS, decode_mask, encode_mask, encode_rle, negotiate_format
+
+
+def ellipse_mask(size=32):
+    rows, cols = np.ogrid[:size, :size]
+    return ((rows - 12) / 6.0) ** 2 + ((cols - 18) / 9.0) ** 2 <= 1
+
+
+@pytest.mark.parametrize('mask_format', ['list', 'png', 'rle', 'bits'])
+def test_lossless_formats_round_trip_through_json(mask_format):
+    mask = ellipse_mask()
+    encoded = json.loads(json.dumps(encode_mask(mask.astype(np.float32)[..., None], mask_format)))
+    np.testing.assert_array_equal(decode_mask(encoded, mask_format), mask)
+
+
+def test_rle_counts_start_with_a_zero_run():
+    mask = np.array([[1, 1, 0], [0, 1, 1]], dtype=bool)
+    assert encode_rle(mask)['counts'] == [0, 2, 2, 2]
+    assert encode_rle(np.zeros((2, 2), dtype=bool))['counts'] == [4]
+
+
+def test_polygons_cover_a_convex_region():
+    pytest.importorskip('scipy')
+    mask = ellipse_mask()
+    encoded = encode_mask(mask, 'polygons')
+    assert encoded['area'] == int(mask.sum()) and len(encoded['polygons']) == 1
+    np.testing.assert_array_equal(decode_mask(encoded, 'polygons'), mask)
+
+
+def test_polygons_of_many_regions_land_at_their_own_offsets():
+    pytest.importorskip('scipy')
+    mask = np.zeros((64, 96), dtype=bool)
+    mask[0:3, 0:2] = True
+    mask[10:14, 50:60] = True
+    mask[40:41, 90:96] = True
+    mask[60:64, 5:6] = True
+    mask[30, 30] = True
+    encoded = encode_mask(mask, 'polygons')
+    assert len(encoded['polygons']) == 5
+    assert encoded['bbox'] == {'x': 0, 'y': 0, 'width': 96, 'height': 64}
+    np.testing.assert_array_equal(decode_mask(encoded, 'polygons'), mask)
+
+
+def test_negotiate_format_prefers_the_query_then_accept():
+    assert negotiate_format('RLE', 'application/json; mask-format=bits', 'png') == 'rle'
+    assert negotiate_format(None, 'application/json; mask-format="bits"', 'png') == 'bits'
+    assert negotiate_format(None, None, 'png') == 'png'
+    with pytest.raises(ValueError):
+        negotiate_format('jpeg', None, 'png')
+    assert set(MASK_FORMATS) >= {'list', 'png', 'rle', 'bits', 'polygons'}
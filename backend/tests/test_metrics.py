@@ -0,0 +1,48 @@
+from metrics import Registry, observe_stages
+
+
+def test_counter_and_histogram_render_prometheus_text():
+    registry = Registry(prefix='app_')
+    requests = registry.counter('requests_total', 'Requests.', ('endpoint',))
+    latency = registry.histogram('stage_seconds', 'Stage time.', ('stage',), buckets=(0.01, 0.1))
+    requests.inc(endpoint='analyze')
+    requests.inc(2, endpoint='analyze')
+    observe_stages(latency, {'decode': 5.0, 'predict': 50.0})
+    latency.observe(1.0, stage='predict')
+
+    text = registry.render()
+    assert '# TYPE app_requests_total counter' in text
+    assert 'app_requests_total{endpoint="analyze"} 3' in text
+    assert 'app_stage_seconds_bucket{stage="decode",le="0.01"} 1' in text
+    assert 'app_stage_seconds_bucket{stage="predict",le="0.1"} 1' in text
+    assert 'app_stage_seconds_bucket{stage="predict",le="+Inf"} 2' in text
+    assert 'app_stage_seconds_count{stage="predict"} 2' in text
+
+
+def test_gauges_are_read_at_scrape_time_and_skip_failures():
+    registry = Registry()
+    depth = {'urgent': 1}
+    registry.gauge('queue_depth', 'Depth.', lambda: dict(depth), labelname='lane')
+    registry.gauge('broken', 'Raises.', lambda: 1 / 0)
+    depth['bulk'] = 4
+
+    text = registry.render()
+    assert 'queue_depth{lane="bulk"} 4' in text and 'queue_depth{lane="urgent"} 1' in text
+    assert '# TYPE broken gauge' in text and '\nbroken ' not in text
+
+
+def test_callback_counters_render_running_totals_as_counters():
+    registry = Registry(prefix='app_')
+    stats = {'hits': 2}
+    registry.callback_counter('cache_hits_total', 'Hits.', lambda: stats['hits'])
+    stats['hits'] += 1
+
+    text = registry.render()
+    assert '# TYPE app_cache_hits_total counter' in text
+    assert 'app_cache_hits_total 3' in text
+
+
+def test_label_values_are_escaped():
+    registry = Registry()
+    registry.counter('errors_total', 'Errors.', ('message',)).inc(message='bad "file"\n')
+    assert 'errors_total{message="bad \\"file\\"\\n"} 1' in registry.render()
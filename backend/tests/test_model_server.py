@@ -0,0 +1,82 @@
+import os
+import shutil
+import socket
+import tempfile
+import threading
+
+import numpy as np
+import pytest
+
+from conftest import FakeRunner
+from model_server import ModelClient, ModelServer, _Handler, _UnixServer, recv_message, send_message
+
+
+class WideRunner(FakeRunner):
+    """Returns more bytes than it was given, so the client has to grow its shared buffer."""
+
+    def __call__(self, batch):
+        batch = super().__call__(batch)
+        return np.repeat(batch, 400_000, axis=1)
+
+
+@pytest.fixture
+def server():
+    # AF_UNIX paths are limited to ~100 bytes, which pytest's tmp_path can exceed
+    directory = tempfile.mkdtemp(prefix='models-')
+    path = os.path.join(directory, 'models.sock')
+    runners = {'echo': FakeRunner('echo', (4,)), 'wide': WideRunner('wide', (1,))}
+    for runner in runners.values():
+        runner.warmup((1, 2))
+    unix_server = _UnixServer(path, _Handler)
+    unix_server.model_server = ModelServer(runners, max_batch_size=4, max_wait_ms=5)
+    thread = threading.Thread(target=unix_server.serve_forever, daemon=True)
+    thread.start()
+    yield path
+    unix_server.shutdown()
+    unix_server.server_close()
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+def test_messages_are_length_prefixed_json():
+    left, right = socket.socketpair()
+    with left, right:
+        send_message(left, {'op': 'info', 'values': [1, 2]})
+        assert recv_message(right) == {'op': 'info', 'values': [1, 2]}
+        left.close()
+        assert recv_message(right) is None
+
+
+def test_client_round_trips_batches_through_shared_memory(server):
+    client = ModelClient(server, timeout=10)
+    try:
+        info = client.wait_ready(timeout=10)
+        assert info['models']['echo']['input_shape'] == [4]
+
+        runner = client.runner('echo')
+        assert runner.warmup() == {1: 0.0, 2: 0.0}
+        batch = np.arange(8, dtype=np.float32).reshape(2, 4)
+        np.testing.assert_array_equal(runner(batch), batch)
+
+        sample = np.ones(4, dtype=np.float32)
+        np.testing.assert_array_equal(client.batcher('echo').submit(sample, timeout=10), sample)
+        assert client.batcher('echo').stats()['requests'] == 1
+    finally:
+        client.close()
+
+
+def test_client_grows_its_buffer_when_the_output_does_not_fit(server):
+    client = ModelClient(server, timeout=10)
+    try:
+        output = client.runner('wide')(np.full((1, 1), 3.0, dtype=np.float32))
+        assert output.shape == (1, 400_000) and np.all(output == 3.0)
+    finally:
+        client.close()
+
+
+def test_server_errors_are_raised_in_the_client(server):
+    client = ModelClient(server, timeout=10)
+    try:
+        with pytest.raises(RuntimeError, match='Unknown model'):
+            client.call('predict', 'missing', np.zeros((1, 4), dtype=np.float32))
+    finally:
+        client.close()
@@ -0,0 +1,89 @@
+import io
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+from conftest import BACKEND_DIR, FakeRunner, fake_loader, image_bytes
+
+pytest.importorskip('fastapi')
+pytest.importorskip('httpx')
+
+
+class GatedRunner(FakeRunner):
+    """A classifier that holds every call until the test opens the gate."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.gate = threading.Event()
+
+    def __call__(self, batch):
+        assert self.gate.wait(10)
+        return super().__call__(batch)
+
+
+@pytest.fixture(scope='module')
+def service():
+    from fastapi.testclient import TestClient
+
+    os.environ.update(INFERENCE_BACKEND='tflite', TUNING_PROFILE='', MAX_PENDING_REQUESTS='1',
+                      REQUEST_TIMEOUT_S='0.2', RETRY_AFTER_S='7')
+    sys.path.insert(0, os.path.dirname(BACKEND_DIR))
+    from mri_service import main
+
+    registry = main.model_registry
+    deadline = time.monotonic() + 30
+    while any(m['state'] in ('pending', 'loading') for m in registry.status().values()):
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    registry.loader = fake_loader
+    for name in ('segmentation', 'classification'):
+        assert registry.load(name)
+    # One event loop for the whole module, as under uvicorn: slots are released by loop callbacks
+    with TestClient(main.app) as client:
+        yield main, client
+
+
+def post_scan(client, seed=0):
+    return client.post('/process-mri/?mask_format=rle',
+                       files={'file': ('scan.png', io.BytesIO(image_bytes(seed=seed)), 'image/png')})
+
+
+def test_process_mri_answers_with_a_compact_mask(service):
+    _, client = service
+    response = post_scan(client)
+    assert response.status_code == 200
+    body = response.json()
+    assert body['status'] == 'success' and body['classification'] == 'Glioma'
+    assert body['segmentation']['format'] == 'rle'
+
+
+def test_slow_inference_times_out_and_keeps_its_slot(service):
+    main, client = service
+    classification = main.model_registry.get('classification')
+    gated = GatedRunner('classification', classification.input_shape, classification.probabilities)
+    main.model_registry._slots['classification']['runner'] = gated
+    try:
+        timed_out = post_scan(client, seed=1)
+        assert timed_out.status_code == 504
+        assert timed_out.headers['Retry-After'] == '7'
+
+        # The timed-out scan still runs, so the single admission slot is taken
+        busy = post_scan(client, seed=2)
+        assert busy.status_code == 503
+        assert busy.headers['Retry-After'] == '7'
+        assert main.rejected_requests >= 1 and main.timed_out_requests >= 1
+        text = client.get('/metrics').text
+        assert '# TYPE mri_service_rejected_requests_total counter' in text
+        assert f'mri_service_timed_out_requests_total {main.timed_out_requests}' in text
+    finally:
+        gated.gate.set()
+        main.model_registry._slots['classification']['runner'] = classification
+
+    deadline = time.monotonic() + 10
+    while main.pending_requests and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert main.pending_requests == 0
+    assert post_scan(client, seed=3).status_code == 200
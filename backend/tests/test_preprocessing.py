@@ -0,0 +1,151 @@
+import io
+import time
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from preprocessing import StageTimer, allocate_batch, full_resolution_gray, prepare, prepare_batch, to_float32
+
+
+def encode(array, fmt='PNG', mode=None):
+    buffer = io.BytesIO()
+    Image.fromarray(array, mode=mode).save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def gradient(height, width):
+    return np.tile(np.linspace(0, 255, width).astype(np.uint8), (height, 1))
+
+
+def assert_model_inputs(prepared):
+    assert prepared.segmentation.shape == (128, 128, 1)
+    assert prepared.classification.shape == (200, 200, 3)
+    for array in (prepared.segmentation, prepared.classification):
+        assert array.dtype == np.float32
+        assert 0.0 <= array.min() and array.max() <= 1.0
+
+
+def test_grayscale_png_gives_float32_inputs_in_the_unit_range():
+    prepared = prepare(encode(gradient(300, 300)))
+    assert_model_inputs(prepared)
+    assert prepared.source_format == 'PNG' and prepared.original_mode == 'L'
+    assert prepared.image.mode == 'L'
+    # The gradient survives resizing: dark on the left, bright on the right
+    assert prepared.segmentation[:, 0].mean() < 0.05 and prepared.segmentation[:, -1].mean() > 0.95
+    np.testing.assert_allclose(prepared.classification[..., 0], prepared.classification[..., 2])
+
+
+def test_rgba_is_flattened_to_rgb():
+    rgba = np.zeros((64, 64, 4), dtype=np.uint8)
+    rgba[..., 0] = 255
+    rgba[..., 3] = 128
+    prepared = prepare(encode(rgba, mode='RGBA'))
+    assert_model_inputs(prepared)
+    assert prepared.original_mode == 'RGBA' and prepared.image.mode == 'RGB'
+    np.testing.assert_allclose(prepared.classification[..., 0], 1.0)
+    np.testing.assert_allclose(prepared.classification[..., 1:], 0.0)
+
+
+def test_16_bit_scans_are_stretched_instead_of_clipped():
+    scan = np.tile(np.linspace(0, 4095, 64), (64, 1)).astype(np.uint16)  # 12 bits in a 16-bit PNG
+    prepared = prepare(encode(scan))
+    assert_model_inputs(prepared)
+    assert prepared.original_mode.startswith('I')
+    assert prepared.image.mode == 'L'
+    assert prepared.segmentation[:, 0].mean() < 0.05 and prepared.segmentation[:, -1].mean() > 0.95
+    assert 0.4 < prepared.segmentation.mean() < 0.6
+
+
+def test_a_flat_16_bit_image_does_not_divide_by_zero():
+    prepared = prepare(encode(np.full((32, 32), 1000, dtype=np.uint16)))
+    assert not np.isnan(prepared.segmentation).any()
+    assert prepared.segmentation.max() == 0.0
+
+
+def test_large_jpegs_are_draft_decoded_but_not_below_the_model_size():
+    # libjpeg reduces by powers of two while staying at least 200px: 1600 / 8, but 1500 / 4
+    for size, drafted in ((1600, 200), (1500, 375)):
+        prepared = prepare(encode(gradient(size, size), fmt='JPEG'))
+        assert_model_inputs(prepared)
+        assert prepared.original_size == (size, size)
+        assert prepared.image.size == (drafted, drafted)
+
+
+def test_jpeg_bytes_reuses_a_jpeg_upload_and_re_encodes_anything_else():
+    jpeg = encode(gradient(64, 64), fmt='JPEG')
+    assert prepare(jpeg).jpeg_bytes() is jpeg
+
+    timer = StageTimer()
+    encoded = prepare(encode(gradient(64, 64))).jpeg_bytes(timer)
+    assert Image.open(io.BytesIO(encoded)).format == 'JPEG'
+    assert 'encode' in timer.timings
+
+
+def test_prepare_batch_writes_into_preallocated_buffers():
+    buffers = allocate_batch(4)
+    uploads = [encode(np.full((50, 50), value, dtype=np.uint8)) for value in (0, 255)]
+    prepared, segmentation, classification = prepare_batch(uploads, buffers=buffers)
+
+    assert len(prepared) == 2
+    assert segmentation.shape == (2, 128, 128, 1) and classification.shape == (2, 200, 200, 3)
+    assert np.shares_memory(segmentation, buffers[0]) and np.shares_memory(classification, buffers[1])
+    assert segmentation[0].max() == 0.0 and segmentation[1].min() == 1.0
+    assert np.shares_memory(prepared[1].segmentation, buffers[0])
+
+
+def test_to_float32_scales_without_a_float64_step():
+    out = to_float32(np.array([0, 51, 255], dtype=np.uint8))
+    assert out.dtype == np.float32
+    np.testing.assert_allclose(out, [0.0, 0.2, 1.0], rtol=1e-6)
+
+
+def test_stage_timer_accumulates_per_stage():
+    timer = StageTimer()
+    with timer.stage('decode'):
+        time.sleep(0.002)
+    with timer.stage('decode'):
+        pass
+    with pytest.raises(RuntimeError):
+        with timer.stage('resize'):
+            raise RuntimeError('still timed')
+    timings = timer.as_dict()
+    assert set(timings) == {'decode', 'resize'}
+    assert timings['decode'] >= 2.0
+    timings['decode'] = 0.0
+    assert timer.timings['decode'] >= 2.0
+
+
+def test_prepare_times_each_stage():
+    timer = StageTimer()
+    prepare(encode(gradient(64, 64)), timer)
+    assert set(timer.as_dict()) == {'decode', 'resize', 'normalize'}
+
+
+def test_full_resolution_gray_decodes_a_drafted_jpeg_again():
+    timer = StageTimer()
+    prepared = prepare(encode(gradient(900, 1200), fmt='JPEG'), timer)
+    assert prepared.image.size == (300, 225)
+
+    gray = full_resolution_gray(prepared, timer)
+    assert gray.shape == (900, 1200) and gray.dtype == np.uint8
+    assert 'decode_full' in timer.timings
+
+
+def test_full_resolution_gray_reuses_an_image_decoded_at_full_size():
+    for data in (encode(gradient(120, 80)), encode(np.zeros((120, 80, 3), dtype=np.uint8), fmt='JPEG')):
+        prepared = prepare(data)
+        gray = full_resolution_gray(prepared)
+        assert gray.shape == (120, 80)
+        np.testing.assert_array_equal(gray, np.asarray(prepared.image.convert('L')))
+
+
+def test_stage_timer_filters_to_named_stages():
+    from preprocessing import PREPROCESSING_STAGES
+
+    timer = StageTimer()
+    for name in ('decode', 'segmentation_predict', 'normalize'):
+        with timer.stage(name):
+            pass
+    assert set(timer.as_dict(PREPROCESSING_STAGES)) == {'decode', 'normalize'}
+    assert set(timer.as_dict()) == {'decode', 'segmentation_predict', 'normalize'}
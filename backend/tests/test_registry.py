@@ -0,0 +1,92 @@
+import threading
+
+import pytest
+
+from conftest import FakeRunner
+from registry import ModelNotReady, ModelRegistry
+
+
+def make_registry(tmp_path, fail_paths=()):
+    def loader(name, path):
+        if path in fail_paths:
+            raise OSError(f"cannot read {path}")
+        runner = FakeRunner(name, (2,))
+        runner.path = path
+        return runner
+
+    registry = ModelRegistry(loader, warmup_sizes=(1, 4))
+    for name in ('segmentation', 'classification'):
+        path = tmp_path / f"{name}.h5"
+        path.write_bytes(name.encode())
+        registry.register(name, str(path))
+    return registry
+
+
+def test_ready_after_every_model_loads_and_fires_on_ready_once(tmp_path):
+    registry = make_registry(tmp_path)
+    fired = []
+    registry.on_ready(lambda: fired.append(True))
+
+    with pytest.raises(ModelNotReady):
+        registry.get('segmentation')
+    registry.start().join(10)
+
+    assert registry.ready() and fired == [True]
+    status = registry.status()['segmentation']
+    assert status['state'] == 'ready' and status['version'] and status['warmup_seconds'] == {1: 0.0, 4: 0.0}
+    registry.swap('segmentation', wait=True)
+    assert fired == [True]
+    registry.on_ready(lambda: fired.append('late'))
+    assert fired == [True, 'late']
+
+
+def test_swap_replaces_the_runner_and_version(tmp_path):
+    registry = make_registry(tmp_path)
+    registry.start().join(10)
+    old_runner = registry.get('classification')
+    old_version = registry.version('classification')
+    predict = registry.predictor('classification')
+
+    new_path = tmp_path / 'classification_v2.h5'
+    new_path.write_bytes(b'retrained')
+    assert registry.swap('classification', str(new_path), wait=True)
+
+    new_runner = registry.get('classification')
+    assert new_runner is not old_runner and new_runner.path == str(new_path)
+    assert registry.version('classification') != old_version
+    assert registry.status()['classification']['swaps'] == 1
+    predict([[0.0, 0.0]])
+    assert new_runner.calls == 1 and old_runner.calls == 0
+
+
+def test_failed_swap_keeps_the_serving_version(tmp_path):
+    broken = str(tmp_path / 'broken.h5')
+    registry = make_registry(tmp_path, fail_paths=(broken,))
+    registry.start().join(10)
+    runner = registry.get('segmentation')
+
+    assert registry.swap('segmentation', broken, wait=True) is False
+    assert registry.get('segmentation') is runner
+    status = registry.status()['segmentation']
+    assert status['state'] == 'ready' and 'cannot read' in status['error']
+    assert registry.failed() == {}
+
+
+def test_failed_first_load_is_reported(tmp_path):
+    registry = make_registry(tmp_path, fail_paths=(str(tmp_path / 'segmentation.h5'),))
+    registry.start().join(10)
+    assert not registry.ready()
+    assert 'segmentation' in registry.failed()
+    assert registry.wait_ready(timeout=1) is False
+
+
+def test_concurrent_swaps_are_serialized(tmp_path):
+    registry = make_registry(tmp_path)
+    registry.start().join(10)
+    threads = [threading.Thread(target=registry.swap, args=('segmentation',), kwargs={'wait': True})
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert registry.status()['segmentation']['swaps'] == 4
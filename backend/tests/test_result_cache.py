@@ -0,0 +1,45 @@
+import json
+
+from result_cache import ResultCache, file_version
+
+
+def test_key_depends_on_bytes_and_model_versions():
+    key = ResultCache.make_key(b'image', {'segmentation': 'a', 'classification': 'b'})
+    assert key == ResultCache.make_key(b'image', {'classification': 'b', 'segmentation': 'a'})
+    assert key != ResultCache.make_key(b'image', {'segmentation': 'a2', 'classification': 'b'})
+    assert key != ResultCache.make_key(b'other', {'segmentation': 'a', 'classification': 'b'})
+
+
+def test_memory_tier_evicts_least_recently_used():
+    entry_size = len(json.dumps({'value': 0}))
+    cache = ResultCache(max_bytes=2 * entry_size)
+    cache.put('a', {'value': 0})
+    cache.put('b', {'value': 1})
+    assert cache.get('a') == {'value': 0}
+    cache.put('c', {'value': 2})
+
+    assert cache.get('b') is None
+    assert cache.get('a') == {'value': 0}
+    assert cache.get('c') == {'value': 2}
+    stats = cache.stats()
+    assert stats['evictions'] == 1 and stats['entries'] == 2
+    assert stats['memory_hits'] == 3 and stats['misses'] == 1
+
+
+def test_disk_tier_survives_a_new_cache(tmp_path):
+    ResultCache(disk_dir=str(tmp_path)).put('abcdef', {'tumor': 'Glioma'})
+
+    cache = ResultCache(disk_dir=str(tmp_path))
+    assert cache.get('abcdef') == {'tumor': 'Glioma'}
+    assert cache.get('abcdef') == {'tumor': 'Glioma'}
+    stats = cache.stats()
+    assert stats['disk_hits'] == 1 and stats['memory_hits'] == 1
+
+
+def test_file_version_follows_content(tmp_path):
+    path = tmp_path / 'model.h5'
+    path.write_bytes(b'v1')
+    first = file_version(str(path))
+    path.write_bytes(b'v2')
+    assert file_version(str(path)) != first
+    assert len(first) == 12
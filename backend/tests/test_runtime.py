@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+from runtime import (
+    TFLiteModel, _dequantize, _quantize, dice_scores, load_runner, load_runners, parity_check,
+    resolve_tflite_path, tflite_model_path
+)
+
+
+@pytest.mark.parametrize('quantization, expected', [
+    ('none', 'models/seg.tflite'),
+    (None, 'models/seg.tflite'),
+    ('float16', 'models/seg.float16.tflite'),
+    ('int8', 'models/seg.int8.tflite'),
+])
+def test_tflite_model_path_sits_next_to_the_keras_file(quantization, expected):
+    assert tflite_model_path('models/seg.h5', quantization) == expected
+
+
+def test_resolve_tflite_path_finds_the_export_for_the_mode(tmp_path):
+    keras_path = str(tmp_path / 'seg.h5')
+    (tmp_path / 'seg.int8.tflite').write_bytes(b'')
+    assert resolve_tflite_path(keras_path, 'int8') == str(tmp_path / 'seg.int8.tflite')
+    # An explicit .tflite path is used as is
+    assert resolve_tflite_path(str(tmp_path / 'seg.int8.tflite')) == str(tmp_path / 'seg.int8.tflite')
+
+
+def test_resolve_tflite_path_rejects_unknown_modes_and_missing_exports(tmp_path):
+    keras_path = str(tmp_path / 'seg.h5')
+    with pytest.raises(ValueError, match='Unknown quantization mode'):
+        resolve_tflite_path(keras_path, 'int4')
+    with pytest.raises(FileNotFoundError, match='export_models.py --quantize float16'):
+        resolve_tflite_path(keras_path, 'float16')
+
+
+def test_load_runners_rejects_an_unknown_backend():
+    with pytest.raises(ValueError, match='Unknown inference backend'):
+        load_runners('onnx', 'seg.h5', 'cls.h5')
+
+
+def test_load_runner_checks_the_model_file_before_loading_a_runtime(tmp_path):
+    keras_path = str(tmp_path / 'seg.h5')
+    with pytest.raises(FileNotFoundError, match='seg.int8.tflite not found'):
+        load_runner('tflite', 'segmentation', keras_path, 'int8')
+    with pytest.raises(ValueError, match='Unknown quantization mode'):
+        load_runner('tflite', 'segmentation', keras_path, 'int4')
+    with pytest.raises(FileNotFoundError, match='segmentation model not found'):
+        load_runner('keras', 'segmentation', keras_path)
+    with pytest.raises(ValueError, match='Unknown inference backend'):
+        load_runner('onnx', 'segmentation', keras_path)
+
+
+def test_int8_quantization_round_trips_within_one_step():
+    detail = {'dtype': np.int8, 'quantization': (1 / 255, -128)}
+    batch = np.linspace(0.0, 1.0, 11, dtype=np.float32)
+    quantized = _quantize(batch, detail)
+    assert quantized.dtype == np.int8
+    assert quantized.min() == -128 and quantized.max() == 127
+    np.testing.assert_allclose(_dequantize(quantized, detail), batch, atol=1 / 255)
+    # float32 tensors pass straight through
+    assert _quantize(batch, {'dtype': np.float32}) is batch
+
+
+def test_dice_scores_per_sample():
+    a = np.array([[1, 1, 0, 0], [0, 0, 0, 0]], dtype=bool)
+    b = np.array([[1, 0, 0, 0], [0, 0, 0, 0]], dtype=bool)
+    np.testing.assert_allclose(dice_scores(a, b), [2 / 3, 1.0], atol=1e-5)
+
+
+def test_parity_check_reports_agreement_and_mask_overlap():
+    seg = np.random.default_rng(0).random((5, 4, 4, 1), dtype=np.float32)
+    cls = np.zeros((5, 2, 2, 3), dtype=np.float32)
+    probs = np.array([[0.9, 0.1]] * 5, dtype=np.float32)
+    # The candidate flips the class on all but the first sample
+    flipped = probs[:, ::-1].copy()
+    flipped[0] = probs[0]
+    reference = (lambda x: x, lambda x: probs)
+    candidate = (lambda x: x, lambda x: flipped)
+
+    report = parity_check(reference, candidate, seg, cls, batch_size=5)
+    assert report['samples'] == 5
+    assert report['classification_agreement'] == 0.2
+    assert report['mask_dice_mean'] == 1.0 and report['mask_dice_min'] == 1.0
+    assert report['max_confidence_diff'] == pytest.approx(0.8)
+
+
+def test_tflite_model_runs_an_exported_model(tmp_path):
+    tf = pytest.importorskip('tensorflow')
+    inputs = tf.keras.Input((4, 4, 1))
+    model = tf.keras.Model(inputs, tf.keras.layers.GlobalAveragePooling2D()(inputs))
+    path = tmp_path / 'mean.tflite'
+    path.write_bytes(tf.lite.TFLiteConverter.from_keras_model(model).convert())
+
+    runner = TFLiteModel(str(path), name='mean')
+    assert runner.input_shape == (4, 4, 1)
+    batch = np.stack([np.full((4, 4, 1), value, dtype=np.float32) for value in (0.0, 0.5, 1.0)])
+    np.testing.assert_allclose(runner(batch)[:, 0], [0.0, 0.5, 1.0], atol=1e-6)
+    assert set(runner.warmup((1, 2))) == {1, 2}
+    with pytest.raises(ValueError, match='mean model expects input shape'):
+        runner(np.zeros((1, 8, 8, 1), dtype=np.float32))
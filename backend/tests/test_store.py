@@ -0,0 +1,93 @@
+import json
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from store import RecordStore
+
+BASE = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return RecordStore(str(tmp_path / 'records.db'))
+
+
+def day(n):
+    return (BASE + timedelta(days=n)).isoformat()
+
+
+def test_keyset_pages_cover_every_scan_once_newest_first(store):
+    # Pairs of scans share a timestamp, so the id breaks ties across page boundaries
+    store.add_scans([{'id': f"s{i:02d}", 'patientId': 'p1', 'createdAt': day(i // 2)} for i in range(11)])
+
+    seen, cursor = [], None
+    while True:
+        page = store.scans_for_patient('p1', limit=3, cursor=cursor)
+        seen.extend(scan['id'] for scan in page['items'])
+        cursor = page['nextCursor']
+        if cursor is None:
+            break
+
+    assert seen == [f"s{i:02d}" for i in reversed(range(11))]
+
+
+def test_scans_are_filtered_by_patient_and_date(store):
+    store.add_scans([
+        {'id': 'a', 'patientId': 'p1', 'createdAt': day(0)},
+        {'id': 'b', 'patientId': 'p2', 'createdAt': day(1)},
+        {'id': 'c', 'patientId': 'p1', 'createdAt': day(2)},
+    ])
+    assert [s['id'] for s in store.scans_for_patient('p2')['items']] == ['b']
+    assert [s['id'] for s in store.scans_between(start=day(1), end=day(2))['items']] == ['b']
+    assert store.get_scan('c')['patientId'] == 'p1'
+    assert store.get_scan('missing') is None
+
+
+def test_added_records_get_an_id_and_timestamp(store):
+    patient = store.add_patient({'name': 'Ada'})
+    assert patient['id'] and patient['createdAt']
+    assert store.get_patient(patient['id']) == patient
+    assert store.list_patients()['items'] == [patient]
+
+
+def test_migrate_json_imports_once_and_keeps_ids(store, tmp_path):
+    patients_json = tmp_path / 'patients.json'
+    scans_json = tmp_path / 'scans.json'
+    patients_json.write_text(json.dumps([{'id': 'p1', 'name': 'Ada'}]))
+    scans_json.write_text(json.dumps([{'id': 's1', 'patientId': 'p1'}, {'id': 's2', 'patientId': 'p1'}]))
+
+    assert store.migrate_json(str(patients_json), str(scans_json)) == {'patients': 1, 'scans': 2}
+    assert not scans_json.exists() and (tmp_path / 'scans.json.migrated').exists()
+    assert store.migrate_json(str(patients_json), str(scans_json)) == {}
+    assert store.count('scans') == 2 and store.get_patient('p1')['name'] == 'Ada'
+
+
+def test_migrated_records_without_a_timestamp_keep_their_order_and_file_date(store, tmp_path):
+    scans_json = tmp_path / 'scans.json'
+    scans_json.write_text(json.dumps([{'id': 'old'}, {'id': 'older-looking', 'patientId': 'p1'}, {'id': 'last'}]))
+    modified = BASE.timestamp()
+    os.utime(scans_json, (modified, modified))
+
+    store.migrate_json(str(tmp_path / 'patients.json'), str(scans_json))
+    store.add_scan({'id': 'new'})
+
+    assert [s['id'] for s in store.scans_between()['items']] == ['new', 'last', 'older-looking', 'old']
+    assert store.get_scan('last')['createdAt'] == BASE.isoformat(timespec='microseconds')
+    assert store.get_scan('old')['createdAt'] < BASE.isoformat()
+
+
+def test_connections_are_reused_across_threads(store, monkeypatch):
+    opened = []
+    open_connection = store._open
+    monkeypatch.setattr(store, '_open', lambda: opened.append(1) or open_connection())
+
+    # Like Flask's threaded server: every request on a new, short-lived thread
+    for i in range(10):
+        thread = threading.Thread(target=store.add_scan, args=({'id': f"s{i}"},))
+        thread.start()
+        thread.join()
+    assert store.count('scans') == 10
+    assert opened == []
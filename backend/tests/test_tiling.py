@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from tiling import TILE_SIZE, fit_to_budget, scaled_length, segment_tiled, tile_count
+
+
+@pytest.mark.parametrize('height, width, max_tiles', [
+    (512, 512, 64),
+    (4096, 4096, 16),
+    (128, 20000, 8),
+    (20000, 96, 4),
+    (300, 9000, 1),
+])
+def test_fit_to_budget_respects_the_tile_budget(height, width, max_tiles):
+    scale = fit_to_budget(height, width, max_tiles)
+    assert 0 < scale <= 1.0
+    assert tile_count(scaled_length(height, scale), scaled_length(width, scale)) <= max_tiles
+
+
+def test_fit_to_budget_keeps_full_resolution_when_it_fits():
+    assert fit_to_budget(256, 256, 64) == 1.0
+
+
+def test_segment_tiled_returns_a_full_size_mask_within_budget():
+    gray = np.random.default_rng(0).integers(0, 255, (100, 3000), dtype=np.uint8)
+    calls = []
+
+    def predict(batch):
+        calls.append(len(batch))
+        assert batch.shape[1:] == (TILE_SIZE, TILE_SIZE, 1)
+        return batch
+
+    mask, tiling = segment_tiled(gray, predict, max_tiles=6, batch_size=4)
+    assert mask.shape == gray.shape
+    assert tiling['tiles'] <= 6
+    assert sum(calls) == tiling['tiles']
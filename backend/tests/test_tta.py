@@ -0,0 +1,49 @@
+import numpy as np
+
+from tta import SHIFT_PIXELS, VIEWS, augment, deaugment, predict_segmentation, summarize
+
+
+def test_deaugment_inverts_every_view():
+    batch = np.random.default_rng(0).random((2, 16, 16, 1), dtype=np.float32)
+    views = len(VIEWS)
+    restored = deaugment(augment(batch, views), views)
+    assert restored.shape == (views, 2, 16, 16, 1)
+    inner = slice(SHIFT_PIXELS, -SHIFT_PIXELS)
+    for view in restored[:4]:
+        np.testing.assert_array_equal(view, batch)
+    for view in restored[4:]:
+        np.testing.assert_array_equal(view[:, inner, inner], batch[:, inner, inner])
+
+
+def test_shifted_views_are_zero_filled_instead_of_wrapping():
+    batch = np.zeros((1, 16, 16, 1), dtype=np.float32)
+    batch[:, :, -1] = 1.0  # a bright right edge
+    shifted_right, shifted_left = augment(batch, 6)[4:6]
+    assert not shifted_right[:, :SHIFT_PIXELS].any()
+    assert not shifted_right[:, :, -1].any()
+    np.testing.assert_array_equal(shifted_left[:, -1 - SHIFT_PIXELS], batch[0, :, -1])
+
+    restored = deaugment(augment(batch, 6), 6)
+    # Shifting right pushed the edge out of frame, so that view has nothing to give back
+    assert not restored[4].any()
+    np.testing.assert_array_equal(restored[5], batch)
+
+
+def test_identity_model_agrees_with_itself():
+    batch = (np.random.default_rng(1).random((3, 8, 8, 1)) > 0.5).astype(np.float32)
+    masks = predict_segmentation(lambda x: x, batch, 4)
+    probs = np.tile(np.array([0.7, 0.1, 0.1, 0.1], dtype=np.float32), (4, 3, 1))
+
+    mask, mean_probs, reports = summarize(masks, probs)
+    np.testing.assert_array_equal(mask, batch)
+    np.testing.assert_allclose(mean_probs, probs[0])
+    assert reports[0]['mask_agreement'] == 1.0 and reports[0]['class_agreement'] == 1.0
+    assert reports[0]['views'] == 4
+
+
+def test_summarize_without_masks_reports_class_scores_only():
+    probs = np.array([[[0.9, 0.1]], [[0.2, 0.8]]], dtype=np.float32)
+    mask, _, reports = summarize(None, probs)
+    assert mask is None
+    assert set(reports[0]) == {'class_agreement', 'uncertainty', 'views'}
+    assert reports[0]['class_agreement'] == 0.5
@@ -0,0 +1,72 @@
+import io
+import tarfile
+import zipfile
+
+from uploads import SpooledUpload, chunked, is_image_name, iter_upload_items
+
+
+class Upload:
+    """The parts of werkzeug's FileStorage that the upload helpers use."""
+
+    def __init__(self, filename, data):
+        self.filename = filename
+        self.stream = io.BytesIO(data)
+
+    def read(self):
+        return self.stream.read()
+
+
+def zip_bytes(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def tar_bytes(members):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as archive:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def test_archives_yield_only_images_and_flag_oversized_members():
+    members = {'a.png': b'a', 'notes.txt': b'x', '__MACOSX/._a.png': b'y', 'big.jpg': b'b' * 100}
+    files = [
+        Upload('scan.jpg', b'single'),
+        Upload('set.zip', zip_bytes(members)),
+        Upload('set.tar.gz', tar_bytes(members)),
+    ]
+    items = list(iter_upload_items(files, max_member_bytes=10))
+    assert items == [
+        ('scan.jpg', b'single', None),
+        ('a.png', b'a', None), ('big.jpg', None, 'File too large'),
+        ('a.png', b'a', None), ('big.jpg', None, 'File too large'),
+    ]
+
+
+def test_a_damaged_archive_yields_an_error_and_the_next_upload_is_read():
+    truncated = zip_bytes({'a.png': b'a' * 1000, 'b.png': b'b'})[:-40]
+    files = [Upload('bad.zip', truncated), Upload('bad.tgz', b'not gzip'), Upload('ok.png', b'fine')]
+    items = list(iter_upload_items(files))
+    assert [(name, error is not None) for name, _, error in items] == [
+        ('bad.zip', True), ('bad.tgz', True), ('ok.png', False)
+    ]
+    assert items[0][2].startswith('Unreadable archive')
+
+
+def test_spooled_upload_outlives_the_original_stream():
+    upload = Upload('scan.png', b'pixels')
+    spooled = SpooledUpload(upload, max_memory_bytes=2)
+    upload.stream.close()
+    assert spooled.filename == 'scan.png' and spooled.read() == b'pixels'
+    spooled.close()
+
+
+def test_helpers():
+    assert is_image_name('dir/scan.TIFF') and not is_image_name('dir/.hidden.png')
+    assert list(chunked(range(5), 2)) == [[0, 1], [2, 3], [4]]
@@ -0,0 +1,151 @@
+import io
+import os
+import zipfile
+
+import numpy as np
+import pytest
+
+import volumes
+from volumes import analyze_volume, open_volume
+
+CLASS_NAMES = ['Glioma', 'Meningioma', 'Pituitary', 'No Tumour']
+
+
+def nifti_file(tmp_path, name, data, zooms=(1.0, 1.0, 1.0)):
+    nibabel = pytest.importorskip('nibabel')
+    image = nibabel.Nifti1Image(data, np.eye(4))
+    image.header.set_zooms(zooms)
+    path = tmp_path / name
+    nibabel.save(image, str(path))
+    return str(path)
+
+
+def dicom_bytes(pixels, position, instance, slope=1.0, intercept=0.0):
+    pydicom = pytest.importorskip('pydicom')
+    from pydicom.dataset import Dataset, FileMetaDataset
+    from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+    meta = FileMetaDataset()
+    meta.MediaStorageSOPClassUID = '1.2.840.10008.5.1.4.1.1.4'
+    meta.MediaStorageSOPInstanceUID = generate_uid()
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    dataset = Dataset()
+    dataset.file_meta = meta
+    dataset.SOPClassUID = meta.MediaStorageSOPClassUID
+    dataset.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+    dataset.Rows, dataset.Columns = pixels.shape
+    dataset.SamplesPerPixel = 1
+    dataset.PhotometricInterpretation = 'MONOCHROME2'
+    dataset.BitsAllocated = dataset.BitsStored = 16
+    dataset.HighBit = 15
+    dataset.PixelRepresentation = 0
+    dataset.PixelSpacing = [0.5, 0.75]
+    dataset.SliceThickness = 2.0
+    dataset.ImagePositionPatient = [0.0, 0.0, position]
+    dataset.InstanceNumber = instance
+    dataset.RescaleSlope = slope
+    dataset.RescaleIntercept = intercept
+    dataset.PixelData = pixels.astype(np.uint16).tobytes()
+    buffer = io.BytesIO()
+    pydicom.dcmwrite(buffer, dataset, enforce_file_format=True)
+    return buffer.getvalue()
+
+
+def volume_data():
+    return np.arange(6 * 4 * 3, dtype=np.int16).reshape(6, 4, 3)
+
+
+@pytest.mark.parametrize('name', ['scan.nii', 'scan.nii.gz'])
+def test_nifti_slices_run_along_the_last_axis(tmp_path, name):
+    data = volume_data()
+    volume = open_volume(nifti_file(tmp_path, name, data, zooms=(0.5, 0.5, 3.0)), str(tmp_path))
+
+    assert volume.shape == (6, 4, 3)
+    assert volume.num_slices == 3
+    assert volume.spacing == (0.5, 0.5, 3.0)
+    for index in range(3):
+        pixels = volume.slice(index)
+        assert pixels.dtype == np.float32
+        np.testing.assert_array_equal(pixels, data[:, :, index].T)
+
+
+def test_a_compressed_nifti_is_decompressed_once_without_indexed_gzip(tmp_path, monkeypatch):
+    monkeypatch.setattr(volumes, 'has_indexed_gzip', lambda: False)
+    path = nifti_file(tmp_path, 'scan.nii.gz', volume_data())
+    workdir = tmp_path / 'work'
+    workdir.mkdir()
+
+    volume = open_volume(path, str(workdir))
+    assert os.listdir(workdir) == ['scan.nii']
+    np.testing.assert_array_equal(volume.slice(1), volume_data()[:, :, 1].T)
+
+
+def test_a_2d_nifti_is_rejected(tmp_path):
+    path = nifti_file(tmp_path, 'flat.nii', np.zeros((4, 4), dtype=np.int16), zooms=(1.0, 1.0))
+    with pytest.raises(ValueError, match='3D'):
+        open_volume(path, str(tmp_path))
+
+
+def test_a_dicom_zip_is_ordered_by_slice_position(tmp_path):
+    slices = [np.full((4, 5), value, dtype=np.uint16) for value in (10, 20, 30)]
+    path = tmp_path / 'series.zip'
+    with zipfile.ZipFile(path, 'w') as archive:
+        # Stored out of order, with an entry pydicom cannot read
+        archive.writestr('b.dcm', dicom_bytes(slices[2], position=20.0, instance=3))
+        archive.writestr('a.dcm', dicom_bytes(slices[0], position=0.0, instance=1, slope=2.0, intercept=-5.0))
+        archive.writestr('notes.txt', b'not a dicom file')
+        archive.writestr('c.dcm', dicom_bytes(slices[1], position=10.0, instance=2))
+
+    volume = open_volume(str(path), str(tmp_path))
+    assert volume.num_slices == 3
+    assert volume.shape == (5, 4, 3)
+    assert volume.spacing == (0.75, 0.5, 2.0)
+    assert [float(volume.slice(i)[0, 0]) for i in range(3)] == [15.0, 20.0, 30.0]
+    assert volume.slice(0).shape == (4, 5)
+
+
+def test_a_zip_without_dicom_slices_is_rejected(tmp_path):
+    pytest.importorskip('pydicom')
+    path = tmp_path / 'series.zip'
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr('readme.txt', b'nothing here')
+    with pytest.raises(ValueError, match='No DICOM slices'):
+        open_volume(str(path), str(tmp_path))
+
+
+class StubVolume:
+    def __init__(self, num_slices, size=256):
+        self.num_slices = num_slices
+        self.shape = (size, size, num_slices)
+        self.spacing = (1.0, 1.0, 2.0)
+        self.size = size
+
+    def slice(self, index):
+        return np.full((self.size, self.size), index, dtype=np.float32)
+
+
+def test_analyze_volume_counts_tumor_voxels_only_on_tumor_slices():
+    # Every slice has a full mask; even slices are classified 'No Tumour'
+    calls = {'n': 0}
+
+    def segment(batch):
+        return np.ones(batch.shape[:3] + (1,), dtype=np.float32)
+
+    def classify(batch):
+        rows = []
+        for _ in range(len(batch)):
+            tumor = calls['n'] % 2 == 1
+            rows.append([0.9, 0.05, 0.03, 0.02] if tumor else [0.02, 0.03, 0.05, 0.9])
+            calls['n'] += 1
+        return np.asarray(rows, dtype=np.float32)
+
+    results = list(analyze_volume(StubVolume(5), segment, classify, CLASS_NAMES, batch_size=2))
+    slices, summary = results[:-1], results[-1]
+
+    assert [item['class'] for item in slices] == ['No Tumour', 'Glioma', 'No Tumour', 'Glioma', 'No Tumour']
+    assert all(item['tumor_pixels'] == 256 * 256 for item in slices)
+    assert summary['tumor_slices'] == 2
+    assert summary['tumor_voxels'] == 2 * 256 * 256
+    assert summary['tumor_volume_mm3'] == 2 * 256 * 256 * 2.0
+    assert summary['class_votes'] == {'Glioma': 2, 'Meningioma': 0, 'Pituitary': 0, 'No Tumour': 3}
+    assert summary['max_confidence_slice']['slice'] == 1
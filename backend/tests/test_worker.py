@@ -0,0 +1,105 @@
+import io
+import json
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+import worker
+from batching import MicroBatcher
+from cascade import CascadePolicy
+from conftest import fake_loader, image_bytes
+from worker import Analyzer, serve
+
+
+class FakeAnalyzer:
+    load_seconds = 0.0
+    warmup_seconds = {}
+
+    def __init__(self):
+        self.recorded = []
+
+    def handle(self, message):
+        if message.get('op') == 'fail':
+            raise ValueError('boom')
+        return {'echo': message.get('id')}
+
+    def record(self, ok):
+        self.recorded.append(ok)
+
+
+def run_serve(analyzer, lines, max_inflight=1, timeout=10):
+    stdout = io.StringIO()
+    thread = threading.Thread(target=serve, args=(analyzer, io.StringIO(''.join(lines)), stdout, max_inflight),
+                              daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), 'serve() stopped reading stdin'
+    return [json.loads(line) for line in stdout.getvalue().splitlines()]
+
+
+def test_serve_answers_each_request_by_id():
+    analyzer = FakeAnalyzer()
+    replies = run_serve(analyzer, ['{"id": "a", "op": "ping"}\n', '\n', '{"id": "b", "op": "fail"}\n'])
+    assert replies[0]['event'] == 'ready'
+    by_id = {reply['id']: reply for reply in replies[1:]}
+    assert by_id['a'] == {'id': 'a', 'ok': True, 'result': {'echo': 'a'}}
+    assert by_id['b'] == {'id': 'b', 'ok': False, 'error': 'boom'}
+    assert sorted(analyzer.recorded) == [False, True]
+
+
+def test_serve_rejects_non_object_requests_without_leaking_slots():
+    analyzer = FakeAnalyzer()
+    lines = ['[]\n', '1\n', '"text"\n', 'not json\n', '{"id": "last"}\n']
+    replies = run_serve(analyzer, lines, max_inflight=1)[1:]
+    assert [reply['ok'] for reply in replies] == [False, False, False, False, True]
+    assert all(reply['id'] is None for reply in replies[:4])
+    assert replies[-1]['result'] == {'echo': 'last'}
+
+
+@pytest.fixture
+def analyzer():
+    """An Analyzer on fake runners, without loading models."""
+    analyzer = Analyzer.__new__(Analyzer)
+    analyzer.segmentation = MicroBatcher(fake_loader('segmentation', None), max_wait_ms=1, name='segmentation')
+    analyzer.classification = MicroBatcher(fake_loader('classification', None), max_wait_ms=1, name='classification')
+    analyzer.cascade = CascadePolicy(worker.class_names)
+    yield analyzer
+    analyzer.segmentation.close()
+    analyzer.classification.close()
+
+
+def test_analyze_returns_the_same_fields_as_the_flask_app(analyzer):
+    result = analyzer.analyze(image_bytes(seed=3), 'rle')
+    assert result['classification'] == {'class': 'Glioma', 'confidence': pytest.approx(0.7)}
+    assert result['mask_format'] == 'rle'
+    assert result['stages'] == ['classification', 'segmentation']
+    assert result['segmentation_skipped'] is False
+    assert {'decode', 'segmentation_predict', 'classification_predict', 'mask_encode', 'total'} <= set(result['timings'])
+
+
+def test_analyze_skips_segmentation_for_a_confident_no_tumour_call(analyzer):
+    analyzer.cascade = CascadePolicy(worker.class_names, enabled=True, threshold=0.9)
+    analyzer.classification.predict_fn.probabilities = (0.01, 0.01, 0.01, 0.97)
+    result = analyzer.analyze(image_bytes(seed=4), 'rle')
+    assert result['segmentation_skipped'] is True
+    assert result['stages'] == ['classification']
+    assert analyzer.segmentation.predict_fn.calls == 0
+
+
+def test_protocol_stream_keeps_native_writes_to_fd_1_off_the_protocol():
+    script = (
+        "import os, worker\n"
+        "protocol = worker.protocol_stream()\n"
+        "print('python print')\n"
+        "os.write(1, b'native write\\n')\n"
+        "protocol.write('protocol line\\n')\n"
+        "protocol.flush()\n"
+    )
+    done = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, timeout=60,
+                          cwd=os.path.dirname(os.path.abspath(worker.__file__)))
+    assert done.returncode == 0, done.stderr
+    assert done.stdout == 'protocol line\n'
+    assert 'python print' in done.stderr and 'native write' in done.stderr
@@ -0,0 +1,164 @@
+"""Full-resolution segmentation by running the 128x128 model over overlapping tiles.
+
+The image is cut into ``tile`` x ``tile`` windows every ``tile - overlap`` pixels
+(the last row/column of tiles is aligned to the far edge), the tiles go through
+the model in large batches, and the outputs are blended back with a tapered
+weight window so seams between tiles average out. When an image would need more
+than ``max_tiles`` tiles it is downscaled just enough to fit the budget, which
+bounds latency on very large scans.
+
+Run ``python tiling.py --benchmark`` for tiles/s and ms per megapixel, with a
+stand-in model by default or the real one with ``--backend keras|tflite``.
+"""
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+from inference import SEGMENTATION_INPUT_SHAPE
+
+TILE_SIZE = SEGMENTATION_INPUT_SHAPE[0]
+
+
+def tile_starts(length, tile, stride):
+    """Tile offsets along one axis covering ``[0, length)``; the last tile ends at the edge."""
+    if length <= tile:
+        return np.array([0])
+    starts = np.arange(0, length - tile, stride)
+    return np.append(starts, length - tile)
+
+
+def tile_count(height, width, tile=TILE_SIZE, overlap=32):
+    stride = tile - overlap
+    return len(tile_starts(height, tile, stride)) * len(tile_starts(width, tile, stride))
+
+
+def scaled_length(length, scale):
+    return max(1, round(length * scale))
+
+
+def fit_to_budget(height, width, max_tiles, tile=TILE_SIZE, overlap=32):
+    """Largest scale <= 1 at which the image needs at most ``max_tiles`` tiles.
+
+    Both sides count: a long, narrow image keeps shrinking after its short side
+    drops below one tile (that side is padded back up) until the long side fits too.
+    """
+    max_tiles = max(1, int(max_tiles))
+    scale = 1.0
+    while tile_count(scaled_length(height, scale), scaled_length(width, scale), tile, overlap) > max_tiles:
+        scale *= 0.9
+    return scale
+
+
+def extract_tiles(image, tile=TILE_SIZE, overlap=32):
+    """(H, W) float32 -> (N, tile, tile) tiles and their (N, 2) top-left offsets, without copying per tile."""
+    height, width = image.shape
+    pad_h, pad_w = max(0, tile - height), max(0, tile - width)
+    if pad_h or pad_w:
+        image = np.pad(image, ((0, pad_h), (0, pad_w)))
+    stride = tile - overlap
+    rows = tile_starts(image.shape[0], tile, stride)
+    cols = tile_starts(image.shape[1], tile, stride)
+    windows = np.lib.stride_tricks.sliding_window_view(image, (tile, tile))
+    offsets = np.stack(np.meshgrid(rows, cols, indexing='ij'), axis=-1).reshape(-1, 2)
+    return windows[offsets[:, 0], offsets[:, 1]], offsets
+
+
+def blend_weights(tile=TILE_SIZE):
+    # Tent window: tile centres dominate, edges fade out but never reach zero
+    ramp = np.minimum(np.arange(1, tile + 1), np.arange(tile, 0, -1)).astype(np.float32)
+    return np.outer(ramp, ramp) / ramp.max() ** 2
+
+
+def blend_tiles(predictions, offsets, shape, weights=None):
+    """Weighted average of overlapping (N, tile, tile) predictions into an (H, W) map."""
+    tile = predictions.shape[1]
+    height = max(shape[0], tile)
+    width = max(shape[1], tile)
+    if weights is None:
+        weights = blend_weights(tile)
+    # Flat output index of every pixel of every tile, then one bincount per sum
+    local = np.arange(tile)[:, None] * width + np.arange(tile)[None, :]
+    index = (offsets[:, 0] * width + offsets[:, 1])[:, None, None] + local
+    weighted = np.bincount(index.ravel(), weights=(predictions * weights).ravel(), minlength=height * width)
+    total = np.bincount(index.ravel(), weights=np.broadcast_to(weights, predictions.shape).ravel(),
+                        minlength=height * width)
+    blended = (weighted / np.maximum(total, 1e-12)).astype(np.float32).reshape(height, width)
+    return blended[:shape[0], :shape[1]]
+
+
+def segment_tiled(gray, predict_fn, overlap=32, max_tiles=64, batch_size=32):
+    """Full-resolution (H, W) mask probabilities for a uint8 (H, W) grayscale image.
+
+    Returns the mask and a dict describing the tiling (tile count, scale, timings).
+    """
+    height, width = gray.shape
+    scale = fit_to_budget(height, width, max_tiles, TILE_SIZE, overlap)
+    started = time.perf_counter()
+    source = gray
+    if scale < 1.0:
+        size = (scaled_length(width, scale), scaled_length(height, scale))
+        source = np.asarray(Image.fromarray(gray).resize(size, Image.BILINEAR))
+    image = source.astype(np.float32) * np.float32(1.0 / 255.0)
+    tiles, offsets = extract_tiles(image, TILE_SIZE, overlap)
+
+    predict_started = time.perf_counter()
+    predictions = np.concatenate([
+        np.asarray(predict_fn(np.ascontiguousarray(tiles[i:i + batch_size])[..., None]))[..., 0]
+        for i in range(0, len(tiles), batch_size)
+    ])
+    predict_ms = (time.perf_counter() - predict_started) * 1000.0
+
+    mask = blend_tiles(predictions, offsets, image.shape)
+    if scale < 1.0:
+        mask = np.asarray(Image.fromarray(mask).resize((width, height), Image.BILINEAR))
+    total_ms = (time.perf_counter() - started) * 1000.0
+    return mask, {
+        'tiles': int(len(tiles)),
+        'tile_size': TILE_SIZE,
+        'overlap': overlap,
+        'scale': round(scale, 4),
+        'mask_size': [width, height],
+        'predict_ms': round(predict_ms, 3),
+        'total_ms': round(total_ms, 3)
+    }
+
+
+def _stand_in_model(batch):
+    # Cheap stand-in with the model's shape contract: (N, 128, 128, 1) -> (N, 128, 128, 1)
+    return (batch > batch.mean(axis=(1, 2, 3), keepdims=True)).astype(np.float32)
+
+
+def benchmark(sizes=(256, 512, 1024, 2048), max_tiles=(64, 256), repeats=5, predict_fn=None):
+    predict_fn = predict_fn or _stand_in_model
+    rng = np.random.default_rng(0)
+    print(f"{'size':>5} {'budget':>6} {'tiles':>5} {'scale':>6} {'total ms':>9} {'predict ms':>10} "
+          f"{'tiles/s':>8} {'ms/MP':>8}")
+    for size in sizes:
+        gray = rng.integers(0, 256, size=(size, size), dtype=np.uint8)
+        megapixels = size * size / 1e6
+        for budget in max_tiles:
+            runs = [segment_tiled(gray, predict_fn, max_tiles=budget)[1] for _ in range(repeats)]
+            total_ms = sum(run['total_ms'] for run in runs) / repeats
+            predict_ms = sum(run['predict_ms'] for run in runs) / repeats
+            tiles = runs[0]['tiles']
+            print(f"{size:>5} {budget:>6} {tiles:>5} {runs[0]['scale']:>6.3f} {total_ms:>9.1f} {predict_ms:>10.1f} "
+                  f"{tiles / (total_ms / 1000.0):>8.0f} {total_ms / megapixels:>8.1f}")
+
+
+if __name__ == '__main__':
+    if '--benchmark' in sys.argv:
+        predict_fn = None
+        if '--backend' in sys.argv:
+            import os
+            from runtime import load_runners
+            models_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
+            predict_fn, _ = load_runners(
+                sys.argv[sys.argv.index('--backend') + 1],
+                os.path.join(models_dir, 'new_segmentation_model.h5'),
+                os.path.join(models_dir, 'new_classification_model.h5')
+            )
+        benchmark(predict_fn=predict_fn)
+    else:
+        print(__doc__)
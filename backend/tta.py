@@ -0,0 +1,179 @@
+"""Test-time augmentation in one batched forward pass per model.
+
+All augmented views of an image are stacked into a single (V*N, ...) batch, so
+each model runs once instead of V times. The segmentation outputs are mapped back
+to the original frame with the inverse flip/shift (vectorized over the batch),
+averaged, and the spread between views is reported as agreement scores.
+
+Views, in order (the first 4 are used for ``views=4``):
+    identity, horizontal flip, vertical flip, both flips,
+    shift right, shift left, shift down, shift up (by SHIFT_PIXELS, zero-filled)
+
+Shifts pad with zeros instead of wrapping around, so no view sees the opposite
+edge of the image; the SHIFT_PIXELS border a shifted view never saw comes back
+as zeros.
+
+Run ``python tta.py --benchmark`` to measure the latency overhead of 4 and 8 views.
+"""
+import sys
+import time
+
+import numpy as np
+
+SHIFT_PIXELS = 4
+TTA_VIEW_COUNTS = (1, 4, 8)
+
+# (flip axes, (row shift, col shift)) per view; axes are relative to an (N, H, W, C) batch
+VIEWS = (
+    ((), (0, 0)),
+    ((2,), (0, 0)),
+    ((1,), (0, 0)),
+    ((1, 2), (0, 0)),
+    ((), (0, SHIFT_PIXELS)),
+    ((), (0, -SHIFT_PIXELS)),
+    ((), (SHIFT_PIXELS, 0)),
+    ((), (-SHIFT_PIXELS, 0)),
+)
+
+
+def _shift(batch, dy, dx):
+    """Shift an (N, H, W, C) batch by (dy, dx) pixels, zero-filling the rows and columns vacated."""
+    height, width = batch.shape[1:3]
+    padded = np.pad(batch, ((0, 0), (max(dy, 0), max(-dy, 0)), (max(dx, 0), max(-dx, 0)), (0, 0)))
+    top, left = max(-dy, 0), max(-dx, 0)
+    return padded[:, top:top + height, left:left + width]
+
+
+def _apply(batch, view):
+    axes, (dy, dx) = view
+    if axes:
+        batch = np.flip(batch, axis=axes)
+    if dy or dx:
+        batch = _shift(batch, dy, dx)
+    return batch
+
+
+def _invert(batch, view):
+    axes, (dy, dx) = view
+    if dy or dx:
+        batch = _shift(batch, -dy, -dx)
+    if axes:
+        batch = np.flip(batch, axis=axes)
+    return batch
+
+
+def augment(batch, views):
+    """(N, H, W, C) -> (views * N, H, W, C), view-major."""
+    return np.concatenate([_apply(batch, view) for view in VIEWS[:views]])
+
+
+def deaugment(outputs, views):
+    """(views * N, H, W, C) masks -> (views, N, H, W, C) all in the original orientation."""
+    per_view = outputs.reshape((views, -1) + outputs.shape[1:])
+    return np.stack([_invert(per_view[i], view) for i, view in enumerate(VIEWS[:views])])
+
+
+def agreement(masks, probs, threshold=0.5):
+    """Per-image agreement between views.
+
+    masks: (V, N, H, W, C) probabilities in the original orientation, or None
+           when segmentation was skipped (only the class scores are returned)
+    probs: (V, N, K) class probabilities
+    """
+    mean_probs = probs.mean(axis=0)
+    votes = np.argmax(probs, axis=2) == np.argmax(mean_probs, axis=1)[None]
+    entropy = -np.sum(mean_probs * np.log(np.clip(mean_probs, 1e-12, 1.0)), axis=1) / np.log(probs.shape[2])
+    scores = {'class_agreement': votes.mean(axis=0), 'uncertainty': entropy}
+    if masks is None:
+        return scores
+
+    views = masks.shape[0]
+    binary = masks > threshold
+    consensus = masks.mean(axis=0) > threshold
+    flat = binary.reshape(views, binary.shape[1], -1)
+    flat_consensus = consensus.reshape(1, consensus.shape[0], -1)
+    intersection = np.count_nonzero(flat & flat_consensus, axis=2)
+    total = np.count_nonzero(flat, axis=2) + np.count_nonzero(flat_consensus, axis=2)
+    dice = np.where(total > 0, 2.0 * intersection / np.maximum(total, 1), 1.0)
+    scores['mask_agreement'] = dice.mean(axis=0)
+    scores['mask_pixel_std'] = masks.std(axis=0).reshape(masks.shape[1], -1).mean(axis=1)
+    return scores
+
+
+def predict_classification(classification_fn, batch, views):
+    """(V, N, K) class probabilities from one pass over all views."""
+    return np.asarray(classification_fn(augment(batch, views))).reshape(views, len(batch), -1)
+
+
+def predict_segmentation(segmentation_fn, batch, views):
+    """(V, N, H, W, C) masks in the original orientation from one pass over all views."""
+    return deaugment(np.asarray(segmentation_fn(augment(batch, views))), views)
+
+
+def summarize(masks, probs):
+    """Averaged (N, ...) mask and probabilities plus a per-image list of agreement dicts.
+
+    ``masks`` may be None (segmentation skipped); the averaged mask is then None too.
+    """
+    scores = agreement(masks, probs)
+    reports = [
+        {key: round(float(values[i]), 4) for key, values in scores.items()}
+        for i in range(probs.shape[1])
+    ]
+    for report in reports:
+        report['views'] = int(probs.shape[0])
+    return None if masks is None else masks.mean(axis=0), probs.mean(axis=0), reports
+
+
+def _stand_in_models():
+    rng = np.random.default_rng(0)
+    weights = rng.standard_normal((3, 4)).astype(np.float32)
+
+    def segmentation(batch):
+        return (batch > batch.mean(axis=(1, 2, 3), keepdims=True)).astype(np.float32)
+
+    def classification(batch):
+        logits = batch.mean(axis=(1, 2)) @ weights
+        exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+        return exp / exp.sum(axis=1, keepdims=True)
+
+    return segmentation, classification
+
+
+def benchmark(segmentation_fn=None, classification_fn=None, repeats=20):
+    from inference import SEGMENTATION_INPUT_SHAPE, CLASSIFICATION_INPUT_SHAPE
+
+    if segmentation_fn is None:
+        segmentation_fn, classification_fn = _stand_in_models()
+    rng = np.random.default_rng(0)
+    seg = rng.random((1,) + SEGMENTATION_INPUT_SHAPE, dtype=np.float32)
+    cls = rng.random((1,) + CLASSIFICATION_INPUT_SHAPE, dtype=np.float32)
+    print(f"{'views':>5} {'ms/image':>9} {'overhead':>9}")
+    baseline = None
+    for views in TTA_VIEW_COUNTS:
+        predict_segmentation(segmentation_fn, seg, views)  # warm up this batch size
+        predict_classification(classification_fn, cls, views)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            summarize(predict_segmentation(segmentation_fn, seg, views),
+                      predict_classification(classification_fn, cls, views))
+        ms = (time.perf_counter() - start) * 1000.0 / repeats
+        baseline = baseline or ms
+        print(f"{views:>5} {ms:>9.2f} {ms / baseline:>8.2f}x")
+
+
+if __name__ == '__main__':
+    if '--benchmark' in sys.argv:
+        runners = (None, None)
+        if '--backend' in sys.argv:
+            import os
+            from runtime import load_runners
+            models_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
+            runners = load_runners(
+                sys.argv[sys.argv.index('--backend') + 1],
+                os.path.join(models_dir, 'new_segmentation_model.h5'),
+                os.path.join(models_dir, 'new_classification_model.h5')
+            )
+        benchmark(*runners)
+    else:
+        print(__doc__)
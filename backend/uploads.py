@@ -0,0 +1,103 @@
+import lzma
+import os
+import shutil
+import tarfile
+import tempfile
+import zipfile
+import zlib
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+TAR_EXTENSIONS = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')
+
+# What a damaged or truncated archive raises partway through (gzip and bz2 raise OSError)
+ARCHIVE_ERRORS = (zipfile.BadZipFile, tarfile.TarError, EOFError, OSError, zlib.error, lzma.LZMAError)
+
+
+def is_image_name(name):
+    base = os.path.basename(name)
+    return (
+        not base.startswith('.')
+        and '__MACOSX' not in name
+        and base.lower().endswith(IMAGE_EXTENSIONS)
+    )
+
+
+def _iter_zip(stream, max_member_bytes):
+    with zipfile.ZipFile(stream) as archive:
+        for info in archive.infolist():
+            if info.is_dir() or not is_image_name(info.filename):
+                continue
+            if info.file_size > max_member_bytes:
+                yield info.filename, None, 'File too large'
+                continue
+            yield info.filename, archive.read(info), None
+
+
+def _iter_tar(stream, max_member_bytes):
+    # Streaming mode ('r|*') reads members in order without seeking or an index
+    with tarfile.open(fileobj=stream, mode='r|*') as archive:
+        for member in archive:
+            if not member.isfile() or not is_image_name(member.name):
+                continue
+            if member.size > max_member_bytes:
+                yield member.name, None, 'File too large'
+                continue
+            yield member.name, archive.extractfile(member).read(), None
+
+
+class SpooledUpload:
+    """A copy of an uploaded file that outlives the request it came with.
+
+    Flask closes ``request.files`` as soon as the view returns, before a streamed
+    response is generated, so streaming endpoints copy their uploads first. Small
+    uploads stay in memory, bigger ones spill to a temporary file.
+    """
+
+    def __init__(self, upload, max_memory_bytes=8 * 1024 * 1024):
+        self.filename = upload.filename
+        self.stream = tempfile.SpooledTemporaryFile(max_size=max_memory_bytes)
+        shutil.copyfileobj(upload.stream, self.stream)
+        self.stream.seek(0)
+
+    def read(self):
+        return self.stream.read()
+
+    def close(self):
+        self.stream.close()
+
+
+def iter_upload_items(files, max_member_bytes=16 * 1024 * 1024):
+    """Yield ``(name, bytes, error)`` for every image in a list of uploaded files.
+
+    Each upload may be an image or a zip/tar archive of images. Archive members
+    are read one at a time, so memory use doesn't grow with the archive size.
+    ``bytes`` is None and ``error`` says why for members larger than
+    ``max_member_bytes`` and for an archive that turns out to be damaged; the
+    members read before the damage have already been yielded, and the remaining
+    uploads are still read.
+    """
+    for upload in files:
+        name = upload.filename or ''
+        lower = name.lower()
+        if lower.endswith('.zip'):
+            members = _iter_zip(upload.stream, max_member_bytes)
+        elif lower.endswith(TAR_EXTENSIONS):
+            members = _iter_tar(upload.stream, max_member_bytes)
+        else:
+            yield name, upload.read(), None
+            continue
+        try:
+            yield from members
+        except ARCHIVE_ERRORS as e:
+            yield name, None, f"Unreadable archive: {str(e) or type(e).__name__}"
+
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -0,0 +1,261 @@
+"""Slice-by-slice analysis of 3D scans (NIfTI volumes and DICOM series).
+
+Uploads are spooled to a temporary file and opened lazily: uncompressed NIfTI
+voxel data is memory-mapped by nibabel (a .nii.gz is decompressed once to the
+spool directory unless indexed_gzip can seek inside it), and DICOM headers are read without
+pixel data to order the series, with each slice's pixels read when its batch is
+reached. Slices go through the models in fixed-size batches written into the
+same preallocated buffers, so peak memory depends on the batch size and not on
+the number of slices.
+
+nibabel (NIfTI) and pydicom (DICOM) are optional and only imported when a
+volume of that kind is uploaded.
+"""
+import gzip
+import os
+import shutil
+import tempfile
+import zipfile
+
+import numpy as np
+from PIL import Image
+
+from preprocessing import StageTimer, allocate_batch, model_inputs
+
+NIFTI_EXTENSIONS = ('.nii', '.nii.gz')
+DICOM_EXTENSIONS = ('.dcm', '.dicom', '.ima')
+VOLUME_EXTENSIONS = NIFTI_EXTENSIONS + DICOM_EXTENSIONS + ('.zip',)
+
+# Slices sampled to pick the intensity window for the whole volume
+WINDOW_SAMPLE_SLICES = 16
+
+
+def is_volume_name(name):
+    return name.lower().endswith(VOLUME_EXTENSIONS)
+
+
+def spool(stream, directory, name):
+    """Copy an upload stream to ``directory`` in chunks and return the file path."""
+    path = os.path.join(directory, os.path.basename(name) or 'volume')
+    with open(path, 'wb') as f:
+        shutil.copyfileobj(stream, f, 1024 * 1024)
+    return path
+
+
+def has_indexed_gzip():
+    """True if nibabel can seek inside .nii.gz files (indexed_gzip is installed)."""
+    try:
+        import indexed_gzip  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def gunzip(path, directory):
+    """Decompress ``path`` into ``directory`` in chunks and return the new file path."""
+    target = os.path.join(directory, os.path.basename(path)[:-len('.gz')])
+    with gzip.open(path, 'rb') as source, open(target, 'wb') as f:
+        shutil.copyfileobj(source, f, 1024 * 1024)
+    return target
+
+
+class NiftiVolume:
+    """A NIfTI volume whose slices (along the last spatial axis) are read on demand."""
+
+    def __init__(self, path):
+        try:
+            import nibabel
+        except ImportError:
+            raise RuntimeError("NIfTI support needs nibabel: pip install nibabel")
+        image = nibabel.load(path, mmap=True)
+        if len(image.shape) < 3:
+            raise ValueError(f"Expected a 3D volume, got shape {image.shape}")
+        self._data = image.dataobj  # ArrayProxy: slicing reads only the requested voxels
+        self.shape = tuple(int(d) for d in image.shape[:3])
+        self.num_slices = self.shape[2]
+        self.spacing = tuple(float(z) for z in image.header.get_zooms()[:3])
+
+    def slice(self, index):
+        index = (slice(None), slice(None), index) + (0,) * (len(self._data.shape) - 3)
+        # Transpose so rows run along the second voxel axis, as in most viewers
+        return np.asarray(self._data[index], dtype=np.float32).T
+
+
+class DicomSeries:
+    """A DICOM series ordered by slice position, reading one slice's pixels at a time."""
+
+    def __init__(self, paths):
+        try:
+            import pydicom
+        except ImportError:
+            raise RuntimeError("DICOM support needs pydicom: pip install pydicom")
+        self._pydicom = pydicom
+        headers = []
+        for path in paths:
+            try:
+                header = pydicom.dcmread(path, stop_before_pixels=True)
+            except Exception:
+                continue
+            if 'Rows' in header:
+                headers.append((self._position(header), path, header))
+        if not headers:
+            raise ValueError("No DICOM slices found in upload")
+        headers.sort(key=lambda item: item[0])
+        self._paths = [path for _, path, _ in headers]
+        first = headers[0][2]
+        self.num_slices = len(self._paths)
+        self.shape = (int(first.Columns), int(first.Rows), self.num_slices)
+        pixel = [float(v) for v in getattr(first, 'PixelSpacing', (1.0, 1.0))]
+        thickness = float(getattr(first, 'SliceThickness', 1.0) or 1.0)
+        self.spacing = (pixel[1], pixel[0], thickness)
+
+    @staticmethod
+    def _position(header):
+        if 'ImagePositionPatient' in header:
+            return float(header.ImagePositionPatient[2])
+        return float(getattr(header, 'InstanceNumber', 0) or 0)
+
+    def slice(self, index):
+        dataset = self._pydicom.dcmread(self._paths[index])
+        pixels = dataset.pixel_array.astype(np.float32)
+        slope = float(getattr(dataset, 'RescaleSlope', 1.0) or 1.0)
+        intercept = float(getattr(dataset, 'RescaleIntercept', 0.0) or 0.0)
+        return pixels * slope + intercept
+
+
+def open_volume(path, workdir):
+    """NiftiVolume or DicomSeries for a spooled upload (.nii, .nii.gz, .dcm or a zip of a DICOM series)."""
+    lower = path.lower()
+    if lower.endswith(NIFTI_EXTENSIONS):
+        # Without indexed_gzip every slice read would decompress from the start of the file
+        if lower.endswith('.gz') and not has_indexed_gzip():
+            path = gunzip(path, workdir)
+        return NiftiVolume(path)
+    if lower.endswith('.zip'):
+        # Members are streamed to disk one at a time, never held in memory together
+        series_dir = os.path.join(workdir, 'series')
+        os.makedirs(series_dir, exist_ok=True)
+        paths = []
+        with zipfile.ZipFile(path) as archive:
+            for i, info in enumerate(archive.infolist()):
+                if info.is_dir() or '__MACOSX' in info.filename:
+                    continue
+                member_path = os.path.join(series_dir, f"{i:05d}.dcm")
+                with archive.open(info) as source, open(member_path, 'wb') as target:
+                    shutil.copyfileobj(source, target, 1024 * 1024)
+                paths.append(member_path)
+        return DicomSeries(paths)
+    if lower.endswith(DICOM_EXTENSIONS):
+        return DicomSeries([path])
+    raise ValueError(f"Unsupported volume type, expected one of {VOLUME_EXTENSIONS}")
+
+
+def intensity_window(volume, sample=WINDOW_SAMPLE_SLICES):
+    """(low, high) 1st/99th intensity percentiles over evenly spaced sample slices."""
+    indices = np.unique(np.linspace(0, volume.num_slices - 1, min(sample, volume.num_slices)).astype(int))
+    values = np.concatenate([volume.slice(i)[::4, ::4].ravel() for i in indices])
+    low, high = np.percentile(values, (1, 99))
+    return float(low), (float(high) if high > low else float(low) + 1.0)
+
+
+def slice_image(pixels, window):
+    low, high = window
+    scaled = np.clip((pixels - low) * (255.0 / (high - low)), 0, 255).astype(np.uint8)
+    return Image.fromarray(scaled, mode='L')
+
+
+def analyze_volume(volume, segmentation_fn, classification_fn, class_names, batch_size=16, threshold=0.5):
+    """Yield one result dict per slice, then a final ``{'done': True, ...}`` dict with volume aggregates.
+
+    Each slice result carries its binary (128, 128) mask under ``'mask'``; callers
+    encode it as they see fit. Tumor voxel counts are scaled back from the 128px
+    mask to the slice's native resolution; only slices not classified 'No Tumour'
+    count towards the volume's tumor voxels and slices.
+    """
+    window = intensity_window(volume)
+    segmentation_batch, classification_batch = allocate_batch(batch_size)
+    no_tumour = class_names.index('No Tumour') if 'No Tumour' in class_names else None
+    voxel_volume = float(np.prod(volume.spacing))
+
+    tumor_voxels = 0.0
+    tumor_slices = 0
+    class_votes = dict.fromkeys(class_names, 0)
+    best = None
+    timer = StageTimer()
+
+    for start in range(0, volume.num_slices, batch_size):
+        indices = range(start, min(start + batch_size, volume.num_slices))
+        slice_pixels = []
+        for row, index in enumerate(indices):
+            with timer.stage('read'):
+                pixels = volume.slice(index)
+            slice_pixels.append(pixels.size)
+            model_inputs(slice_image(pixels, window), timer, segmentation_batch[row], classification_batch[row])
+
+        count = len(indices)
+        with timer.stage('segmentation'):
+            masks = np.asarray(segmentation_fn(segmentation_batch[:count]))[..., 0] > threshold
+        with timer.stage('classification'):
+            probs = np.asarray(classification_fn(classification_batch[:count]))
+
+        areas = np.count_nonzero(masks.reshape(count, -1), axis=1)
+        class_idx = np.argmax(probs, axis=1)
+        for row, index in enumerate(indices):
+            label = class_names[class_idx[row]]
+            confidence = float(probs[row, class_idx[row]])
+            voxels = float(areas[row]) * slice_pixels[row] / masks[row].size
+            has_tumor = class_idx[row] != no_tumour
+            class_votes[label] += 1
+            if has_tumor:
+                tumor_voxels += voxels
+                tumor_slices += bool(areas[row])
+                if best is None or confidence > best['confidence']:
+                    best = {'slice': index, 'class': label, 'confidence': confidence}
+            yield {
+                'slice': index,
+                'class': label,
+                'confidence': confidence,
+                'tumor_pixels': int(round(voxels)),
+                'mask': masks[row]
+            }
+
+    yield {
+        'done': True,
+        'slices': volume.num_slices,
+        'shape': list(volume.shape),
+        'spacing_mm': [round(s, 4) for s in volume.spacing],
+        'tumor_voxels': int(round(tumor_voxels)),
+        'tumor_volume_mm3': round(tumor_voxels * voxel_volume, 3),
+        'tumor_slices': tumor_slices,
+        'class_votes': class_votes,
+        'max_confidence_slice': best,
+        'timings_ms': timer.as_dict()
+    }
+
+
+def spool_upload(stream, name):
+    """Copy an upload into a new temporary directory; returns ``(workdir, path)``.
+
+    The caller owns ``workdir`` and removes it (``analyze_spooled`` does when it finishes).
+    """
+    workdir = tempfile.mkdtemp(prefix='volume-')
+    try:
+        return workdir, spool(stream, workdir, name)
+    except Exception:
+        shutil.rmtree(workdir, ignore_errors=True)
+        raise
+
+
+def analyze_spooled(workdir, path, segmentation_fn, classification_fn, class_names, batch_size=16):
+    """Yield ``analyze_volume`` results for a spooled upload, then remove its ``workdir``."""
+    try:
+        volume = open_volume(path, workdir)
+        yield from analyze_volume(volume, segmentation_fn, classification_fn, class_names, batch_size)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def analyze_upload(stream, name, segmentation_fn, classification_fn, class_names, batch_size=16):
+    """Spool an uploaded volume to a temporary directory and yield ``analyze_volume`` results from it."""
+    workdir, path = spool_upload(stream, name)
+    yield from analyze_spooled(workdir, path, segmentation_fn, classification_fn, class_names, batch_size)
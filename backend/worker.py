@@ -0,0 +1,367 @@
+"""Long-lived analysis worker speaking line-delimited JSON over stdin/stdout.
+
+Loads the models once, then answers one JSON line per request. Requests are
+processed concurrently and answered as they finish, so replies can come out of
+order; match them by ``id``.
+
+    python worker.py                  # serve requests on stdin/stdout
+    python worker.py --once IMAGE     # analyze one image and exit (what spawn-per-request costs)
+    python worker.py --benchmark [IMAGE ...] [--requests 50] [--concurrency 8]
+
+Request, one line each:
+    {"id": "1", "path": "/tmp/scan.jpg"}
+    {"id": "2", "data": "<base64 image bytes>", "mask_format": "rle"}
+    {"id": "3", "op": "stats"}          # also "ping"
+
+Response, one line each:
+    {"id": "1", "ok": true, "result": {"classification": {...}, "segmentation_mask": ..., ...}}
+    {"id": "2", "ok": false, "error": "..."}
+
+The first line written is ``{"event": "ready", ...}`` once the models are warm.
+Anything else the process writes to stdout, native libraries included, goes to
+stderr, so stdout only ever carries protocol lines. At most WORKER_MAX_INFLIGHT requests are processed at once;
+beyond that the worker stops reading stdin until one finishes. Concurrent
+requests share forward passes through the same micro-batchers as the Flask app.
+"""
+import argparse
+import base64
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+
+from analysis import analyze_prepared
+from batching import MicroBatcher
+from cascade import CascadePolicy
+from inference import warmup_batch_sizes
+from mask_encoding import MASK_FORMATS, encode_mask
+from preprocessing import StageTimer, prepare
+from runtime import load_runners
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+MODELS_DIR = os.path.join(current_dir, 'models')
+SEGMENTATION_MODEL_PATH = os.path.join(MODELS_DIR, 'new_segmentation_model.h5')
+CLASSIFICATION_MODEL_PATH = os.path.join(MODELS_DIR, 'new_classification_model.h5')
+
+class_names = ['Glioma', 'Meningioma', 'Pituitary', 'No Tumour']
+
+INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'keras').lower()
+TFLITE_QUANTIZATION = os.getenv('TFLITE_QUANTIZATION', 'none').lower()
+MODEL_SERVER_SOCKET = os.getenv('MODEL_SERVER_SOCKET')
+BATCH_MAX_SIZE = int(os.getenv('BATCH_MAX_SIZE', '8'))
+BATCH_MAX_WAIT_MS = float(os.getenv('BATCH_MAX_WAIT_MS', '10'))
+WORKER_MAX_INFLIGHT = int(os.getenv('WORKER_MAX_INFLIGHT', '16'))
+CASCADE_MODE = os.getenv('CASCADE_MODE', '0') == '1'
+CASCADE_THRESHOLD = float(os.getenv('CASCADE_THRESHOLD', '0.9'))
+DEFAULT_MASK_FORMAT = 'png'
+
+
+class Analyzer:
+    """Models, batchers and the per-image analysis shared by every request."""
+
+    def __init__(self):
+        started = time.perf_counter()
+        if MODEL_SERVER_SOCKET:
+            from model_server import ModelClient
+            client = ModelClient(MODEL_SERVER_SOCKET)
+            client.wait_ready()
+            self.segmentation = client.batcher('segmentation')
+            self.classification = client.batcher('classification')
+            warmup = {name: model['warmup_seconds'] for name, model in client.info['models'].items()}
+        else:
+            segmentation_runner, classification_runner = load_runners(
+                INFERENCE_BACKEND, SEGMENTATION_MODEL_PATH, CLASSIFICATION_MODEL_PATH, TFLITE_QUANTIZATION
+            )
+            sizes = warmup_batch_sizes(BATCH_MAX_SIZE)
+            warmup = {
+                runner.name: runner.warmup(sizes) for runner in (segmentation_runner, classification_runner)
+            }
+            self.segmentation = MicroBatcher(
+                segmentation_runner, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS, name='segmentation'
+            )
+            self.classification = MicroBatcher(
+                classification_runner, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS,
+                name='classification'
+            )
+        self.cascade = CascadePolicy(class_names, enabled=CASCADE_MODE, threshold=CASCADE_THRESHOLD)
+        self.load_seconds = round(time.perf_counter() - started, 3)
+        self.warmup_seconds = warmup
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def analyze(self, image_bytes, mask_format=DEFAULT_MASK_FORMAT):
+        """Same fields as /analyze's classification, mask and stages, without storing anything."""
+        started = time.perf_counter()
+        timer = StageTimer()
+        prepared = prepare(image_bytes, timer)
+        fields, mask = analyze_prepared(
+            prepared, self.segmentation, self.classification, self.cascade, class_names, timer
+        )
+        with timer.stage('mask_encode'):
+            encoded = encode_mask(mask.squeeze() > 127, mask_format)
+        timings = timer.as_dict()
+        timings['total'] = round((time.perf_counter() - started) * 1000.0, 3)
+        return dict(
+            fields,
+            segmentation_mask=encoded,
+            mask_format=mask_format,
+            timings=timings,
+            processingTime=timings['total'] / 1000.0
+        )
+
+    def record(self, ok):
+        with self._lock:
+            self.requests += 1
+            self.errors += not ok
+
+    def handle(self, message):
+        op = message.get('op', 'analyze')
+        if op == 'ping':
+            return {'pong': True}
+        if op == 'stats':
+            with self._lock:
+                counts = {'requests': self.requests, 'errors': self.errors}
+            return dict(counts, batching={
+                'segmentation': self.segmentation.stats(),
+                'classification': self.classification.stats()
+            }, cascade=self.cascade.stats())
+        if op != 'analyze':
+            raise ValueError(f"Unknown op {op!r}")
+
+        mask_format = message.get('mask_format', DEFAULT_MASK_FORMAT)
+        if mask_format not in MASK_FORMATS:
+            raise ValueError(f"Unknown mask format {mask_format!r}, expected one of {MASK_FORMATS}")
+        if message.get('data') is not None:
+            image_bytes = base64.b64decode(message['data'])
+        elif message.get('path'):
+            with open(message['path'], 'rb') as f:
+                image_bytes = f.read()
+        else:
+            raise ValueError("Request needs 'path' or 'data'")
+        return self.analyze(image_bytes, mask_format)
+
+
+def protocol_stream():
+    """A private duplicate of stdout for protocol lines, with fd 1 itself pointed at stderr.
+
+    Swapping ``sys.stdout`` only catches Python prints; TensorFlow's native logging
+    writes to fd 1 directly and would corrupt the protocol.
+    """
+    sys.stdout.flush()
+    protocol = os.fdopen(os.dup(sys.stdout.fileno()), 'w', buffering=1)
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    return protocol
+
+
+def serve(analyzer, stdin, stdout, max_inflight=WORKER_MAX_INFLIGHT):
+    """Read requests until EOF, answering each on its own line as soon as it is done."""
+    write_lock = threading.Lock()
+    slots = threading.BoundedSemaphore(max_inflight)
+    pool = ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix='worker')
+
+    def write(message):
+        line = json.dumps(message) + '\n'
+        with write_lock:
+            stdout.write(line)
+            stdout.flush()
+
+    def run(message):
+        request_id = message.get('id')
+        try:
+            write({'id': request_id, 'ok': True, 'result': analyzer.handle(message)})
+            ok = True
+        except Exception as e:
+            write({'id': request_id, 'ok': False, 'error': str(e)})
+            ok = False
+        finally:
+            slots.release()
+        analyzer.record(ok)
+
+    write({
+        'event': 'ready',
+        'pid': os.getpid(),
+        'load_seconds': analyzer.load_seconds,
+        'warmup_seconds': analyzer.warmup_seconds
+    })
+    for line in stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            message = json.loads(line)
+        except ValueError as e:
+            write({'id': None, 'ok': False, 'error': f"Invalid JSON: {e}"})
+            continue
+        if not isinstance(message, dict):
+            write({'id': None, 'ok': False, 'error': 'Each request must be a JSON object'})
+            continue
+        # Backpressure: stop reading while max_inflight requests are being processed
+        slots.acquire()
+        pool.submit(run, message)
+    pool.shutdown(wait=True)
+
+
+class WorkerClient:
+    """Spawns ``worker.py`` once and sends it requests; every call returns a Future."""
+
+    def __init__(self, command=None, env=None, ready_timeout=300.0):
+        self.command = command or [sys.executable, os.path.abspath(__file__)]
+        self.process = subprocess.Popen(
+            self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1,
+            env=env, cwd=current_dir
+        )
+        self._pending = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._ready = Future()
+        self._reader = threading.Thread(target=self._read, name='worker-client', daemon=True)
+        self._reader.start()
+        self.info = self._ready.result(timeout=ready_timeout)
+
+    def _read(self):
+        for line in self.process.stdout:
+            message = json.loads(line)
+            if message.get('event') == 'ready':
+                self._ready.set_result(message)
+                continue
+            with self._lock:
+                future = self._pending.pop(message.get('id'), None)
+            if future is None:
+                continue
+            if message.get('ok'):
+                future.set_result(message['result'])
+            else:
+                future.set_exception(RuntimeError(message.get('error')))
+        # The worker exited: fail everything still waiting
+        error = RuntimeError(f"Worker exited with code {self.process.wait()}")
+        if not self._ready.done():
+            self._ready.set_exception(error)
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            future.set_exception(error)
+
+    def request(self, message):
+        future = Future()
+        with self._lock:
+            self._next_id += 1
+            request_id = str(self._next_id)
+            self._pending[request_id] = future
+            self.process.stdin.write(json.dumps(dict(message, id=request_id)) + '\n')
+            self.process.stdin.flush()
+        return future
+
+    def analyze(self, path=None, data=None, mask_format=DEFAULT_MASK_FORMAT):
+        message = {'mask_format': mask_format}
+        if data is not None:
+            message['data'] = base64.b64encode(data).decode()
+        else:
+            message['path'] = os.path.abspath(path)
+        return self.request(message)
+
+    def stats(self):
+        return self.request({'op': 'stats'}).result()
+
+    def close(self, timeout=30.0):
+        if self.process.poll() is None:
+            self.process.stdin.close()
+            try:
+                self.process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def benchmark(paths, requests=50, concurrency=8, spawn_requests=5):
+    """Spawn-per-request (``--once``) against one persistent worker, sequential and pipelined."""
+    from benchmark import summarize
+
+    def row(name, summary):
+        print(f"{name:<28} {summary['p50_ms']:>9.1f} {summary['p95_ms']:>9.1f} {summary['rps']:>9.2f}")
+
+    print(f"{'mode':<28} {'p50 ms':>9} {'p95 ms':>9} {'img/s':>9}")
+    latencies = []
+    started = time.perf_counter()
+    for i in range(spawn_requests):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--once', paths[i % len(paths)]],
+                       check=True, capture_output=True, cwd=current_dir)
+        latencies.append(time.perf_counter() - start)
+    row('spawn per request', summarize(latencies, time.perf_counter() - started, 0))
+
+    spawn_started = time.perf_counter()
+    with WorkerClient() as client:
+        print(f"(persistent worker ready in {time.perf_counter() - spawn_started:.1f}s, paid once)")
+        latencies = []
+        started = time.perf_counter()
+        for i in range(requests):
+            start = time.perf_counter()
+            client.analyze(paths[i % len(paths)]).result()
+            latencies.append(time.perf_counter() - start)
+        row('persistent, sequential', summarize(latencies, time.perf_counter() - started, 0))
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            def one(i):
+                start = time.perf_counter()
+                client.analyze(paths[i % len(paths)]).result()
+                return time.perf_counter() - start
+            latencies = list(pool.map(one, range(requests)))
+        row(f'persistent, {concurrency} in flight', summarize(latencies, time.perf_counter() - started, 0))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--once', metavar='IMAGE', help='analyze one image, print the result and exit')
+    parser.add_argument('--benchmark', nargs='*', metavar='IMAGE', help='compare with spawn-per-request')
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--mask-format', choices=MASK_FORMATS, default=DEFAULT_MASK_FORMAT)
+    args = parser.parse_args(argv)
+
+    if args.benchmark is not None:
+        paths = args.benchmark
+        if not paths:
+            import tempfile
+            from benchmark import synthetic_jpeg
+            rng = np.random.default_rng(0)
+            directory = tempfile.mkdtemp(prefix='worker-bench-')
+            paths = []
+            for i in range(8):
+                paths.append(os.path.join(directory, f"scan{i}.jpg"))
+                with open(paths[-1], 'wb') as f:
+                    f.write(synthetic_jpeg(256, rng))
+        benchmark(paths, args.requests, args.concurrency)
+        return 0
+
+    protocol_out = protocol_stream()
+    analyzer = Analyzer()
+    if args.once:
+        with open(args.once, 'rb') as f:
+            result = analyzer.analyze(f.read(), args.mask_format)
+        protocol_out.write(json.dumps(result) + '\n')
+        protocol_out.flush()
+        return 0
+    serve(analyzer, sys.stdin, protocol_out)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
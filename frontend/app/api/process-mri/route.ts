@@ -1,14 +1,101 @@
 import { NextResponse } from 'next/server'
-import { spawn } from 'child_process'
+import { spawn, ChildProcessWithoutNullStreams } from 'child_process'
 import path from 'path'
-import fs from 'fs'
-import { v4 as uuidv4 } from 'uuid'
+import readline from 'readline'
+
+// One long-lived Python worker (backend/worker.py) per server process. It loads
+// the models once and answers JSON lines tagged with request ids, possibly out
+// of order, so concurrent uploads are pipelined instead of each spawning Python.
+const WORKER_SCRIPT = process.env.PYTHON_WORKER_SCRIPT || path.join(process.cwd(), '..', 'backend', 'worker.py')
+const PYTHON_BIN = process.env.PYTHON_BIN || 'python'
+const REQUEST_TIMEOUT_MS = 60_000
+
+type Pending = {
+  resolve: (result: unknown) => void
+  reject: (error: Error) => void
+  timer: NodeJS.Timeout
+}
+
+let worker: ChildProcessWithoutNullStreams | null = null
+let ready: Promise<void> | null = null
+let nextId = 0
+const pending = new Map<string, Pending>()
+
+function failAll(error: Error) {
+  for (const [id, request] of pending) {
+    clearTimeout(request.timer)
+    request.reject(error)
+    pending.delete(id)
+  }
+}
+
+function startWorker(): Promise<void> {
+  if (worker && ready) return ready
+
+  const child = spawn(PYTHON_BIN, [WORKER_SCRIPT], { cwd: path.dirname(WORKER_SCRIPT) })
+  worker = child
+  child.stderr.on('data', (data) => console.error(`[worker] ${data.toString().trimEnd()}`))
+
+  ready = new Promise((resolve, reject) => {
+    const lines = readline.createInterface({ input: child.stdout })
+    lines.on('line', (line) => {
+      let message
+      try {
+        message = JSON.parse(line)
+      } catch {
+        console.error('Unparseable worker output:', line)
+        return
+      }
+      if (message.event === 'ready') {
+        resolve()
+        return
+      }
+      const request = pending.get(message.id)
+      if (!request) return
+      pending.delete(message.id)
+      clearTimeout(request.timer)
+      if (message.ok) {
+        request.resolve(message.result)
+      } else {
+        request.reject(new Error(message.error))
+      }
+    })
+
+    const stop = (error: Error) => {
+      // Restarted lazily by the next request
+      if (worker === child) {
+        worker = null
+        ready = null
+      }
+      reject(error)
+      failAll(error)
+    }
+    child.on('exit', (code) => stop(new Error(`Python worker exited with code ${code}`)))
+    // Spawn failures (e.g. PYTHON_BIN not found) and broken pipes never reach 'exit'
+    child.on('error', (error) => stop(new Error(`Python worker failed: ${error.message}`)))
+    child.stdin.on('error', (error) => stop(new Error(`Python worker stdin failed: ${error.message}`)))
+  })
+  return ready
+}
+
+async function analyze(image: Buffer) {
+  await startWorker()
+  const id = String(++nextId)
+  return new Promise((resolve, reject) => {
+    const timer = setTimeout(() => {
+      pending.delete(id)
+      reject(new Error('Analysis timed out'))
+    }, REQUEST_TIMEOUT_MS)
+    pending.set(id, { resolve, reject, timer })
+    worker!.stdin.write(JSON.stringify({ id, data: image.toString('base64') }) + '\n')
+  })
+}
 
 export async function POST(request: Request) {
   try {
     const formData = await request.formData()
     const image = formData.get('image') as File
-    
+
     if (!image) {
       return NextResponse.json(
         { error: 'No image provided' },
@@ -16,52 +103,8 @@ export async function POST(request: Request) {
       )
     }
 
-    // Create a unique filename
-    const filename = `${uuidv4()}_${image.name}`
-    const uploadDir = path.join(process.cwd(), 'uploads')
-    const filePath = path.join(uploadDir, filename)
-
-    // Ensure upload directory exists
-    if (!fs.existsSync(uploadDir)) {
-      fs.mkdirSync(uploadDir, { recursive: true })
-    }
-
-    // Write file to disk
     const bytes = await image.arrayBuffer()
-    const buffer = Buffer.from(bytes)
-    fs.writeFileSync(filePath, buffer)
-
-    // Call Python script for analysis
-    const pythonScript = path.join(process.cwd(), 'backend/main.py')
-    
-    const result = await new Promise((resolve, reject) => {
-      const process = spawn('python', [pythonScript, filePath])
-      let output = ''
-      let error = ''
-
-      process.stdout.on('data', (data) => {
-        output += data.toString()
-      })
-
-      process.stderr.on('data', (data) => {
-        error += data.toString()
-      })
-
-      process.on('close', (code) => {
-        if (code !== 0) {
-          reject(new Error(`Python process exited with code ${code}: ${error}`))
-          return
-        }
-        try {
-          resolve(JSON.parse(output))
-        } catch (e) {
-          reject(new Error('Failed to parse Python output'))
-        }
-      })
-    })
-
-    // Clean up uploaded file
-    fs.unlinkSync(filePath)
+    const result = await analyze(Buffer.from(bytes))
 
     return NextResponse.json(result)
 
@@ -72,4 +115,4 @@ export async function POST(request: Request) {
       { status: 500 }
     )
   }
-} 
\ No newline at end of file
+}
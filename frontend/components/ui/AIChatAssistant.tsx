@@ -42,6 +42,8 @@ export const AIChatAssistant = ({ scanDetails }: AIChatAssistantProps) => {
   const handleSend = async () => {
     if (!input.trim()) return
 
+    // Set once the assistant bubble for this reply has been added
+    let replyStarted = false
     try {
       setIsLoading(true)
       setMessages(prev => [...prev, { role: 'user', content: input }])
@@ -51,6 +53,7 @@ export const AIChatAssistant = ({ scanDetails }: AIChatAssistantProps) => {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          'Accept': 'text/event-stream',
         },
         body: JSON.stringify({
           message: input,
@@ -58,19 +61,50 @@ export const AIChatAssistant = ({ scanDetails }: AIChatAssistantProps) => {
         }),
       })
 
-      const data = await response.json()
-      
-      if (data.error) {
-        throw new Error(data.error)
+      if (!response.ok || !response.body) {
+        const data = await response.json()
+        throw new Error(data.error || `Chat request failed (${response.status})`)
+      }
+
+      // Show the reply as it streams in: one server-sent event per token
+      setMessages(prev => [...prev, { role: 'assistant', content: '' }])
+      replyStarted = true
+      const appendToReply = (text: string) => {
+        setMessages(prev => {
+          const last = prev[prev.length - 1]
+          return [...prev.slice(0, -1), { ...last, content: last.content + text }]
+        })
       }
 
-      setMessages(prev => [...prev, { role: 'assistant', content: data.response }])
+      const reader = response.body.getReader()
+      const decoder = new TextDecoder()
+      let buffer = ''
+      while (true) {
+        const { done, value } = await reader.read()
+        if (done) break
+        buffer += decoder.decode(value, { stream: true })
+        const events = buffer.split('\n\n')
+        buffer = events.pop() ?? ''
+        for (const event of events) {
+          const type = event.match(/^event: (.*)$/m)?.[1]
+          const data = event.match(/^data: (.*)$/m)?.[1]
+          if (!data) continue
+          const payload = JSON.parse(data)
+          if (type === 'token') {
+            appendToReply(payload.text)
+          } else if (type === 'error') {
+            throw new Error(payload.error)
+          }
+        }
+      }
     } catch (error) {
       console.error('Error sending message:', error)
-      setMessages(prev => [...prev, { 
-        role: 'assistant', 
-        content: 'Sorry, I encountered an error. Please try again.' 
-      }])
+      const errorMessage: Message = {
+        role: 'assistant',
+        content: 'Sorry, I encountered an error. Please try again.'
+      }
+      // Replace the (possibly empty) streaming bubble rather than leaving it above the error
+      setMessages(prev => replyStarted ? [...prev.slice(0, -1), errorMessage] : [...prev, errorMessage])
     } finally {
       setIsLoading(false)
     }
@@ -1,20 +1,164 @@
-from fastapi import FastAPI, File, UploadFile
+from fastapi import FastAPI, File, Request, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import os
 import numpy as np
-from PIL import Image
-import tensorflow as tf
-from tensorflow.keras.utils import get_custom_objects
-import tensorflow.keras.backend as K
-import io
 import sys
+import time
+
+# Share the inference helpers that live alongside the Flask backend
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend')
+sys.path.insert(0, BACKEND_DIR)
+
+from inference import SEGMENTATION_INPUT_SHAPE
+from runtime import load_runner
+from registry import ModelRegistry
+from autotune import DEFAULT_PROFILE_PATH, TUNING_TARGETS, load_profile
+from preprocessing import StageTimer, prepare
+from mask_encoding import encode_mask, negotiate_format
+from cascade import CascadePolicy
+from volumes import VOLUME_EXTENSIONS, analyze_upload, is_volume_name
+from metrics import CONTENT_TYPE, Registry, observe_stages
+
+# 'keras' or 'tflite' (files written by backend/export_models.py)
+INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'keras').lower()
+TFLITE_QUANTIZATION = os.getenv('TFLITE_QUANTIZATION', 'none').lower()
+
+# Thread pools and worker count measured by backend/autotune.py; explicit env vars still win
+TUNING_PROFILE = os.getenv('TUNING_PROFILE', DEFAULT_PROFILE_PATH)
+TUNING_TARGET = os.getenv('TUNING_TARGET', 'latency').lower()
+if TUNING_TARGET not in TUNING_TARGETS:
+    print(f"Unknown TUNING_TARGET {TUNING_TARGET!r}, falling back to 'latency'")
+    TUNING_TARGET = 'latency'
+tuning = load_profile(TUNING_PROFILE, TUNING_TARGET, backend=INFERENCE_BACKEND)
+INTRA_OP_THREADS = int(os.getenv('INTRA_OP_THREADS', tuning.get('intra_op_threads') or 0))
+INTER_OP_THREADS = int(os.getenv('INTER_OP_THREADS', tuning.get('inter_op_threads') or 0))
+
+# Classify first and skip segmentation for confident 'No Tumour' scans
+CASCADE_MODE = os.getenv('CASCADE_MODE', '0') == '1'
+CASCADE_THRESHOLD = float(os.getenv('CASCADE_THRESHOLD', '0.9'))
+
+# Inference runs on a dedicated thread pool so the event loop stays responsive.
+# Admission is bounded: past MAX_PENDING_REQUESTS in flight, new scans get a 503
+# with Retry-After instead of queueing without limit.
+INFERENCE_WORKERS = int(os.getenv('INFERENCE_WORKERS', tuning.get('inference_workers') or 2))
+MAX_PENDING_REQUESTS = int(os.getenv('MAX_PENDING_REQUESTS', '16'))
+REQUEST_TIMEOUT_S = float(os.getenv('REQUEST_TIMEOUT_S', '30'))
+RETRY_AFTER_S = int(os.getenv('RETRY_AFTER_S', '2'))
+VOLUME_BATCH_SIZE = int(os.getenv('VOLUME_BATCH_SIZE', '16'))
+
+# The same model files as the Flask backend, whatever the working directory
+MODELS_DIR = os.path.join(BACKEND_DIR, 'models')
+MODELS_RETRY_AFTER_S = 5
+
+# Models load (TensorFlow import included) and warm up on a background thread once the
+# module is imported, so /healthz answers straight away and /readyz once both are warm
+model_registry = ModelRegistry(
+    lambda name, path: load_runner(INFERENCE_BACKEND, name, path, TFLITE_QUANTIZATION,
+                                   num_threads=INTRA_OP_THREADS or None, inter_op_threads=INTER_OP_THREADS or None)
+)
+model_registry.register('segmentation', os.path.join(MODELS_DIR, 'new_segmentation_model.h5'))
+model_registry.register('classification', os.path.join(MODELS_DIR, 'new_classification_model.h5'))
+model_registry.start()
+
+inference_executor = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix='inference')
+# Only read and written on the event loop thread, so no lock is needed
+pending_requests = 0
+rejected_requests = 0
+timed_out_requests = 0
 
 app = FastAPI()
 
+# Prometheus metrics, served as text on /metrics
+metrics = Registry(prefix='mri_service_')
+stage_seconds = metrics.histogram('stage_seconds', 'Time spent in each inference stage.', ('endpoint', 'stage'))
+request_seconds = metrics.histogram('request_seconds', 'HTTP request latency.', ('endpoint',))
+requests_total = metrics.counter('requests_total', 'HTTP requests handled.', ('endpoint', 'method', 'status'))
+metrics.gauge('pending_requests', 'Scans admitted and not yet finished.', lambda: pending_requests)
+metrics.callback_counter('rejected_requests_total', 'Scans refused with 503.', lambda: rejected_requests)
+metrics.callback_counter('timed_out_requests_total', 'Scans answered with 504.', lambda: timed_out_requests)
+metrics.callback_counter('cascade_segmentation_skipped_total', 'Scans whose segmentation the cascade skipped.',
+                         lambda: cascade.stats()['segmentation_skipped'])
+metrics.gauge('models_ready', '1 once both models are loaded and warmed up.', lambda: int(model_registry.ready()))
+metrics.gauge('model_load_seconds', 'Time to load the serving version of each model.', lambda: {
+    name: model['load_seconds'] for name, model in model_registry.status().items() if model['load_seconds'] is not None
+}, labelname='model')
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    # Label by route template, not raw path, to keep label cardinality bounded
+    route = request.scope.get('route')
+    endpoint = route.path if route is not None else 'unmatched'
+    requests_total.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    request_seconds.observe(time.perf_counter() - started, endpoint=endpoint)
+    return response
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return Response(metrics.render(), media_type=CONTENT_TYPE)
+
 # Add a root endpoint
 @app.get("/")
 async def root():
-    return {"message": "Brain Tumor Detection API"}
+    return {
+        "message": "Brain Tumor Detection API",
+        "ready": model_registry.ready(),
+        "inference": {
+            "workers": INFERENCE_WORKERS,
+            "pending": pending_requests,
+            "max_pending": MAX_PENDING_REQUESTS,
+            "rejected": rejected_requests,
+            "timed_out": timed_out_requests
+        },
+        "cascade": cascade.stats(),
+        "tuning": {
+            "target": TUNING_TARGET,
+            "profile": TUNING_PROFILE if tuning else None,
+            "intra_op_threads": INTRA_OP_THREADS,
+            "inter_op_threads": INTER_OP_THREADS
+        }
+    }
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up, whether or not the models are loaded yet."""
+    return {"status": "alive"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: 200 once both models are loaded and warmed up, 503 until then."""
+    ready = model_registry.ready()
+    return JSONResponse(status_code=200 if ready else 503, content={"ready": ready, "models": model_registry.status()})
+
+@app.get("/models")
+async def models():
+    return model_registry.status()
+
+@app.post("/models/{name}/reload")
+async def reload_model(name: str, request: Request):
+    """Hot-swap a model from disk: ``{"path": "<file in backend/models/>"}``, default the configured file.
+
+    The new version is warmed up before it is swapped in; scans already running finish on the old one.
+    """
+    if name not in model_registry.status():
+        return JSONResponse(status_code=404, content={"status": "error", "message": f"Unknown model {name!r}"})
+    try:
+        body = await request.json()
+    except ValueError:
+        body = {}
+    path = None
+    if isinstance(body, dict) and body.get('path'):
+        path = os.path.realpath(os.path.join(MODELS_DIR, body['path']))
+        if os.path.dirname(path) != os.path.realpath(MODELS_DIR) or not os.path.isfile(path):
+            return JSONResponse(status_code=400, content={
+                "status": "error", "message": "path must name a file in the models directory"
+            })
+    model_registry.swap(name, path)
+    return JSONResponse(status_code=202, content=model_registry.status()[name])
 
 # Configure CORS
 app.add_middleware(
@@ -25,72 +169,165 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Define custom metrics and loss functions
-def dice_coefficient(y_true, y_pred, smooth=1e-6):
-    y_true_f = K.flatten(y_true)
-    y_pred_f = K.flatten(y_pred)
-    intersection = K.sum(y_true_f * y_pred_f)
-    return (2. * intersection + smooth) / (K.sum(y_true_f) + K.sum(y_pred_f) + smooth)
-
-def dice_loss(y_true, y_pred):
-    return 1 - dice_coefficient(y_true, y_pred)
-
-def bce_dice_loss(y_true, y_pred):
-    return K.binary_crossentropy(y_true, y_pred) + dice_loss(y_true, y_pred)
-
-def iou_metric(y_true, y_pred, smooth=1e-6):
-    intersection = K.sum(K.abs(y_true * y_pred))
-    union = K.sum(y_true) + K.sum(y_pred) - intersection
-    return (intersection + smooth) / (union + smooth)
-
-# Register custom objects
-custom_objects = {
-    'bce_dice_loss': bce_dice_loss,
-    'dice_loss': dice_loss,
-    'dice_coefficient': dice_coefficient,
-    'iou_metric': iou_metric
-}
-
-# Load the pre-trained models
-try:
-    with tf.keras.utils.custom_object_scope(custom_objects):
-        segmentation_model = tf.keras.models.load_model('models/new_segmentation_model.h5')
-        classification_model = tf.keras.models.load_model('models/new_classification_model.h5')
-    print("Models loaded successfully")
-except Exception as e:
-    print(f"Error loading models: {e}")
-
 # Class names for classification
 class_names = ['Glioma', 'Meningioma', 'Pituitary', 'No Tumour']
+cascade = CascadePolicy(class_names, enabled=CASCADE_MODE, threshold=CASCADE_THRESHOLD)
+
+def run_inference(contents, mask_format, timer, submitted):
+    # Runs on an inference worker thread, including the (CPU-bound) mask encoding
+    timer.timings['queue_wait'] = round((time.perf_counter() - submitted) * 1000.0, 3)
+    # Taken once, so a hot swap midway can't mix model versions within one scan
+    segmentation_runner = model_registry.get('segmentation')
+    classification_runner = model_registry.get('classification')
+    prepared = prepare(contents, timer)
+    with timer.stage('classification_predict'):
+        classification = classification_runner(prepared.classification[None])
+    segmented = cascade.needs_segmentation(classification[0])
+    cascade.record(segmented)
+    if segmented:
+        with timer.stage('segmentation_predict'):
+            segmentation = segmentation_runner(prepared.segmentation[None])
+    else:
+        segmentation = np.zeros((1,) + SEGMENTATION_INPUT_SHAPE, dtype=np.float32)
+    stages = cascade.stages(segmented)
+    with timer.stage('mask_encode'):
+        if mask_format == 'list':
+            return segmentation.tolist(), classification, stages
+        return encode_mask(segmentation[0], mask_format), classification, stages
+
+def run_volume_inference(stream, filename, mask_format):
+    # Slices are streamed through the models in batches; only the encoded masks accumulate
+    slices = []
+    for item in analyze_upload(stream, filename, model_registry.get('segmentation'), model_registry.get('classification'),
+                               class_names, VOLUME_BATCH_SIZE):
+        if item.get('done'):
+            item.pop('done')
+            return slices, item
+        item['segmentation'] = encode_mask(item.pop('mask'), mask_format)
+        slices.append(item)
+
+def models_unavailable():
+    """A 503 response while the models are loading or failed to load, otherwise None."""
+    if model_registry.ready():
+        return None
+    failed = model_registry.failed()
+    if failed:
+        message = 'Models failed to load: ' + '; '.join(f"{name}: {error}" for name, error in failed.items())
+        return JSONResponse(status_code=503, content={"status": "error", "message": message})
+    return JSONResponse(
+        status_code=503,
+        content={"status": "error", "message": "Models are still loading, please retry shortly"},
+        headers={"Retry-After": str(MODELS_RETRY_AFTER_S)}
+    )
+
+def _release_slot(_):
+    global pending_requests
+    pending_requests -= 1
 
 @app.post("/process-mri/")
-async def process_mri(file: UploadFile = File(...)):
+async def process_mri(request: Request, file: UploadFile = File(...)):
+    global pending_requests, rejected_requests, timed_out_requests
     try:
+        # Nested float list by default; ?mask_format=rle|bits|polygons|png for compact masks
+        try:
+            mask_format = negotiate_format(
+                request.query_params.get('mask_format'), request.headers.get('accept'), 'list'
+            )
+        except ValueError as e:
+            return JSONResponse(status_code=400, content={"status": "error", "message": str(e)})
+
         # Read image
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents)).convert('L')  # Convert to grayscale
-        
-        # Preprocess image for segmentation
-        image = image.resize((200, 200)).convert('L')
-        image_array = np.array(image) / 255.0
-        image_array = np.expand_dims(image_array, axis=(0, -1))
-        
-        # Perform segmentation
-        segmentation = segmentation_model.predict(image_array)
-        
-        # Preprocess image for classification
-        image = image.resize((200, 200)).convert('RGB')
-        image_array = np.array(image) / 255.0
-        image_array = np.expand_dims(image_array, axis=0)
-        
-        # Perform classification
-        classification = classification_model.predict(image_array)
+        started = time.perf_counter()
+        timer = StageTimer()
+        with timer.stage('read'):
+            contents = await file.read()
+
+        unavailable = models_unavailable()
+        if unavailable is not None:
+            return unavailable
+
+        if pending_requests >= MAX_PENDING_REQUESTS:
+            rejected_requests += 1
+            return JSONResponse(
+                status_code=503,
+                content={"status": "error", "message": "Server busy, please retry"},
+                headers={"Retry-After": str(RETRY_AFTER_S)}
+            )
+
+        # The slot is released when inference actually finishes, not when the
+        # request gives up waiting, so timed-out work still counts against the bound
+        pending_requests += 1
+        future = asyncio.get_running_loop().run_in_executor(
+            inference_executor, run_inference, contents, mask_format, timer, time.perf_counter()
+        )
+        future.add_done_callback(_release_slot)
+        try:
+            segmentation, classification, stages = await asyncio.wait_for(asyncio.shield(future), REQUEST_TIMEOUT_S)
+        except asyncio.TimeoutError:
+            timed_out_requests += 1
+            return JSONResponse(
+                status_code=504,
+                content={"status": "error", "message": f"Inference timed out after {REQUEST_TIMEOUT_S}s"},
+                headers={"Retry-After": str(RETRY_AFTER_S)}
+            )
+
         classification_label = np.argmax(classification, axis=1)[0]
-        
+        timings = timer.as_dict()
+        timings['total'] = round((time.perf_counter() - started) * 1000.0, 3)
+        observe_stages(stage_seconds, timings, endpoint='process_mri')
+
+        return {
+            "status": "success",
+            "segmentation": segmentation,
+            "mask_format": mask_format,
+            "classification": class_names[classification_label],
+            "stages": stages,
+            "timings": timings
+        }
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+@app.post("/process-volume/")
+async def process_volume(request: Request, file: UploadFile = File(...)):
+    """Per-slice results and volume aggregates for a NIfTI volume or DICOM series (zip)."""
+    global pending_requests, rejected_requests, timed_out_requests
+    try:
+        if not is_volume_name(file.filename or ''):
+            return JSONResponse(status_code=400, content={
+                "status": "error", "message": f"Expected a volume file, one of {VOLUME_EXTENSIONS}"
+            })
+        try:
+            mask_format = negotiate_format(
+                request.query_params.get('mask_format'), request.headers.get('accept'), 'rle'
+            )
+        except ValueError as e:
+            return JSONResponse(status_code=400, content={"status": "error", "message": str(e)})
+
+        unavailable = models_unavailable()
+        if unavailable is not None:
+            return unavailable
+
+        if pending_requests >= MAX_PENDING_REQUESTS:
+            rejected_requests += 1
+            return JSONResponse(
+                status_code=503,
+                content={"status": "error", "message": "Server busy, please retry"},
+                headers={"Retry-After": str(RETRY_AFTER_S)}
+            )
+
+        # No REQUEST_TIMEOUT_S here: a few hundred slices legitimately take longer than one scan
+        pending_requests += 1
+        future = asyncio.get_running_loop().run_in_executor(
+            inference_executor, run_volume_inference, file.file, file.filename, mask_format
+        )
+        future.add_done_callback(_release_slot)
+        slices, volume = await future
+        observe_stages(stage_seconds, volume['timings_ms'], endpoint='process_volume')
         return {
             "status": "success",
-            "segmentation": segmentation.tolist(),
-            "classification": class_names[classification_label]
+            "mask_format": mask_format,
+            "volume": volume,
+            "slices": slices
         }
     except Exception as e:
         return {"status": "error", "message": str(e)}